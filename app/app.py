@@ -1,42 +1,52 @@
-from task_registry import TaskRegistry
+from task_registry import TaskRegistry, get_submitter
+from batch import BatchManager, create_router
+from result_cache import create_download_router, result_cache
+from preview import preview_renderer
+from fastapi import FastAPI
+from typing import List
+import multiprocessing
 import gradio as gr
-import fitz  # PyMuPDF库，用于PDF预览
+import uvicorn
 
 # 加载配置
-from config import QUEUE_SIZE
+from config import EVENT_REFRESH_INTERVAL, FULL_REFRESH_INTERVAL, PAGE_SIZE, PREVIEW_CONCURRENCY
 
-# Gradio 服务端内存中的任务ID存储（简单实现，应考虑持久化）
-task_registry = TaskRegistry(maxlen=QUEUE_SIZE)
+# 任务注册表保存在 Redis 中，多个 Web App 实例共享
+task_registry = TaskRegistry(page_size=PAGE_SIZE)
+batch_manager = BatchManager(task_registry)
 
-def preview_pdf(tmp_path):
-  """预览PDF文件的前五页"""
-  if tmp_path is None:
-    return None, "请上传PDF文件"
-  try:
-    doc = fitz.open(tmp_path)  # 打开PDF文件
-    total_pages = doc.page_count  # 获取总页数
-    num_pages = min(5, total_pages)  # 只显示前五页
-    # 保存预览图片
-    preview_images = []
-    for page_num in range(num_pages):
-      page = doc[page_num]
-      pix = page.get_pixmap(matrix=fitz.Matrix(1.5, 1.5))  # 1.5倍缩放以提高清晰度
-      preview_images.append(pix.pil_image())  # requires pymupdf>=1.25.2
-    doc.close()
-    return preview_images, f"PDF预览成功，显示前{num_pages}页，共{total_pages}页"
-  except Exception as e:
-    return None, f"PDF预览失败: {str(e)}"
-
-def submit_convert_task(tmp_path: str, target_lang: str = None):
+def submit_convert_task(tmp_path: str, target_lang: List[str] = None, submitter: str = None, force: bool = False):
   """提交转换任务"""
   if tmp_path is None:
     return "请上传PDF文件"
   try:
-    task_id = task_registry.register_task(tmp_path, target_lang)
+    task_id = task_registry.register_task(tmp_path, target_lang, submitter, force)
     return f"提交成功, 任务ID: {task_id}"
   except Exception as e:
     return f"提交任务失败: {str(e)}"
 
+def submit_convert(f, request: gr.Request):
+  return submit_convert_task(f.name, None, get_submitter(request))
+
+def submit_translate(f, l, force, request: gr.Request):
+  if not l:
+    return "请选择目标语言"
+  return submit_convert_task(f.name, l, get_submitter(request), force)
+
+def refresh_all_tasks(page, request: gr.Request):
+  return task_registry.update_all_tasks(get_submitter(request), page)
+
+def refresh_changed_tasks(page, rendered, request: gr.Request):
+  return task_registry.update_changed_tasks(get_submitter(request), page, rendered)
+
+def make_remove_row(i: int):
+  """第 i 行删除按钮的处理函数，按当前会话渲染的内容找到该行的任务"""
+  def remove_row(rendered, request: gr.Request):
+    task_id = task_registry.rendered_task_id(rendered, i)
+    if task_id is not None:
+      task_registry.remove_task(task_id, get_submitter(request))
+  return remove_row
+
 with gr.Blocks() as web:
   gr.Markdown("# PDF翻译工具")
   
@@ -50,8 +60,13 @@ with gr.Blocks() as web:
         with gr.Column(scale=1):
           target_lang = gr.Dropdown(
             choices=["中文", "English", "日本語", "한국어"],
-            value="中文",
-            label="选择目标语言"
+            value=["中文"],
+            multiselect=True,
+            label="选择目标语言 (可多选，只转换一次再同时翻译为各种语言)"
+          )
+          force_translate = gr.Checkbox(
+            value=False,
+            label="完整重新翻译 (默认只翻译与同一文档上一版本相比新增或修改过的段落)"
           )
           with gr.Row():
             convert_btn = gr.Button("转换为Markdown")
@@ -75,58 +90,104 @@ with gr.Blocks() as web:
         gr.Button(value="", variant="huggingface", interactive=False, size="sm")
       task_items = []
       
-      for i in range(QUEUE_SIZE):
+      for i in range(PAGE_SIZE):
         with gr.Row(show_progress=True, equal_height=True, variant="panel") as row:  # 默认隐藏
           task_items.extend([
             gr.HighlightedText(visible=False, label="", container=True, scale=6),
             gr.Button(visible=False, scale=2, size="sm"),
             gr.Button(visible=False, size="sm"),
-            gr.DownloadButton(label="下载结果", visible=False, variant="primary", size="sm"),
+            gr.Button(value="下载结果", visible=False, variant="primary", size="sm"),
             gr.Button(value="删除任务", visible=False, variant="stop", size="sm"),
           ])
       
-      gr.Button("手动刷新(默认每隔 5 秒刷新一次)").click(
-        fn=task_registry.update_all_tasks,
-        outputs=task_items,
+      # 各行已渲染的 (任务ID, 事件版本号) 和当前页码，每个会话各自保存
+      rendered_tasks = gr.State(None)
+      current_page = gr.State(0)
+
+      with gr.Row(equal_height=True):
+        prev_btn = gr.Button("上一页", size="sm")
+        page_info = gr.Markdown()
+        next_btn = gr.Button("下一页", size="sm")
+
+      task_outputs = task_items + [rendered_tasks, current_page, page_info]
+
+      gr.Button(f"手动刷新(默认每隔 {FULL_REFRESH_INTERVAL} 秒全部刷新一次)").click(
+        fn=refresh_all_tasks,
+        inputs=current_page,
+        outputs=task_outputs,
+      )
+
+      # 翻页后刷新，页码超出范围时由 refresh_all_tasks 修正
+      prev_btn.click(fn=lambda page: max(page - 1, 0), inputs=current_page, outputs=current_page).then(
+        fn=refresh_all_tasks,
+        inputs=current_page,
+        outputs=task_outputs,
+      )
+      next_btn.click(fn=lambda page: page + 1, inputs=current_page, outputs=current_page).then(
+        fn=refresh_all_tasks,
+        inputs=current_page,
+        outputs=task_outputs,
       )
   
-  # 自动刷新
-  t = gr.Timer(5)
-  t.tick(
-    fn=task_registry.update_all_tasks,
-    outputs=task_items,
+  # Worker 推送的进度事件到达后只刷新受影响的行
+  gr.Timer(EVENT_REFRESH_INTERVAL).tick(
+    fn=refresh_changed_tasks,
+    inputs=[current_page, rendered_tasks],
+    outputs=task_outputs,
+    show_progress="hidden",
+  )
+
+  # 定期全部刷新，兜底处理丢失的事件和其他实例提交的任务
+  gr.Timer(FULL_REFRESH_INTERVAL).tick(
+    fn=refresh_all_tasks,
+    inputs=current_page,
+    outputs=task_outputs,
   )
 
-  for i in range(QUEUE_SIZE):
+  for i in range(PAGE_SIZE):
     del_btn: gr.Button = task_items[i * 5 + 4]
     del_btn.click(
       # 删除任务
-      fn=lambda x=i: task_registry.remove_task(x),
+      fn=make_remove_row(i),
+      inputs=rendered_tasks,
     ).then(
       # 删除任务后刷新任务队列显示的组件
-      fn=task_registry.update_all_tasks,
-      outputs=task_items,
+      fn=refresh_all_tasks,
+      inputs=current_page,
+      outputs=task_outputs,
     )
 
   # 提交任务逻辑
   convert_btn.click(
-    fn=lambda f: submit_convert_task(f.name),
+    fn=submit_convert,
     inputs=gr_file,
     outputs=submit_status
   )
   
   translate_btn.click(
-    fn=lambda f, l: submit_convert_task(f.name, l),
-    inputs=[gr_file, target_lang],
+    fn=submit_translate,
+    inputs=[gr_file, target_lang, force_translate],
     outputs=submit_status
   )
 
-  # 上传文件后自动触发预览
+  # 上传文件后自动触发预览，渲染在后台进程池中进行，逐页返回
   gr_file.change(
-    fn=preview_pdf,
+    fn=preview_renderer.preview,
     inputs=[gr_file],
-    outputs=[preview_gallery, preview_status]
+    outputs=[preview_gallery, preview_status],
+    concurrency_limit=PREVIEW_CONCURRENCY,
   )
 
+def create_app() -> FastAPI:
+  """批量提交和结果下载的 HTTP 接口与界面共用同一个端口
+
+  先注册接口的路由再把 Gradio 界面挂载到根路径，服务启动前所有路由就已就绪。
+  """
+  server = FastAPI()
+  server.include_router(create_router(batch_manager))
+  server.include_router(create_download_router(result_cache, task_registry.result_filename))
+  return gr.mount_gradio_app(server, web, path="/")
+
 if __name__ == "__main__":
-  web.launch(share=True, server_name="0.0.0.0") 
\ No newline at end of file
+  multiprocessing.freeze_support()  # 打包后的程序需要支持启动预览渲染子进程
+  uvicorn.run(create_app(), host="0.0.0.0", port=7860) 
\ No newline at end of file
@@ -0,0 +1,303 @@
+"""批量提交: 一次提交若干目录、zip 或 PDF 中的所有 PDF，按批次查询总进度并打包下载全部结果
+
+HTTP 接口挂载在 Web App 上 (见 create_router)，也可以在 Web App 所在目录下作为命令行工具直接通过 Redis 提交:
+  python batch.py submit papers/ more.zip --lang 中文 日本語 --wait
+  python batch.py status <batch_id>
+  python batch.py download <batch_id> -o results.zip
+"""
+from celery import states
+from collections import Counter
+from fastapi import APIRouter, File, Form, HTTPException, Request, UploadFile
+from fastapi.responses import FileResponse
+from typing import Dict, List
+import argparse
+import getpass
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+import zipfile
+
+from blob_store import blob_store
+from result_cache import result_cache
+from task_registry import INFLIGHT_MAX_AGE, TaskRegistry, get_submitter, lang_list
+from task_status import take_snapshot
+
+# 配置和 redis 接口
+from config import RESULT_DIR, r
+
+# 批次的保存时间 (秒)，与 Celery 结果的保存时间一致，之后已无法查询批次中任务的状态
+BATCH_TTL = INFLIGHT_MAX_AGE
+
+
+def unique_path(directory: str, name: str, used: set) -> str:
+  """在 directory 中为 name 选一个本批次内不重名的路径，各任务的结果以此文件名区分"""
+  stem, ext = os.path.splitext(name)
+  candidate, i = name, 1
+  while candidate in used:
+    candidate = f"{stem}_{i}{ext}"
+    i += 1
+  used.add(candidate)
+  return os.path.join(directory, candidate)
+
+
+def collect_pdfs(sources: List[str], work_dir: str) -> List[str]:
+  """收集若干目录 (含子目录)、zip 和 PDF 中的所有 PDF
+
+  zip 中的 PDF 解压到 work_dir，与已收集的文件重名的 PDF 复制到 work_dir 并加上序号。
+  """
+  used = set()
+  paths = []
+
+  def add(path: str):
+    name = os.path.basename(path)
+    if name in used:
+      target = unique_path(work_dir, name, used)
+      shutil.copyfile(path, target)
+      path = target
+    else:
+      used.add(name)
+    paths.append(path)
+
+  for source in sources:
+    if os.path.isdir(source):
+      for root, dirs, files in os.walk(source):
+        dirs.sort()
+        for name in sorted(files):
+          if name.lower().endswith('.pdf'):
+            add(os.path.join(root, name))
+    elif zipfile.is_zipfile(source):
+      with zipfile.ZipFile(source) as zf:
+        for info in zf.infolist():
+          if info.is_dir() or not info.filename.lower().endswith('.pdf'):
+            continue
+          # 只取文件名，忽略 zip 中的目录结构
+          path = unique_path(work_dir, os.path.basename(info.filename), used)
+          with zf.open(info) as src, open(path, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+          paths.append(path)
+    elif source.lower().endswith('.pdf'):
+      add(source)
+  return paths
+
+
+class BatchManager:
+  """批量提交和查询批次
+
+  批次保存在 Redis 中: `batch:{id}` 记录提交者、目标语言和创建时间，`batch:{id}:tasks` 按提交顺序记录任务 ID，
+  两者在 BATCH_TTL 后过期。删除任务时从所属批次中移除其 ID (见 TaskRegistry.remove_task)。
+  """
+  def __init__(self, registry: TaskRegistry):
+    self.registry = registry
+
+  def submit(
+    self, sources: List[str], target_lang: str | List[str] = None, submitter: str = None, force: bool = False
+  ) -> Dict:
+    """提交 sources 中的所有 PDF，返回批次 ID 和各任务 ID
+    Args:
+      target_lang: 目标语言，可以是多种语言的列表
+      force: 完整重新翻译，不沿用各文档上一版本的译文
+    """
+    work_dir = tempfile.mkdtemp(prefix="batch-")
+    try:
+      paths = collect_pdfs(sources, work_dir)
+      if not paths:
+        raise ValueError("没有找到 PDF 文件")
+      batch_id = uuid.uuid4().hex
+      task_ids = self.registry.register_tasks(paths, target_lang, submitter, batch_id, force)
+      pipe = r.pipeline()
+      pipe.hset(f"batch:{batch_id}", mapping={
+        'submitter': submitter or '',
+        'target_lang': ','.join(lang_list(target_lang)),
+        'created_at': time.time(),
+      })
+      pipe.rpush(f"batch:{batch_id}:tasks", *task_ids)
+      pipe.expire(f"batch:{batch_id}", BATCH_TTL)
+      pipe.expire(f"batch:{batch_id}:tasks", BATCH_TTL)
+      pipe.execute()
+      return {'batch_id': batch_id, 'task_ids': task_ids}
+    finally:
+      shutil.rmtree(work_dir, ignore_errors=True)
+
+  def status(self, batch_id: str) -> Dict | None:
+    """批次的总进度和各任务状态，批次不存在时返回 None"""
+    info = r.hgetall(f"batch:{batch_id}")
+    if not info:
+      return None
+    task_ids = [task_id.decode() for task_id in r.lrange(f"batch:{batch_id}:tasks", 0, -1)]
+    pipe = r.pipeline()
+    for task_id in task_ids:
+      pipe.hget(self.registry.task_key(task_id), 'filename')
+    # 已不在任务注册表中的任务视为已删除，不计入批次
+    registered = [(task_id, filename) for task_id, filename in zip(task_ids, pipe.execute()) if filename is not None]
+    task_ids = [task_id for task_id, _ in registered]
+    filenames = [filename for _, filename in registered]
+    # 一次 MGET 取回所有任务状态
+    tasks = take_snapshot(task_ids, self.registry.active_cache)
+
+    counts = Counter(task['state'] for task in tasks)
+    done = sum(counts[state] for state in states.READY_STATES)
+    return {
+      'batch_id': batch_id,
+      'target_langs': [lang for lang in info[b'target_lang'].decode().split(',') if lang],
+      'created_at': float(info[b'created_at']),
+      'total': len(tasks),
+      'done': done,
+      'finished': done == len(tasks),
+      'progress': round(sum(task['progress'] for task in tasks) / len(tasks)) if tasks else 100,
+      'counts': dict(counts),
+      'tasks': [
+        {
+          'id': task['id'],
+          'filename': filename.decode(),
+          'state': task['state'],
+          'progress': task['progress'],
+          'result': task['result'],
+        }
+        for task, filename in zip(tasks, filenames)
+      ],
+    }
+
+  def build_archive(self, batch_id: str) -> str | None:
+    """把批次中已成功的任务结果打包为一个 zip，返回本地路径，批次不存在或还没有结果时返回 None
+
+    各任务的结果本身就是 zip，直接存储不再压缩，从 Redis 逐块读出写入，不需要把结果放进内存。
+    """
+    status = self.status(batch_id)
+    if status is None:
+      return None
+    results = [
+      task for task in status['tasks']
+      if task['state'] == states.SUCCESS and isinstance(task['result'], str) and blob_store.exists(task['result'])
+    ]
+    if not results:
+      return None
+
+    path = os.path.join(RESULT_DIR, f"batch_{batch_id}.zip")
+    tmp_path = f"{path}.{os.urandom(4).hex()}.tmp"
+    try:
+      with zipfile.ZipFile(tmp_path, 'w') as zf:
+        used = set()
+        for task in results:
+          # 结果以任务 ID 命名，打包时换成上传时的文件名，同名文件加上任务 ID 区分
+          stem = os.path.splitext(task['filename'])[0]
+          arcname = f"{stem}.zip" if f"{stem}.zip" not in used else f"{stem}_{task['id']}.zip"
+          used.add(arcname)
+          info = zipfile.ZipInfo(arcname, date_time=time.localtime()[:6])
+          with zf.open(info, 'w', force_zip64=True) as dst:
+            for chunk in blob_store.iter_chunks(task['result']):
+              dst.write(chunk)
+      os.replace(tmp_path, path)
+    finally:
+      if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    result_cache.evict(keep=path)  # 批次的 zip 与单个任务的结果共用结果目录的大小上限
+    return path
+
+
+def create_router(batches: BatchManager) -> APIRouter:
+  """批量提交的 HTTP 接口
+
+  - POST /batch: 上传若干 PDF 或 zip (表单字段 files，可选的 target_lang 可以重复或用逗号分隔多种语言，
+    可选的 force 为 true 时完整重新翻译)，返回批次 ID
+  - GET /batch/{batch_id}: 批次的总进度和各任务状态
+  - GET /batch/{batch_id}/download: 下载已完成的所有结果
+  """
+  router = APIRouter(prefix="/batch")
+
+  # 普通函数在线程池中执行，不会阻塞界面的事件循环
+  @router.post("")
+  def submit_batch(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    target_lang: List[str] | None = Form(None),
+    force: bool = Form(False),
+  ):
+    upload_dir = tempfile.mkdtemp(prefix="batch-upload-")
+    try:
+      used = set()
+      sources = []
+      for file in files:
+        path = unique_path(upload_dir, os.path.basename(file.filename or "upload.pdf"), used)
+        with open(path, 'wb') as f:
+          shutil.copyfileobj(file.file, f)
+        sources.append(path)
+      langs = [lang.strip() for value in target_lang or [] for lang in value.split(',') if lang.strip()]
+      return batches.submit(sources, langs or None, get_submitter(request), force)
+    except ValueError as e:
+      raise HTTPException(status_code=400, detail=str(e))
+    finally:
+      shutil.rmtree(upload_dir, ignore_errors=True)
+
+  @router.get("/{batch_id}")
+  def batch_status(batch_id: str):
+    status = batches.status(batch_id)
+    if status is None:
+      raise HTTPException(status_code=404, detail="批次不存在")
+    return status
+
+  @router.get("/{batch_id}/download")
+  def download_batch(batch_id: str):
+    path = batches.build_archive(batch_id)
+    if path is None:
+      raise HTTPException(status_code=404, detail="批次不存在或还没有完成的结果")
+    return FileResponse(path, filename=os.path.basename(path), media_type="application/zip")
+
+  return router
+
+
+def main():
+  parser = argparse.ArgumentParser(description="批量提交 PDF 转换任务")
+  subparsers = parser.add_subparsers(dest='command', required=True)
+
+  submit_parser = subparsers.add_parser('submit', help="提交目录、zip 或 PDF 中的所有 PDF")
+  submit_parser.add_argument('sources', nargs='+')
+  submit_parser.add_argument('--lang', nargs='+', default=None, help="一种或多种目标语言，不指定时只转换不翻译")
+  submit_parser.add_argument('--submitter', default=getpass.getuser(), help="提交者，与界面中的登录用户名或 IP 一致时可以在界面中看到这些任务")
+  submit_parser.add_argument('--force', action='store_true', help="完整重新翻译，不沿用各文档上一版本中未变化段落的译文")
+  submit_parser.add_argument('--wait', action='store_true', help="等待所有任务完成")
+
+  status_parser = subparsers.add_parser('status', help="查询批次进度")
+  status_parser.add_argument('batch_id')
+  status_parser.add_argument('--json', action='store_true', help="输出包括各任务状态的完整 JSON")
+
+  download_parser = subparsers.add_parser('download', help="下载批次中已完成的所有结果")
+  download_parser.add_argument('batch_id')
+  download_parser.add_argument('-o', '--output', default=None)
+
+  args = parser.parse_args()
+  batches = BatchManager(TaskRegistry(background=False))
+
+  if args.command == 'submit':
+    batch = batches.submit(args.sources, args.lang, args.submitter, args.force)
+    print(f"已提交 {len(batch['task_ids'])} 个任务，批次 ID: {batch['batch_id']}")
+    if args.wait:
+      while True:
+        status = batches.status(batch['batch_id'])
+        print(f"进度 {status['progress']}%，已完成 {status['done']} / {status['total']}，{status['counts']}")
+        if status['finished']:
+          break
+        time.sleep(5)
+
+  elif args.command == 'status':
+    status = batches.status(args.batch_id)
+    if status is None:
+      parser.exit(1, "批次不存在\n")
+    if args.json:
+      print(json.dumps(status, ensure_ascii=False, indent=2))
+    else:
+      print(f"进度 {status['progress']}%，已完成 {status['done']} / {status['total']}，{status['counts']}")
+
+  elif args.command == 'download':
+    path = batches.build_archive(args.batch_id)
+    if path is None:
+      parser.exit(1, "批次不存在或还没有完成的结果\n")
+    output = args.output or os.path.basename(path)
+    shutil.move(path, output)
+    print(f"已保存到 {output}")
+
+
+if __name__ == "__main__":
+  main()
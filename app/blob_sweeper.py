@@ -0,0 +1,80 @@
+from typing import Callable, Dict, Iterable
+import os
+import threading
+import time
+
+from blob_store import blob_store
+
+# 配置
+from config import STORAGE_SWEEP_GRACE, STORAGE_SWEEP_INTERVAL
+
+
+class BlobSweeper:
+  """定期回收没有任务引用的文件，并统计文件占用的存储空间
+
+  任务引用的文件包括上传的 PDF 以及 Worker 以其文件名为前缀生成的中间结果、分片和最终结果。
+  Web App 重启后丢失的任务不再被引用，其文件会在下一次清理时被回收。
+  """
+  def __init__(
+    self,
+    tracked_files: Callable[[], Iterable[str]],
+    interval: int = STORAGE_SWEEP_INTERVAL,
+    grace: int = STORAGE_SWEEP_GRACE,
+  ):
+    """
+    Args:
+      tracked_files: 返回当前所有任务上传的 PDF 在 blob_store 中的文件名
+      grace: 文件创建后多久才允许被回收，避免回收刚上传、尚未登记的文件
+    """
+    self.tracked_files = tracked_files
+    self.interval = interval
+    self.grace = grace
+    self.stats: Dict[str, int] = {}
+    self.thread = None
+
+  def start(self):
+    if self.thread is None and self.interval > 0:
+      self.thread = threading.Thread(target=self.run, daemon=True)
+      self.thread.start()
+
+  def run(self):
+    while True:
+      try:
+        self.sweep()
+      except Exception as e:
+        print(f"清理文件失败: {str(e)}")
+      time.sleep(self.interval)
+
+  def is_tracked(self, name: str, tracked: set, stems: set) -> bool:
+    if name in tracked:
+      return True
+    # 中间结果和最终结果以 PDF 去掉扩展名后的文件名为前缀，如 a.zip、a.converted.zip、a.shard0.pdf
+    stem = name
+    while '.' in stem:
+      stem = stem.rsplit('.', 1)[0]
+      if stem in stems:
+        return True
+    return False
+
+  def sweep(self) -> Dict[str, int]:
+    """回收一轮无人引用的文件，返回本轮的统计"""
+    tracked = set(self.tracked_files())
+    stems = {os.path.splitext(name)[0] for name in tracked}
+    now = time.time()
+    stats = {'files': 0, 'size': 0, 'stored': 0, 'swept_files': 0, 'swept_bytes': 0}
+    for name, manifest in blob_store.iter_files():
+      if not self.is_tracked(name, tracked, stems) and now - manifest['created'] > self.grace:
+        blob_store.delete(name)
+        stats['swept_files'] += 1
+        stats['swept_bytes'] += manifest['stored']
+        continue
+      stats['files'] += 1
+      stats['size'] += manifest['size']
+      stats['stored'] += manifest['stored']
+    self.stats = stats
+    print(
+      f"文件存储: {stats['files']} 个文件，原始大小 {stats['size'] / 2**20:.1f} MB，"
+      f"实际占用 {stats['stored'] / 2**20:.1f} MB；回收 {stats['swept_files']} 个文件，"
+      f"{stats['swept_bytes'] / 2**20:.1f} MB"
+    )
+    return stats
@@ -1,6 +1,9 @@
 from celery import Celery
-from typing import Dict
-from config import REDIS_URL
+from celery.signals import before_task_publish
+from typing import Dict, List
+import time
+from config import CONVERT_QUEUE, REDIS_URL
+from scheduler import PRIORITY_STEPS
 
 app = Celery(
   'pdf_tasks',
@@ -8,9 +11,22 @@ app = Celery(
   backend=REDIS_URL,
   task_serializer='json',
   accept_content=['json'],
-  result_serializer='json'
+  result_serializer='json',
+  # 按优先级分档投递，Worker 总是先取同一队列中优先级高 (数字小) 的任务，需要和 Worker 保持一致
+  broker_transport_options={'priority_steps': PRIORITY_STEPS},
+  task_routes={
+    'celery_app.convert_pdf_to_markdown': {'queue': CONVERT_QUEUE},
+  },
 )
 
+@before_task_publish.connect
+def stamp_enqueue_time(headers=None, **kwargs):
+  """记录入队时间，Worker 据此统计任务的排队等待时间"""
+  headers.setdefault('enqueued_at', time.time())
+
 @app.task(bind=True)
-def convert_pdf_to_markdown(self, filename: str, target_lang: str = None) -> Dict:
+def convert_pdf_to_markdown(
+  self, filename: str, target_lang: str | List[str] = None, force: bool = False, title: str = None,
+  submitter: str = None,
+) -> Dict:
   pass
\ No newline at end of file
@@ -1,3 +1,4 @@
+import ipaddress
 import os
 from omegaconf import OmegaConf
 import redis
@@ -6,8 +7,34 @@ import redis
 config = OmegaConf.load('config.yaml')
 
 REDIS_URL=f"redis://{config.redis.host}:{config.redis.port}/{config.redis.db}"
-QUEUE_SIZE = int(config.settings.queue_size)
+CONVERT_QUEUE = config.queues.convert
+PAGE_SIZE = int(config.settings.page_size)
+FULL_REFRESH_INTERVAL = int(config.settings.full_refresh_interval)
+EVENT_REFRESH_INTERVAL = float(config.settings.event_refresh_interval)
+TASK_EVENTS_CHANNEL = config.events.channel
+TASK_ABORT_CHANNEL = config.events.abort_channel
+INSPECT_TTL = float(config.settings.inspect_ttl)
+INSPECT_TIMEOUT = float(config.settings.inspect_timeout)
+TRUSTED_PROXIES = [ipaddress.ip_network(str(p), strict=False) for p in config.settings.get('trusted_proxies') or []]
+SHORT_FIRST = config.scheduling.short_first
+SIZE_CLASSES = sorted(int(p) for p in config.scheduling.size_classes)
+MAX_FAIR_PENALTY = int(config.scheduling.max_fair_penalty)
+PREVIEW_PAGES = int(config.preview.pages)
+PREVIEW_WIDTH = int(config.preview.width)
+PREVIEW_CACHE_PAGES = int(config.preview.cache_pages)
+PREVIEW_WORKERS = int(config.preview.workers)
+PREVIEW_CONCURRENCY = int(config.preview.concurrency)
 RESULT_DIR = config.settings.result_dir
+RESULT_CACHE_MAX_SIZE_MB = int(config.settings.result_cache_mb)
+UPLOAD_CONCURRENCY = int(config.batch.upload_concurrency)
+STORAGE_BACKEND = config.storage.backend
+STORAGE_CHUNK_SIZE = int(config.storage.chunk_size_kb) * 1024
+STORAGE_SHARED_DIR = config.storage.shared_dir
+STORAGE_COMPRESSION = config.storage.compression
+STORAGE_COMPRESSION_LEVEL = int(config.storage.compression_level)
+STORAGE_UPLOAD_TTL = int(config.storage.upload_ttl)
+STORAGE_SWEEP_INTERVAL = int(config.storage.sweep_interval)
+STORAGE_SWEEP_GRACE = int(config.storage.sweep_grace)
 
 # 确保临时目录存在
 os.makedirs(RESULT_DIR, exist_ok=True)
@@ -0,0 +1,99 @@
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+import hashlib
+import threading
+import fitz  # PyMuPDF库，用于PDF预览
+
+# 加载配置
+from config import PREVIEW_CACHE_PAGES, PREVIEW_PAGES, PREVIEW_WIDTH, PREVIEW_WORKERS
+
+
+def render_page(path: str, page_num: int, width: int):
+  """在子进程中渲染一页，缩放比例按页面宽度自适应，返回 (总页数, 宽, 高, RGB 像素)"""
+  with fitz.open(path) as doc:
+    page = doc[page_num]
+    zoom = min(max(width / page.rect.width, 0.5), 2.0)
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+    return doc.page_count, pix.width, pix.height, pix.samples
+
+
+def file_hash(path: str) -> str:
+  h = hashlib.sha256()
+  with open(path, 'rb') as f:
+    while chunk := f.read(1024 * 1024):
+      h.update(chunk)
+  return h.hexdigest()
+
+
+class PreviewRenderer:
+  """PDF 预览渲染
+
+  PyMuPDF 不支持多线程，页面在进程池中渲染，不占用 Gradio 的请求线程。
+  渲染结果按 (文件哈希, 页码) 缓存并按 LRU 淘汰，重复上传的文件可以直接得到预览。
+  """
+  def __init__(self, pages: int = PREVIEW_PAGES, width: int = PREVIEW_WIDTH,
+               cache_pages: int = PREVIEW_CACHE_PAGES, workers: int = PREVIEW_WORKERS):
+    self.pages = pages
+    self.width = width
+    self.cache_pages = cache_pages
+    self.workers = workers
+    self.pool = None
+    self.cache = OrderedDict()  # (文件哈希, 页码) -> (总页数, 图片)
+    self.lock = threading.Lock()
+
+  def get_pool(self) -> ProcessPoolExecutor:
+    # 延迟创建进程池，避免在导入时就启动子进程
+    with self.lock:
+      if self.pool is None:
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+      return self.pool
+
+  def cache_get(self, key):
+    with self.lock:
+      if key in self.cache:
+        self.cache.move_to_end(key)
+        return self.cache[key]
+      return None
+
+  def cache_put(self, key, value):
+    with self.lock:
+      self.cache[key] = value
+      self.cache.move_to_end(key)
+      while len(self.cache) > self.cache_pages:
+        self.cache.popitem(last=False)
+
+  def submit(self, path: str, digest: str, page_num: int):
+    """提交一页的渲染，返回一个取得 (总页数, 图片) 的函数"""
+    cached = self.cache_get((digest, page_num))
+    if cached is not None:
+      return lambda: cached
+    future = self.get_pool().submit(render_page, path, page_num, self.width)
+    def result():
+      page_count, width, height, samples = future.result()
+      value = (page_count, Image.frombytes("RGB", (width, height), samples))
+      self.cache_put((digest, page_num), value)
+      return value
+    return result
+
+  def preview(self, tmp_path):
+    """先渲染并返回第一页，其余页并行渲染后按顺序逐页追加"""
+    if tmp_path is None:
+      yield None, "请上传PDF文件"
+      return
+    try:
+      digest = file_hash(tmp_path)
+      total_pages, first = self.submit(tmp_path, digest, 0)()
+      images = [first]
+      num_pages = min(self.pages, total_pages)
+      yield images, f"正在加载预览，共{total_pages}页"
+      pending = [self.submit(tmp_path, digest, page_num) for page_num in range(1, num_pages)]
+      for result in pending:
+        images.append(result()[1])
+        yield images, f"正在加载预览，共{total_pages}页"
+      yield images, f"PDF预览成功，显示前{num_pages}页，共{total_pages}页"
+    except Exception as e:
+      yield None, f"PDF预览失败: {str(e)}"
+
+
+preview_renderer = PreviewRenderer()
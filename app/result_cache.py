@@ -0,0 +1,122 @@
+from celery import states
+from celery.result import AsyncResult
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse, StreamingResponse
+from typing import Callable, Iterator
+from urllib.parse import quote
+import os
+import threading
+
+from blob_store import blob_store
+from celery_app import app
+
+# 配置
+from config import RESULT_CACHE_MAX_SIZE_MB, RESULT_DIR
+
+
+class ResultCache:
+  """任务结果的本地磁盘缓存，只在用户点击下载时才从 Redis 取回结果
+
+  未缓存的结果边从 Redis 读取边发送给浏览器，同时写入临时文件，下载完成后重命名为缓存文件。
+  文件的 mtime 作为最近访问时间，目录总大小超出上限时淘汰最久未访问的文件，
+  批量下载生成的 zip 也放在同一目录中，一并受大小限制。
+  """
+  def __init__(self, directory: str = RESULT_DIR, max_size_mb: int = RESULT_CACHE_MAX_SIZE_MB):
+    self.directory = directory
+    self.max_size = max_size_mb * 1024 * 1024
+    self.lock = threading.Lock()  # 避免多个下载同时淘汰
+    os.makedirs(self.directory, exist_ok=True)
+
+  def path(self, name: str) -> str:
+    return os.path.join(self.directory, name)
+
+  def get(self, name: str) -> str | None:
+    """命中时刷新访问时间并返回本地路径"""
+    path = self.path(name)
+    try:
+      os.utime(path)
+      return path
+    except FileNotFoundError:
+      return None
+
+  def contains(self, name: str) -> bool:
+    return os.path.exists(self.path(name))
+
+  def stream(self, name: str) -> Iterator[bytes]:
+    """逐块读取 Redis 中的结果，同时写入缓存；中途断开时丢弃不完整的临时文件"""
+    path = self.path(name)
+    tmp_path = f"{path}.{os.urandom(4).hex()}.tmp"
+    try:
+      with open(tmp_path, 'wb') as f:
+        for chunk in blob_store.iter_chunks(name):
+          f.write(chunk)
+          yield chunk
+      os.replace(tmp_path, path)
+    finally:
+      if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    self.evict()
+
+  def remove(self, name: str):
+    try:
+      os.remove(self.path(name))
+    except FileNotFoundError:
+      pass
+
+  def evict(self, keep: str = None):
+    """总大小超出上限时按最近访问时间淘汰文件，正在写入的临时文件不计入
+    Args:
+      keep: 即将发送的文件的路径，不淘汰
+    """
+    with self.lock:
+      entries = []
+      total = 0
+      for entry in os.scandir(self.directory):
+        if not entry.is_file() or entry.name.endswith('.tmp'):
+          continue
+        stat = entry.stat()
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total += stat.st_size
+      for _, size, path in sorted(entries):
+        if total <= self.max_size:
+          break
+        if path == keep:
+          continue
+        try:
+          os.remove(path)
+        except FileNotFoundError:
+          pass
+        total -= size
+
+
+result_cache = ResultCache()
+
+
+def create_download_router(cache: ResultCache, download_name: Callable[[str], str | None]) -> APIRouter:
+  """结果下载的 HTTP 接口
+
+  - GET /results/{task_id}: 下载任务的结果 zip，任务 ID 不可猜测，只有能看到任务的人才知道下载地址
+  Args:
+    download_name: 按任务 ID 返回下载时使用的文件名，结果本身以任务 ID 命名，返回 None 时沿用结果的文件名
+  """
+  router = APIRouter(prefix="/results")
+
+  @router.get("/{task_id}")
+  def download_result(task_id: str):
+    result = AsyncResult(task_id, app=app)
+    if result.state != states.SUCCESS or not isinstance(result.result, str):
+      raise HTTPException(status_code=404, detail="任务不存在或还没有完成")
+    name = result.result
+    filename = download_name(task_id) or name
+    path = cache.get(name)
+    if path is not None:
+      return FileResponse(path, filename=filename, media_type="application/zip")
+    if not blob_store.exists(name):
+      raise HTTPException(status_code=404, detail="结果已过期")
+    return StreamingResponse(
+      cache.stream(name),
+      media_type="application/zip",
+      headers={'Content-Disposition': f"attachment; filename*=utf-8''{quote(filename)}"},
+    )
+
+  return router
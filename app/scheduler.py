@@ -0,0 +1,36 @@
+import bisect
+import fitz  # PyMuPDF库，用于读取页数
+
+# 加载配置
+from config import MAX_FAIR_PENALTY, SHORT_FIRST, SIZE_CLASSES
+
+# Redis broker 支持的优先级档位，数字越小越先执行
+PRIORITY_STEPS = list(range(10))
+# 相邻页数档位之间相差的优先级
+CLASS_STRIDE = 3
+
+
+def count_pages(file_path: str) -> int:
+  """读取 PDF 页数，读取失败时视为最大的文档"""
+  try:
+    with fitz.open(file_path) as doc:
+      return doc.page_count
+  except Exception:
+    return SIZE_CLASSES[-1] + 1 if SIZE_CLASSES else 0
+
+
+def task_priority(page_count: int, inflight: int) -> int:
+  """根据文档页数和提交者未完成的任务数计算任务优先级
+
+  开启 short_first 时页数越多的档位优先级越低 (每档 +CLASS_STRIDE)；
+  提交者每有一个未完成的任务优先级再降低一级 (最多 max_fair_penalty 级)，
+  使同一档位中各提交者的第 1 个任务先于其他提交者的第 2 个任务执行。
+  惩罚始终小于档位间距，受惩罚的任务不会落入下一档，短文档总是先于长文档。
+  这只是提交时一次性的惩罚，已入队任务的优先级之后不会再调整，也没有真正按提交者轮转:
+  未完成的任务达到惩罚上限后，提交者的其余任务与其他提交者的任务处于同一优先级。
+  结果限制在 Redis broker 支持的 0~9 档之内。
+  """
+  size_class = bisect.bisect_left(SIZE_CLASSES, page_count) if SHORT_FIRST else 0
+  penalty = min(inflight, MAX_FAIR_PENALTY, CLASS_STRIDE - 1)
+  priority = size_class * CLASS_STRIDE + penalty
+  return min(max(priority, PRIORITY_STEPS[0]), PRIORITY_STEPS[-1])
@@ -0,0 +1,115 @@
+from celery import states
+from collections import OrderedDict
+from typing import Dict
+import json
+import threading
+import time
+
+# 配置和 redis 接口
+from config import FULL_REFRESH_INTERVAL, TASK_ABORT_CHANNEL, TASK_EVENTS_CHANNEL, r
+
+# 已结束的任务的事件保留的时间 (秒)，之后界面的定期整体刷新会从结果后端读到最终状态
+READY_EVENT_RETENTION = max(60, FULL_REFRESH_INTERVAL * 2)
+# 最多保存的任务数，超出时淘汰最久没有收到事件的任务
+MAX_TRACKED_TASKS = 10000
+# 取消标记的保留时间 (秒)，与 Celery 结果的默认保存时间一致，之后任务不会再被执行
+ABORT_FLAG_TTL = 86400
+
+
+class TaskEventListener:
+  """订阅 Worker 发布的任务事件，在内存中保存每个任务的最新事件
+
+  每次收到事件都为该任务分配一个全局递增的版本号，界面据此判断哪些任务在上次渲染后发生了变化。
+  已结束超过 retention 秒的任务和超出 max_tasks 的最旧的任务会被删除，长时间运行时内存不会持续增长；
+  版本号全局递增，被删除的任务再次收到事件时不会与之前渲染的版本号相同。
+  """
+  def __init__(
+    self, channel: str = TASK_EVENTS_CHANNEL, retention: float = READY_EVENT_RETENTION,
+    max_tasks: int = MAX_TRACKED_TASKS
+  ):
+    self.channel = channel
+    self.retention = retention
+    self.max_tasks = max_tasks
+    self.events: OrderedDict[str, Dict] = OrderedDict()  # 按最近收到事件的时间排序
+    self.versions: Dict[str, int] = {}
+    self.received: Dict[str, float] = {}
+    self.counter = 0
+    self.last_prune = time.monotonic()
+    self.lock = threading.Lock()
+    self.thread = None
+
+  def start(self):
+    if self.thread is None:
+      self.thread = threading.Thread(target=self.run, daemon=True)
+      self.thread.start()
+
+  def run(self):
+    while True:
+      try:
+        pubsub = r.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel)
+        for message in pubsub.listen():
+          self.handle(json.loads(message['data']))
+      except Exception as e:
+        # 连接断开后重新订阅
+        print(f"任务事件订阅中断: {str(e)}")
+        time.sleep(1)
+
+  def handle(self, event: Dict):
+    with self.lock:
+      task_id = event['id']
+      now = time.monotonic()
+      self.events[task_id] = event
+      self.events.move_to_end(task_id)
+      self.counter += 1
+      self.versions[task_id] = self.counter
+      self.received[task_id] = now
+      if len(self.events) > self.max_tasks or now - self.last_prune >= self.retention:
+        self.prune(now)
+
+  def prune(self, now: float):
+    """删除已结束超过 retention 秒的任务，仍超出上限时淘汰最久没有收到事件的任务，调用方需持有锁"""
+    self.last_prune = now
+    expired = [
+      task_id for task_id, event in self.events.items()
+      if event['state'] in states.READY_STATES and now - self.received[task_id] >= self.retention
+    ]
+    for task_id in expired:
+      self._drop(task_id)
+    while len(self.events) > self.max_tasks:
+      self._drop(next(iter(self.events)))
+
+  def _drop(self, task_id: str):
+    self.events.pop(task_id, None)
+    self.versions.pop(task_id, None)
+    self.received.pop(task_id, None)
+
+  def get(self, task_id: str) -> Dict | None:
+    with self.lock:
+      return self.events.get(task_id)
+
+  def version(self, task_id: str) -> int:
+    with self.lock:
+      return self.versions.get(task_id, 0)
+
+  def forget(self, task_id: str):
+    with self.lock:
+      self._drop(task_id)
+
+
+def abort_flag_key(task_id: str) -> str:
+  """取消标记，需要和 Worker 保持一致"""
+  return f"{TASK_ABORT_CHANNEL}:{task_id}"
+
+
+def publish_abort(task_id: str):
+  """通知正在执行任务的 Worker 立即终止 MinerU 进程和进行中的翻译请求
+
+  先留下带过期时间的取消标记再发布信号，Worker 在订阅建立之前错过的信号会在登记任务或订阅后从标记中发现。
+  """
+  try:
+    r.set(abort_flag_key(task_id), 1, ex=ABORT_FLAG_TTL)
+    r.publish(TASK_ABORT_CHANNEL, task_id)
+  except Exception as e:
+    # 发布失败时 Worker 仍会在步骤之间发现任务已被取消
+    print(f"发布取消信号失败: {str(e)}")
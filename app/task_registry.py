@@ -1,13 +1,23 @@
-from celery.result import AsyncResult
+from celery import states
 from celery.contrib.abortable import AbortableAsyncResult
+from celery.utils import uuid
 from celery_app import app, convert_pdf_to_markdown
+from blob_store import blob_store
+from blob_sweeper import BlobSweeper
+from result_cache import result_cache
+from task_status import ActiveTaskCache, build_task_info, take_snapshot
+from task_events import TaskEventListener, publish_abort
+from scheduler import count_pages, task_priority
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict
-from datetime import datetime
 import gradio as gr
+import ipaddress
+import math
 import os
+import time
 
 # 配置和 redis 接口
-from config import QUEUE_SIZE, RESULT_DIR, r
+from config import PAGE_SIZE, STORAGE_UPLOAD_TTL, TRUSTED_PROXIES, UPLOAD_CONCURRENCY, r
 
 STATE_COLOR_MAP = {
   "PENDING": "rgba(255, 193, 7, 0.7)",     # 琥珀色 70%, 等待/准备状态 - 柔和的琥珀色（中性等待状态）
@@ -31,124 +41,285 @@ STATE_SYMBOL_MAP = {
   "UNKNOWN": "❓",
 }
 
+def is_trusted_proxy(host: str) -> bool:
+  try:
+    address = ipaddress.ip_address(host)
+  except ValueError:
+    return False
+  return any(address in network for network in TRUSTED_PROXIES)
+
+def get_submitter(request) -> str:
+  """用登录用户名或客户端 IP 标识提交者，request 可以是 gr.Request 或 FastAPI 的 Request
+
+  X-Forwarded-For 可以由客户端任意填写，只有直接连接来自可信代理时才采信: 从右往左跳过可信代理，
+  第一个不可信的地址即为客户端 IP，更左边的值不可信。
+  """
+  username = getattr(request, 'username', None)
+  if username:
+    return username
+  host = request.client.host if request.client else ''
+  forwarded = request.headers.get("x-forwarded-for")
+  if forwarded and is_trusted_proxy(host):
+    for hop in reversed([hop.strip() for hop in forwarded.split(",") if hop.strip()]):
+      host = hop
+      if not is_trusted_proxy(hop):
+        break
+  return host
+
+def lang_list(target_lang: str | List[str] | None) -> List[str]:
+  """把一种或多种目标语言统一为列表，空列表表示只转换不翻译"""
+  if not target_lang:
+    return []
+  return [target_lang] if isinstance(target_lang, str) else list(target_lang)
+
+# 超过此时间 (秒) 的任务不再计入未完成的任务数，与 Celery 结果的默认保存时间一致，之后已无法查询任务状态
+INFLIGHT_MAX_AGE = 86400
+
 class TaskRegistry:
-  def __init__(self, maxlen: int = 10):
-    """初始化任务注册表，设置最大队列大小"""
-    self.task_queue = []
-    self.maxlen = maxlen
-
-  def register_task(self, file_path: str, target_lang: str = None) -> str | None:
-    """注册新任务，如果队列已满则返回False"""
-    if len(self.task_queue) == self.maxlen:
+  """保存在 Redis 中的任务注册表，多个 Web App 实例共享，重启后不会丢失
+
+  - `task:{id}`: 任务信息的哈希 (上传时的文件名、blob_store 中的文件名、目标语言、提交者、提交时间)，按 ID 查找和删除都是 O(1)
+  - `tasks:user:{submitter}`: 提交者的任务 ID，按提交时间排序的有序集合，用于分页列出
+  - `tasks:all`: 所有任务 ID 的有序集合，用于回收无人引用的文件
+  - `tasks:inflight:{submitter}`: 提交者可能尚未完成的任务 ID，按提交时间排序，统计时顺便移除已完成的任务
+  """
+  def __init__(self, page_size: int = PAGE_SIZE, background: bool = True):
+    """
+    Args:
+      background: 是否启动订阅任务事件和清理文件的后台线程，命令行工具只提交任务时不需要
+    """
+    self.page_size = page_size
+    self.active_cache = ActiveTaskCache()
+    self.events = TaskEventListener()
+    self.sweeper = BlobSweeper(self.get_all_filenames)
+    if background:
+      self.events.start()
+      self.sweeper.start()
+
+  def task_key(self, task_id: str) -> str:
+    return f"task:{task_id}"
+
+  def user_key(self, submitter: str) -> str:
+    return f"tasks:user:{submitter}"
+
+  def inflight_key(self, submitter: str) -> str:
+    return f"tasks:inflight:{submitter}"
+
+  @staticmethod
+  def blob_name(task: Dict) -> str:
+    """任务上传的 PDF 在 blob_store 中的文件名，Worker 以其为前缀命名中间结果和最终结果
+
+    以任务 ID 命名，不同用户上传同名文件不会互相覆盖；升级前的任务没有记录，沿用上传时的文件名。
+    """
+    return task.get('blob') or task['filename']
+
+  def register_task(
+    self, file_path: str, target_lang: str | List[str] = None, submitter: str = None, force: bool = False
+  ) -> str:
+    """注册新任务
+    Args:
+      target_lang: 目标语言，可以是多种语言的列表，此时只转换一次，再同时翻译为各种语言
+      submitter: 提交者标识，用于列出提交者自己的任务，并在提交者之间公平调度
+      force: 完整重新翻译，不沿用同一文档上一版本中未变化段落的译文
+    """
+    return self.register_tasks([file_path], target_lang, submitter, force=force)[0]
+
+  def register_tasks(
+    self, file_paths: List[str], target_lang: str | List[str] = None, submitter: str = None, batch_id: str = None,
+    force: bool = False,
+  ) -> List[str]:
+    """批量注册任务，返回与 file_paths 一一对应的任务 ID
+
+    文件并发上传，所有任务通过同一个 producer 连接投递，任务信息在一个 pipeline 中写入。
+    Args:
+      batch_id: 任务所属的批次
+      force: 完整重新翻译
+    """
+    submitter = submitter or ''
+    # 先生成任务 ID，文件以任务 ID 命名后通过 redis 分块传输，上传时的文件名只用于显示和结果中的文件命名
+    task_ids = [uuid() for _ in file_paths]
+    filenames = [os.path.basename(file_path) for file_path in file_paths]
+    blob_names = [f"{task_id}.pdf" for task_id in task_ids]
+    with ThreadPoolExecutor(max_workers=UPLOAD_CONCURRENCY) as pool:
+      list(pool.map(lambda item: blob_store.put_file(*item, STORAGE_UPLOAD_TTL), zip(blob_names, file_paths)))
+
+    # 按页数和提交者未完成的任务数决定优先级，短文档和新提交者的任务优先执行，
+    # 同一批次中每个任务都计入之后任务的未完成任务数，与逐个提交时相同
+    inflight = self.count_inflight(submitter)
+    with app.producer_or_acquire() as producer:
+      for i, (task_id, filename, blob_name, file_path) in enumerate(zip(task_ids, filenames, blob_names, file_paths)):
+        convert_pdf_to_markdown.apply_async(
+          kwargs={'filename': blob_name, 'target_lang': target_lang, 'force': force, 'title': filename,
+                  'submitter': submitter},
+          task_id=task_id,
+          priority=task_priority(count_pages(file_path), inflight + i),
+          producer=producer,
+        )
+
+    submitted_at = time.time()
+    pipe = r.pipeline()
+    for task_id, filename, blob_name in zip(task_ids, filenames, blob_names):
+      pipe.hset(self.task_key(task_id), mapping={
+        'filename': filename,
+        'blob': blob_name,
+        'target_lang': ','.join(lang_list(target_lang)),
+        'submitter': submitter,
+        'submitted_at': submitted_at,
+        'batch_id': batch_id or '',
+      })
+      pipe.zadd(self.user_key(submitter), {task_id: submitted_at})
+      pipe.zadd("tasks:all", {task_id: submitted_at})
+      pipe.zadd(self.inflight_key(submitter), {task_id: submitted_at})
+    pipe.execute()
+    return task_ids
+
+  def get_task(self, task_id: str) -> Dict | None:
+    """读取任务信息，任务不存在时返回 None"""
+    data = r.hgetall(self.task_key(task_id))
+    if not data:
       return None
-    
-    # 通过 redis 传输文件
-    with open(file_path, "rb") as f:
-      file_data = f.read()
-    filename = os.path.basename(file_path)
-    r.set(f"file:{filename}", file_data)
-    
-    task = convert_pdf_to_markdown.delay(
-      filename=filename,
-      target_lang=target_lang
-    )
-
-    self.task_queue.append((task.id, filename))
-    return task.id
-
-  def get_all_task_ids(self) -> List[str]:
-    """获取所有已知任务ID"""
-    return map(lambda item: item[0], self.task_queue)
-
-  def remove_task(self, i):
-    """删除队列第 i 个任务，并刷新显示的队列组件"""
-    if i < 0 or i >= self.maxlen:
-      return
-    
-    task_id, pdf_file_name = self.task_queue[i]
+    return {key.decode(): value.decode() for key, value in data.items()}
+
+  def count_inflight(self, submitter: str) -> int:
+    """统计提交者尚未完成的任务数"""
+    key = self.inflight_key(submitter or '')
+    r.zremrangebyscore(key, '-inf', time.time() - INFLIGHT_MAX_AGE)
+    task_ids = [task_id.decode() for task_id in r.zrange(key, 0, -1)]
+    tasks = take_snapshot(task_ids, self.active_cache)
+    finished = [task['id'] for task in tasks if task['state'] in states.READY_STATES]
+    if finished:
+      r.zrem(key, *finished)
+    return len(task_ids) - len(finished)
+
+  def count_tasks(self, submitter: str) -> int:
+    return r.zcard(self.user_key(submitter))
+
+  def list_task_ids(self, submitter: str, page: int) -> List[str]:
+    """按提交时间从新到旧列出提交者第 page 页 (从 0 开始) 的任务 ID"""
+    start = page * self.page_size
+    task_ids = r.zrevrange(self.user_key(submitter), start, start + self.page_size - 1)
+    return [task_id.decode() for task_id in task_ids]
+
+  def get_all_filenames(self) -> List[str]:
+    """获取所有已知任务上传的 PDF 在 blob_store 中的文件名"""
+    pipe = r.pipeline()
+    for task_id in r.zrange("tasks:all", 0, -1):
+      pipe.hmget(self.task_key(task_id.decode()), 'blob', 'filename')
+    return [(blob or filename).decode() for blob, filename in pipe.execute() if (blob or filename) is not None]
+
+  def result_filename(self, task_id: str) -> str | None:
+    """下载结果时使用的文件名: 上传时的文件名换成 .zip 扩展名，任务不存在时返回 None"""
+    filename = r.hget(self.task_key(task_id), 'filename')
+    if filename is None:
+      return None
+    return f"{os.path.splitext(filename.decode())[0]}.zip"
+
+  def remove_task(self, task_id: str, submitter: str) -> bool:
+    """删除任务，只能删除提交者自己的任务"""
+    submitter = submitter or ''
+    task = self.get_task(task_id)
+    if task is None or task['submitter'] != (submitter or ''):
+      return False
+
     result = AbortableAsyncResult(task_id, app=app)
     state = result.state
     
     result.abort()  # 任务正在运行执行, 通知任务应该终止, Worker 将提前结束任务并清理
+    publish_abort(task_id)  # 结果后端中的标记要等到步骤之间才会被检查，同时通知 Worker 立即停止
 
     # 删除 redis 中的文件和本地可能保存的执行结果文件
-    _ = r.delete(f"file:{pdf_file_name}")
+    blob_store.delete(self.blob_name(task))
     if state == "SUCCESS":
-      result_filename = result.result
-      result_file_path = f"{RESULT_DIR}/{result_filename}"
-      _ = r.delete(f"file:{result_filename}")
-      if os.path.exists(result_file_path):
-        os.remove(result_file_path)
+      blob_store.delete(result.result)
+      result_cache.remove(result.result)
     
-    # 删除第 i 个元素
-    del self.task_queue[i]
+    pipe = r.pipeline()
+    pipe.delete(self.task_key(task_id))
+    pipe.zrem(self.user_key(submitter), task_id)
+    pipe.zrem("tasks:all", task_id)
+    pipe.zrem(self.inflight_key(submitter), task_id)
+    if task.get('batch_id'):
+      pipe.lrem(f"batch:{task['batch_id']}:tasks", 0, task_id)
+    pipe.execute()
+    self.events.forget(task_id)
 
     return True
 
   def get_task_status(self, task_id: str) -> Dict:
     """获取单个任务状态"""
-    result = AsyncResult(task_id, app=app)
-    
-    if not result.ready() and not result.state == 'PROGRESS':
-      # 检查是否是活动任务（Celery inspector有时不可靠）
-      inspector = app.control.inspect()
-      active_tasks = inspector.active() or {}
-      for worker, tasks in active_tasks.items():
-        if any(t['id'] == task_id for t in tasks):
-          result.state = 'PROGRESS'
-    
-    task_info = {
-      'id': task_id,
-      'state': result.state,
-      'progress': 0,
-      'timestamp': datetime.now().isoformat(),
-      'result': result.result if result.ready() and result.successful() else None
-    }
-    
-    # 从任务状态中提取进度信息
-    if result.state == 'PROGRESS' and result.info and isinstance(result.info, dict):
-      task_info['progress'] = result.info.get('progress', 0)
-      task_info['timestamp'] = result.info.get('timestamp', task_info['timestamp'])
-    elif result.ready():
-      if result.successful():
-        task_info['progress'] = 100
-        if isinstance(result.result, dict):
-          task_info.update(result.result)
-      else:
-        task_info['progress'] = 0
-    
-    return task_info
+    return take_snapshot([task_id], self.active_cache)[0]
   
-  def update_all_tasks(self):
-    """更新所有 gradio 组件状态"""
-    tasks = [self.get_task_status(task_id) for task_id in self.get_all_task_ids()]
-    
-    outputs = [gr.update(visible=False)] * (QUEUE_SIZE * 5)  # 默认全部隐藏
-      
-    for i, task in enumerate(tasks):
-      if i >= QUEUE_SIZE:  # 不超过最大行数
-        break
-      state = task.get('state', 'UNKNOWN')
-      # 更新第 i 行的组件
-      outputs[i*5 + 0] = gr.update(
+  def render_row(self, task: Dict) -> List:
+    """生成一行任务对应的 5 个组件的更新"""
+    state = task.get('state', 'UNKNOWN')
+    row = [
+      gr.update(
         value=[
           (STATE_SYMBOL_MAP[state], state),
           (task['id'], None),
         ],
         color_map=STATE_COLOR_MAP,
         visible=True
-      )
-      outputs[i*5 + 1] = gr.update(value=task.get('timestamp', 'N/A')[:-7], visible=True)
-      outputs[i*5 + 2] = gr.update(value=f"{task.get('progress', 0)}%", visible=True)
-      if state=='SUCCESS':
-        result_filename = task['result']
-        result_file_path = f"{RESULT_DIR}/{result_filename}"
-        if not os.path.exists(result_file_path):
-          file_data = r.get(f"file:{result_filename}")
-          with open(result_file_path, 'wb') as f:
-            f.write(file_data)
-        outputs[i*5 + 3] = gr.update(value=result_file_path, visible=True, interactive=True)
-      else:
-        outputs[i*5 + 3] = gr.update(visible=True, interactive=False)
-      outputs[i*5 + 4] = gr.update(visible=True, interactive=True)
-    return outputs
+      ),
+      gr.update(value=task.get('timestamp', 'N/A')[:-7], visible=True),
+      gr.update(value=f"{task.get('progress', 0)}%", visible=True),
+    ]
+    # 只检查结果是否还在，点击下载时才传输文件内容
+    result_filename = task['result'] if state == 'SUCCESS' else None
+    if result_filename is not None and (result_cache.contains(result_filename) or blob_store.exists(result_filename)):
+      row.append(gr.update(link=f"/results/{task['id']}", visible=True, interactive=True))
+    else:
+      row.append(gr.update(link=None, visible=True, interactive=False))  # 未完成或结果已过期被回收
+    row.append(gr.update(visible=True, interactive=True))
+    return row
+
+  def page_info(self, page: int, page_count: int, total: int) -> str:
+    return f"第 {page + 1} / {page_count} 页，共 {total} 个任务"
+
+  def update_all_tasks(self, submitter: str, page: int) -> List:
+    """更新提交者第 page 页的所有 gradio 组件状态
+    Returns:
+      所有组件的更新，之后依次是各行已渲染的 (任务ID, 事件版本号)、修正后的页码和分页信息
+    """
+    total = self.count_tasks(submitter)
+    page_count = max(1, math.ceil(total / self.page_size))
+    page = min(max(page or 0, 0), page_count - 1)  # 删除任务后页数可能变少
+
+    # 一次 MGET 取回本页所有任务状态，inspector 查询结果在多次刷新间共享
+    tasks = take_snapshot(self.list_task_ids(submitter, page), self.active_cache)
+    
+    outputs = [gr.update(visible=False)] * (self.page_size * 5)  # 默认全部隐藏
+    rendered = []
+      
+    for i, task in enumerate(tasks):
+      # 先记录版本号再渲染，渲染期间到达的事件会在下次刷新时处理
+      rendered.append((task['id'], self.events.version(task['id'])))
+      outputs[i*5:(i+1)*5] = self.render_row(task)
+    return outputs + [rendered, page, self.page_info(page, page_count, total)]
+
+  def update_changed_tasks(self, submitter: str, page: int, rendered: List) -> List:
+    """只更新收到新事件的任务所在的行，不访问结果后端
+    Args:
+      rendered: 各行已渲染的 (任务ID, 事件版本号)
+    """
+    task_ids = self.list_task_ids(submitter, page or 0)
+    if rendered is None or task_ids != [task_id for task_id, _ in rendered]:
+      return self.update_all_tasks(submitter, page)  # 本页的任务有变化，整体刷新
+
+    outputs = [gr.update()] * (self.page_size * 5)  # 默认不更新
+    new_rendered = []
+    for i, (task_id, version) in enumerate(rendered):
+      current = self.events.version(task_id)
+      event = self.events.get(task_id)
+      if current != version and event is not None:
+        state = event['state']
+        result = event.get('result') if state == 'SUCCESS' else event
+        outputs[i*5:(i+1)*5] = self.render_row(build_task_info(task_id, state, result))
+      new_rendered.append((task_id, current))
+    return outputs + [new_rendered, gr.update(), gr.update()]
+
+  def rendered_task_id(self, rendered: List, i: int) -> str | None:
+    """当前会话第 i 行显示的任务 ID"""
+    if rendered is None or i >= len(rendered):
+      return None
+    return rendered[i][0]
@@ -0,0 +1,91 @@
+from celery import states
+from datetime import datetime
+from typing import Dict, Iterable, List, Set
+import threading
+import time
+
+from celery_app import app
+
+# 配置
+from config import INSPECT_TIMEOUT, INSPECT_TTL
+
+
+class ActiveTaskCache:
+  """缓存 Celery inspector 查询到的活动任务 ID
+
+  inspector.active() 需要向所有 Worker 广播并等待回复，代价很高，
+  这里在 TTL 内复用同一次查询结果，多个任务、多次刷新共享一次广播。
+  """
+  def __init__(self, ttl: float = INSPECT_TTL, timeout: float = INSPECT_TIMEOUT):
+    self.ttl = ttl
+    self.timeout = timeout
+    self.active_ids: Set[str] = set()
+    self.updated_at = 0.0
+    self.lock = threading.Lock()
+
+  def get(self) -> Set[str]:
+    """返回所有 Worker 上正在执行的任务 ID，缓存过期时才重新查询"""
+    with self.lock:
+      if time.monotonic() - self.updated_at > self.ttl:
+        inspector = app.control.inspect(timeout=self.timeout)
+        active_tasks = inspector.active() or {}
+        self.active_ids = {t['id'] for tasks in active_tasks.values() for t in tasks}
+        self.updated_at = time.monotonic()
+      return self.active_ids
+
+
+def fetch_task_metas(task_ids: Iterable[str]) -> Dict[str, Dict]:
+  """通过一次 MGET 批量读取任务在结果后端中的元数据，不存在的任务视为 PENDING"""
+  task_ids = list(task_ids)
+  if not task_ids:
+    return {}
+  backend = app.backend
+  values = backend.mget([backend.get_key_for_task(task_id) for task_id in task_ids])
+  metas = {}
+  for task_id, value in zip(task_ids, values):
+    if value is None:
+      metas[task_id] = {'status': states.PENDING, 'result': None}
+    else:
+      metas[task_id] = backend.decode_result(value)
+  return metas
+
+
+def take_snapshot(task_ids: List[str], active_cache: ActiveTaskCache) -> List[Dict]:
+  """生成一组任务的状态快照，最多进行一次 MGET 和一次 inspector 查询"""
+  metas = fetch_task_metas(task_ids)
+  snapshot = []
+  active_ids = None
+  for task_id in task_ids:
+    meta = metas[task_id]
+    state = meta['status']
+    result = meta.get('result')
+    if state not in states.READY_STATES and state != 'PROGRESS':
+      # 检查是否是活动任务（Celery inspector有时不可靠）
+      if active_ids is None:
+        active_ids = active_cache.get()
+      if task_id in active_ids:
+        state = 'PROGRESS'
+    snapshot.append(build_task_info(task_id, state, result))
+  return snapshot
+
+
+def build_task_info(task_id: str, state: str, result) -> Dict:
+  """由任务状态和结果构造界面使用的任务信息"""
+  task_info = {
+    'id': task_id,
+    'state': state,
+    'progress': 0,
+    'timestamp': datetime.now().isoformat(),
+    'result': result if state == states.SUCCESS else None
+  }
+
+  # 从任务状态中提取进度信息
+  if state == 'PROGRESS' and isinstance(result, dict):
+    task_info['progress'] = result.get('progress', 0)
+    task_info['timestamp'] = result.get('timestamp', task_info['timestamp'])
+  elif state == states.SUCCESS:
+    task_info['progress'] = 100
+    if isinstance(result, dict):
+      task_info.update(result)
+
+  return task_info
@@ -0,0 +1,64 @@
+"""Web App 的单元测试，在 app 目录下运行: python -m pytest
+
+Web App 的模块按脚本方式互相导入，并从当前目录读取 config.yaml，因此这里把 app 目录加入 sys.path
+并切换到该目录。config 在导入时就连接并 ping Redis，这里在导入前把 redis.Redis 替换为 fakeredis，
+Celery 的结果后端也改为读写同一个 fakeredis，测试不需要 Redis 或 Worker。
+"""
+import contextlib
+import os
+import sys
+
+from celery.backends.redis import RedisBackend
+import fakeredis
+import pytest
+import redis
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+os.chdir(APP_DIR)
+
+_Redis = redis.Redis
+redis.Redis = fakeredis.FakeRedis
+try:
+  import config  # noqa: E402
+finally:
+  redis.Redis = _Redis
+
+RedisBackend._create_client = lambda self, **params: config.r
+
+
+@pytest.fixture(autouse=True)
+def redis_db():
+  """每个测试使用空的 Redis"""
+  config.r.flushdb()
+  yield config.r
+
+
+class FakeResult:
+  """代替 AbortableAsyncResult，任务都已成功，abort 只做记录"""
+  aborted = []
+
+  def __init__(self, task_id, app=None):
+    self.task_id = task_id
+    self.state = 'SUCCESS'
+    self.result = f"{task_id}.zip"
+
+  def abort(self):
+    self.aborted.append(self.task_id)
+
+
+@pytest.fixture
+def registry(monkeypatch):
+  """不投递任务、不连接 Worker 的任务注册表，提交的任务参数记录在 registry.submitted 中"""
+  import task_registry
+  submitted = []
+  monkeypatch.setattr(task_registry.app, 'producer_or_acquire', lambda: contextlib.nullcontext())
+  monkeypatch.setattr(
+    task_registry.convert_pdf_to_markdown, 'apply_async', lambda **options: submitted.append(options)
+  )
+  monkeypatch.setattr(task_registry, 'count_pages', lambda path: 1)
+  monkeypatch.setattr(task_registry, 'AbortableAsyncResult', FakeResult)
+  registry = task_registry.TaskRegistry(background=False)
+  monkeypatch.setattr(registry.active_cache, 'get', lambda: set())
+  registry.submitted = submitted  # 投递的任务参数
+  return registry
@@ -0,0 +1,22 @@
+from fastapi.testclient import TestClient
+import pytest
+
+import app
+
+
+@pytest.fixture(scope='module')
+def client():
+  with TestClient(app.create_app()) as client:
+    yield client
+
+
+def test_gradio_ui_is_mounted_at_root(client):
+  response = client.get('/')
+  assert response.status_code == 200
+  assert 'gradio' in response.text.lower()
+
+
+def test_api_routes_are_served_before_gradio(client):
+  assert client.get('/results/unknown').status_code == 404
+  assert client.get('/results/unknown').json()['detail'] == "任务不存在或还没有完成"
+  assert client.get('/batch/unknown').json()['detail'] == "批次不存在"
@@ -0,0 +1,166 @@
+import io
+import sys
+import zipfile
+
+from celery_app import app as celery_app
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+import pytest
+
+import batch
+from batch import BatchManager, collect_pdfs, create_router
+from blob_store import blob_store
+from config import r
+
+
+@pytest.fixture(autouse=True)
+def result_dir(monkeypatch, tmp_path):
+  """批次的 zip 生成在临时目录中"""
+  monkeypatch.setattr(batch, 'RESULT_DIR', str(tmp_path))
+
+
+def make_zip(path, files):
+  with zipfile.ZipFile(path, 'w') as zf:
+    for name, data in files.items():
+      zf.writestr(name, data)
+  return str(path)
+
+
+def finish(task_id, content=b'zip'):
+  """模拟 Worker 完成任务: 上传结果并写入结果后端"""
+  with blob_store.open_writer(f"{task_id}.zip") as writer:
+    writer.write(content)
+  celery_app.backend.store_result(task_id, f"{task_id}.zip", 'SUCCESS')
+
+
+def test_collect_pdfs_from_dirs_zips_and_files(tmp_path):
+  papers = tmp_path / 'papers' / 'sub'
+  papers.mkdir(parents=True)
+  (papers / 'a.pdf').write_bytes(b'a')
+  (papers / 'notes.txt').write_bytes(b'x')
+  (tmp_path / 'a.pdf').write_bytes(b'other a')
+  archive = make_zip(tmp_path / 'in.zip', {'dir/b.PDF': b'b', 'dir/a.pdf': b'zip a', 'readme.md': b''})
+  work_dir = tmp_path / 'work'
+  work_dir.mkdir()
+  paths = collect_pdfs([str(tmp_path / 'papers'), archive, str(tmp_path / 'a.pdf')], str(work_dir))
+  names = [path.rsplit('/', 1)[-1] for path in paths]
+  assert names == ['a.pdf', 'b.PDF', 'a_1.pdf', 'a_2.pdf']  # 重名的文件加上序号
+  assert [open(path, 'rb').read() for path in paths] == [b'a', b'b', b'zip a', b'other a']
+
+
+def test_submit_status_and_archive(registry, tmp_path):
+  manager = BatchManager(registry)
+  archive = make_zip(tmp_path / 'in.zip', {'x/paper.pdf': b'1', 'y/paper.pdf': b'2', 'other.pdf': b'3'})
+  submitted = manager.submit([archive], ['中文', '日本語'], 'alice')
+  task_ids = submitted['task_ids']
+  assert len(task_ids) == 3
+  assert all(options['kwargs']['target_lang'] == ['中文', '日本語'] for options in registry.submitted)
+
+  status = manager.status(submitted['batch_id'])
+  assert (status['total'], status['done'], status['finished']) == (3, 0, False)
+  assert status['target_langs'] == ['中文', '日本語']
+  assert [task['filename'] for task in status['tasks']] == ['paper.pdf', 'paper_1.pdf', 'other.pdf']
+  assert manager.build_archive(submitted['batch_id']) is None  # 还没有完成的结果
+
+  finish(task_ids[0], b'first')
+  finish(task_ids[2], b'third')
+  status = manager.status(submitted['batch_id'])
+  assert (status['done'], status['progress'], status['counts']) == (2, 67, {'SUCCESS': 2, 'PENDING': 1})
+  with zipfile.ZipFile(manager.build_archive(submitted['batch_id'])) as zf:
+    assert {name: zf.read(name) for name in zf.namelist()} == {'paper.zip': b'first', 'other.zip': b'third'}
+
+
+def test_batch_keys_expire(registry, tmp_path):
+  (tmp_path / 'a.pdf').write_bytes(b'a')
+  batch_id = BatchManager(registry).submit([str(tmp_path / 'a.pdf')], None, 'alice')['batch_id']
+  for key in (f"batch:{batch_id}", f"batch:{batch_id}:tasks"):
+    assert 0 < r.ttl(key) <= batch.BATCH_TTL
+
+
+def test_removed_task_leaves_batch(registry, tmp_path):
+  manager = BatchManager(registry)
+  for name in ('a.pdf', 'b.pdf'):
+    (tmp_path / name).write_bytes(name.encode())
+  submitted = manager.submit([str(tmp_path / 'a.pdf'), str(tmp_path / 'b.pdf')], None, 'alice')
+  first, second = submitted['task_ids']
+  finish(first)
+  assert registry.remove_task(second, 'alice')
+  status = manager.status(submitted['batch_id'])
+  # 删除的任务不再显示为 PENDING，批次可以完成
+  assert [task['id'] for task in status['tasks']] == [first]
+  assert (status['total'], status['done'], status['finished']) == (1, 1, True)
+  assert r.lrange(f"batch:{submitted['batch_id']}:tasks", 0, -1) == [first.encode()]
+
+  # 注册表中已不存在的任务 (如升级前删除的任务) 同样不计入
+  r.delete(registry.task_key(first))
+  assert manager.status(submitted['batch_id'])['total'] == 0
+
+
+def test_submit_without_pdfs(registry, tmp_path):
+  (tmp_path / 'notes.txt').write_bytes(b'x')
+  with pytest.raises(ValueError):
+    BatchManager(registry).submit([str(tmp_path / 'notes.txt')])
+  assert BatchManager(registry).status('missing') is None
+
+
+@pytest.fixture
+def client(registry):
+  server = FastAPI()
+  server.include_router(create_router(BatchManager(registry)))
+  return TestClient(server)
+
+
+def test_router(client, registry):
+  response = client.post(
+    '/batch',
+    files=[('files', ('a.pdf', b'a', 'application/pdf')), ('files', ('b.pdf', b'b', 'application/pdf'))],
+    data={'target_lang': '中文, English', 'force': 'true'},
+  )
+  assert response.status_code == 200
+  batch_id, task_ids = response.json()['batch_id'], response.json()['task_ids']
+  assert [options['kwargs']['target_lang'] for options in registry.submitted] == [['中文', 'English']] * 2
+  assert all(options['kwargs']['force'] for options in registry.submitted)
+  assert registry.get_task(task_ids[0])['submitter'] == 'testclient'
+
+  assert client.get(f'/batch/{batch_id}').json()['total'] == 2
+  assert client.get(f'/batch/{batch_id}/download').status_code == 404
+  finish(task_ids[1])
+  response = client.get(f'/batch/{batch_id}/download')
+  assert response.status_code == 200
+  assert zipfile.ZipFile(io.BytesIO(response.content)).namelist() == ['b.zip']
+
+
+def test_router_errors(client):
+  response = client.post('/batch', files=[('files', ('notes.txt', b'x', 'text/plain'))])
+  assert response.status_code == 400
+  assert client.get('/batch/missing').status_code == 404
+  assert client.get('/batch/missing/download').status_code == 404
+
+
+def run_cli(monkeypatch, registry, *args):
+  monkeypatch.setattr(batch, 'TaskRegistry', lambda background: registry)
+  monkeypatch.setattr(sys, 'argv', ['batch.py', *args])
+  batch.main()
+
+
+def test_cli(monkeypatch, registry, tmp_path, capsys):
+  (tmp_path / 'a.pdf').write_bytes(b'a')
+  run_cli(monkeypatch, registry, 'submit', str(tmp_path / 'a.pdf'), '--lang', '中文', '--submitter', 'bob')
+  out = capsys.readouterr().out
+  assert "已提交 1 个任务" in out
+  batch_id = out.rsplit(': ', 1)[1].strip()
+  task_id = registry.submitted[0]['task_id']
+  assert registry.get_task(task_id)['submitter'] == 'bob'
+
+  run_cli(monkeypatch, registry, 'status', batch_id)
+  assert "已完成 0 / 1" in capsys.readouterr().out
+
+  finish(task_id, b'result')
+  output = tmp_path / 'out.zip'
+  run_cli(monkeypatch, registry, 'download', batch_id, '-o', str(output))
+  assert "已保存到" in capsys.readouterr().out
+  with zipfile.ZipFile(output) as zf:
+    assert zf.read('a.zip') == b'result'
+
+  with pytest.raises(SystemExit):
+    run_cli(monkeypatch, registry, 'status', 'missing')
@@ -0,0 +1,23 @@
+from blob_store import blob_store
+from blob_sweeper import BlobSweeper
+from config import r
+
+
+def test_untracked_legacy_blob_is_swept():
+  r.set(blob_store.manifest_key('leaked.pdf'), b'legacy data')
+  r.set(blob_store.manifest_key('kept.pdf'), b'legacy data')
+  with blob_store.open_writer('kept.zip') as writer:
+    writer.write(b'result')
+  stats = BlobSweeper(lambda: ['kept.pdf'], grace=3600).sweep()
+  assert (stats['swept_files'], stats['swept_bytes'], stats['files']) == (1, 11, 2)
+  assert not blob_store.exists('leaked.pdf')
+  assert blob_store.exists('kept.pdf') and blob_store.exists('kept.zip')
+
+
+def test_new_untracked_blob_waits_for_grace_period():
+  with blob_store.open_writer('new.pdf') as writer:
+    writer.write(b'pdf')
+  assert BlobSweeper(lambda: [], grace=3600).sweep()['swept_files'] == 0
+  assert blob_store.exists('new.pdf')
+  assert BlobSweeper(lambda: [], grace=-1).sweep()['swept_files'] == 1
+  assert not r.keys('file:*')
@@ -0,0 +1,106 @@
+import os
+
+from celery import states
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+import pytest
+
+import result_cache as result_cache_module
+from blob_store import blob_store
+from celery_app import app as celery_app
+from result_cache import ResultCache, create_download_router
+
+
+@pytest.fixture
+def cache(tmp_path):
+  return ResultCache(str(tmp_path / "results"))
+
+
+def put_blob(name, data):
+  with blob_store.open_writer(name) as writer:
+    writer.write(data)
+
+
+def test_stream_writes_through_temp_file(cache):
+  put_blob('a.zip', b'result data')
+  stream = cache.stream('a.zip')
+  assert next(stream) == b'result data'
+  # 发送过程中只有临时文件，读者不会看到不完整的缓存文件
+  assert not cache.contains('a.zip')
+  assert [name.endswith('.tmp') for name in os.listdir(cache.directory)] == [True]
+  assert list(stream) == []
+  assert os.listdir(cache.directory) == ['a.zip']
+  with open(cache.get('a.zip'), 'rb') as f:
+    assert f.read() == b'result data'
+
+
+def test_error_mid_stream_leaves_no_partial_file(cache, monkeypatch):
+  def broken_chunks(name):
+    yield b'first chunk'
+    raise ConnectionError("redis went away")
+
+  monkeypatch.setattr(result_cache_module.blob_store, 'iter_chunks', broken_chunks)
+  stream = cache.stream('a.zip')
+  assert next(stream) == b'first chunk'
+  with pytest.raises(ConnectionError):
+    next(stream)
+  assert os.listdir(cache.directory) == []
+
+
+def test_client_disconnect_leaves_no_partial_file(cache):
+  put_blob('a.zip', b'result data')
+  stream = cache.stream('a.zip')
+  next(stream)
+  stream.close()  # 浏览器中途断开
+  assert os.listdir(cache.directory) == []
+
+
+def test_evict_least_recently_used_but_keep(cache):
+  cache.max_size = 250
+  for i, name in enumerate(['old.zip', 'middle.zip', 'new.zip']):
+    with open(cache.path(name), 'wb') as f:
+      f.write(b'x' * 100)
+    os.utime(cache.path(name), (i, i))
+  cache.evict(keep=cache.path('old.zip'))
+  # 最旧的文件即将发送，跳过它淘汰下一个
+  assert sorted(os.listdir(cache.directory)) == ['new.zip', 'old.zip']
+  cache.evict()
+  assert sorted(os.listdir(cache.directory)) == ['new.zip', 'old.zip']  # 未超出上限
+  cache.max_size = 150
+  cache.evict()
+  assert os.listdir(cache.directory) == ['new.zip']
+
+
+@pytest.fixture
+def client(cache):
+  server = FastAPI()
+  server.include_router(create_download_router(cache, lambda task_id: '论文.zip' if task_id == 'done' else None))
+  with TestClient(server) as client:
+    yield client
+
+
+def test_download_unknown_or_unfinished_task_is_404(client):
+  assert client.get('/results/unknown').status_code == 404
+  celery_app.backend.store_result('running', {'progress': 50}, 'PROGRESS')
+  assert client.get('/results/running').status_code == 404
+  celery_app.backend.store_result('failed', ValueError("boom"), states.FAILURE)
+  assert client.get('/results/failed').status_code == 404
+
+
+def test_download_expired_result_is_404(client):
+  celery_app.backend.store_result('done', 'done.zip', states.SUCCESS)
+  response = client.get('/results/done')
+  assert response.status_code == 404
+  assert response.json()['detail'] == "结果已过期"
+
+
+def test_download_streams_then_serves_from_cache(client, cache):
+  celery_app.backend.store_result('done', 'done.zip', states.SUCCESS)
+  put_blob('done.zip', b'zip bytes')
+  response = client.get('/results/done')
+  assert response.status_code == 200 and response.content == b'zip bytes'
+  assert "filename*=utf-8''%E8%AE%BA%E6%96%87.zip" in response.headers['content-disposition']
+  assert cache.contains('done.zip')
+  blob_store.delete('done.zip')  # 之后直接从缓存发送
+  response = client.get('/results/done')
+  assert response.status_code == 200 and response.content == b'zip bytes'
@@ -0,0 +1,65 @@
+import fitz
+
+import scheduler
+from scheduler import PRIORITY_STEPS, count_pages, task_priority
+
+
+def make_pdf(path, pages: int):
+  with fitz.open() as doc:
+    for _ in range(pages):
+      doc.new_page()
+    doc.save(path)
+
+
+def test_count_pages(tmp_path):
+  path = tmp_path / "a.pdf"
+  make_pdf(str(path), 3)
+  assert count_pages(str(path)) == 3
+
+
+def test_count_pages_unreadable_file_is_treated_as_largest(tmp_path, monkeypatch):
+  monkeypatch.setattr(scheduler, 'SIZE_CLASSES', [20, 100])
+  path = tmp_path / "broken.pdf"
+  path.write_bytes(b"not a pdf")
+  assert count_pages(str(path)) == 101
+  assert count_pages(str(tmp_path / "missing.pdf")) == 101
+  monkeypatch.setattr(scheduler, 'SIZE_CLASSES', [])
+  assert count_pages(str(path)) == 0
+
+
+def test_task_priority_by_size_and_inflight(monkeypatch):
+  monkeypatch.setattr(scheduler, 'SHORT_FIRST', True)
+  monkeypatch.setattr(scheduler, 'SIZE_CLASSES', [20, 100])
+  monkeypatch.setattr(scheduler, 'MAX_FAIR_PENALTY', 3)
+  assert task_priority(5, 0) == 0
+  assert task_priority(20, 0) == 0  # 分界点属于较小的档位
+  assert task_priority(21, 0) == 3
+  assert task_priority(500, 0) == 6
+  assert task_priority(5, 1) == 1
+  assert task_priority(5, 10) == 2  # 惩罚小于档位间距
+  monkeypatch.setattr(scheduler, 'MAX_FAIR_PENALTY', 1)
+  assert task_priority(5, 10) == 1  # 惩罚不超过 max_fair_penalty
+
+
+def test_penalty_never_crosses_size_class(monkeypatch):
+  monkeypatch.setattr(scheduler, 'SHORT_FIRST', True)
+  monkeypatch.setattr(scheduler, 'SIZE_CLASSES', [20, 100])
+  monkeypatch.setattr(scheduler, 'MAX_FAIR_PENALTY', 9)
+  # 积压很多任务的提交者的短文档仍先于其他提交者的长文档
+  assert task_priority(5, 50) < task_priority(50, 0) < task_priority(500, 0)
+  assert task_priority(50, 50) < task_priority(500, 0)
+
+
+def test_task_priority_is_clamped_to_broker_steps(monkeypatch):
+  monkeypatch.setattr(scheduler, 'SHORT_FIRST', True)
+  monkeypatch.setattr(scheduler, 'SIZE_CLASSES', [1, 2, 3, 4])
+  monkeypatch.setattr(scheduler, 'MAX_FAIR_PENALTY', 5)
+  assert task_priority(1000, 100) == PRIORITY_STEPS[-1]
+  assert task_priority(0, -5) == PRIORITY_STEPS[0]
+
+
+def test_task_priority_without_short_first_only_uses_penalty(monkeypatch):
+  monkeypatch.setattr(scheduler, 'SHORT_FIRST', False)
+  monkeypatch.setattr(scheduler, 'MAX_FAIR_PENALTY', 2)
+  assert task_priority(1000, 0) == 0
+  assert task_priority(1000, 2) == 2
@@ -0,0 +1,55 @@
+from task_events import TaskEventListener
+
+
+def event(task_id, state, **fields):
+  return {'id': task_id, 'state': state, **fields}
+
+
+def test_versions_change_on_every_event():
+  listener = TaskEventListener()
+  assert listener.version('a') == 0
+  listener.handle(event('a', 'PROGRESS', progress=10))
+  first = listener.version('a')
+  listener.handle(event('b', 'PROGRESS', progress=10))
+  listener.handle(event('a', 'PROGRESS', progress=20))
+  assert listener.version('a') not in (0, first)
+  assert listener.get('a')['progress'] == 20
+
+
+def test_finished_tasks_are_pruned_after_retention(monkeypatch):
+  clock = [1000.0]
+  monkeypatch.setattr('task_events.time.monotonic', lambda: clock[0])
+  listener = TaskEventListener(retention=60)
+  listener.handle(event('done', 'SUCCESS', result='a.zip'))
+  listener.handle(event('running', 'PROGRESS', progress=50))
+  clock[0] += 61
+  listener.handle(event('other', 'PROGRESS', progress=1))
+  assert listener.get('done') is None and listener.version('done') == 0
+  assert listener.get('running') is not None  # 未结束的任务不会因时间被删除
+  assert set(listener.events) == {'running', 'other'}
+
+
+def test_oldest_tasks_are_evicted_over_the_limit():
+  listener = TaskEventListener(max_tasks=3)
+  for i in range(5):
+    listener.handle(event(f"t{i}", 'PROGRESS', progress=i))
+  listener.handle(event('t2', 'PROGRESS', progress=99))  # 刷新 t2 的位置
+  listener.handle(event('t5', 'PROGRESS', progress=0))
+  assert list(listener.events) == ['t4', 't2', 't5']
+  assert len(listener.versions) == len(listener.received) == 3
+
+
+def test_version_after_eviction_never_repeats():
+  listener = TaskEventListener(max_tasks=1)
+  listener.handle(event('a', 'PROGRESS'))
+  rendered = listener.version('a')
+  listener.handle(event('b', 'PROGRESS'))  # 淘汰 a
+  listener.handle(event('a', 'SUCCESS'))
+  assert listener.version('a') != rendered
+
+
+def test_forget():
+  listener = TaskEventListener()
+  listener.handle(event('a', 'PROGRESS'))
+  listener.forget('a')
+  assert listener.get('a') is None and listener.version('a') == 0 and not listener.received
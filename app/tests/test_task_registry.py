@@ -0,0 +1,70 @@
+from types import SimpleNamespace
+import ipaddress
+
+from blob_store import blob_store
+from config import r
+import task_registry
+from task_registry import TaskRegistry, get_submitter
+
+
+def upload(tmp_path, user, content):
+  path = tmp_path / user / 'paper.pdf'
+  path.parent.mkdir()
+  path.write_bytes(content)
+  return str(path)
+
+
+def test_same_filename_from_two_users_does_not_collide(registry, tmp_path):
+  a = registry.register_task(upload(tmp_path, 'alice', b'alice pdf'), '中文', 'alice')
+  b = registry.register_task(upload(tmp_path, 'bob', b'bob pdf'), '中文', 'bob')
+  assert a != b
+  kwargs = [options['kwargs'] for options in registry.submitted]
+  assert [k['filename'] for k in kwargs] == [f"{a}.pdf", f"{b}.pdf"]
+  assert [k['title'] for k in kwargs] == ['paper.pdf', 'paper.pdf']
+  assert [k['submitter'] for k in kwargs] == ['alice', 'bob']
+  assert [options['task_id'] for options in registry.submitted] == [a, b]
+  assert b''.join(blob_store.iter_chunks(f"{a}.pdf")) == b'alice pdf'
+  assert b''.join(blob_store.iter_chunks(f"{b}.pdf")) == b'bob pdf'
+  assert registry.get_task(a)['filename'] == 'paper.pdf'
+  assert registry.result_filename(a) == 'paper.zip'
+
+
+def test_remove_task_only_deletes_own_files(registry, tmp_path):
+  a = registry.register_task(upload(tmp_path, 'alice', b'alice pdf'), None, 'alice')
+  b = registry.register_task(upload(tmp_path, 'bob', b'bob pdf'), None, 'bob')
+  for task_id in (a, b):
+    with blob_store.open_writer(f"{task_id}.zip") as writer:
+      writer.write(b'result')
+  assert not registry.remove_task(a, 'bob')  # 不能删除别人的任务
+  assert registry.remove_task(a, 'alice')
+  assert not blob_store.exists(f"{a}.pdf") and not blob_store.exists(f"{a}.zip")
+  assert blob_store.exists(f"{b}.pdf") and blob_store.exists(f"{b}.zip")
+  assert registry.get_task(a) is None and registry.get_task(b) is not None
+
+
+def test_tracked_files_include_legacy_tasks(registry, tmp_path):
+  task_id = registry.register_task(upload(tmp_path, 'alice', b'pdf'), None, 'alice')
+  r.hset(registry.task_key('legacy'), mapping={'filename': 'old.pdf', 'submitter': ''})
+  r.zadd("tasks:all", {'legacy': 0})
+  assert sorted(registry.get_all_filenames()) == sorted([f"{task_id}.pdf", 'old.pdf'])
+  assert TaskRegistry.blob_name(registry.get_task('legacy')) == 'old.pdf'
+
+
+def make_request(peer, forwarded=None, username=None):
+  headers = {'x-forwarded-for': forwarded} if forwarded else {}
+  return SimpleNamespace(username=username, headers=headers, client=SimpleNamespace(host=peer))
+
+
+def test_spoofed_forwarded_for_is_ignored(monkeypatch):
+  monkeypatch.setattr(task_registry, 'TRUSTED_PROXIES', [])
+  assert get_submitter(make_request('203.0.113.5', '198.51.100.7')) == '203.0.113.5'
+  assert get_submitter(make_request('203.0.113.5', '198.51.100.7', username='alice')) == 'alice'
+
+
+def test_forwarded_for_from_trusted_proxy(monkeypatch):
+  monkeypatch.setattr(task_registry, 'TRUSTED_PROXIES', [ipaddress.ip_network('10.0.0.0/8')])
+  assert get_submitter(make_request('10.0.0.2', '198.51.100.7')) == '198.51.100.7'
+  # 客户端自己附加的值在最左边，只取可信代理之前的第一个地址
+  assert get_submitter(make_request('10.0.0.2', '192.0.2.1, 198.51.100.7, 10.0.0.3')) == '198.51.100.7'
+  # 不可信的来源即使带上可信代理的地址也不采信
+  assert get_submitter(make_request('203.0.113.5', '10.0.0.3')) == '203.0.113.5'
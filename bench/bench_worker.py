@@ -0,0 +1,45 @@
+"""性能测试中使用的 Worker 启动脚本
+
+在 run_bench.py 生成的工作目录中运行 (Worker 从当前目录读取 config.yaml)。
+启动前给 Executor 的每个步骤套上计时，耗时写入 Redis 列表 bench:steps，
+然后以线程池方式启动 Celery Worker，同时处理转换和翻译两个队列。
+"""
+import functools
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "worker"))
+
+import translate  # noqa: E402
+from config import CONVERT_QUEUE, TRANSLATE_QUEUE, r  # noqa: E402
+
+STEPS_KEY = "bench:steps"
+
+
+def timed(name, step):
+  @functools.wraps(step)
+  def wrapper(*args, **kwargs):
+    start = time.perf_counter()
+    try:
+      return step(*args, **kwargs)
+    finally:
+      r.rpush(STEPS_KEY, json.dumps({'step': name, 'seconds': time.perf_counter() - start}))
+  return wrapper
+
+
+# 必须在导入 celery_app 之前替换，celery_app 在导入时就引用了各个步骤
+for name in dir(translate.Executor):
+  if re.fullmatch(r'step\d+', name):
+    setattr(translate.Executor, name, timed(name, getattr(translate.Executor, name)))
+
+from celery_app import app  # noqa: E402
+
+if __name__ == "__main__":
+  concurrency = sys.argv[1] if len(sys.argv) > 1 else "4"
+  app.worker_main([
+    'worker', '--loglevel=warning', '--pool=threads', f'--concurrency={concurrency}',
+    '-Q', f'{CONVERT_QUEUE},{TRANSLATE_QUEUE}', '--without-gossip', '--without-mingle',
+  ])
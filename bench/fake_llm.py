@@ -0,0 +1,179 @@
+"""本地的 OpenAI 兼容大模型服务，用于离线性能测试
+
+/v1/chat/completions 把 prompt 中待翻译的段落原样返回作为 "译文"，
+按配置模拟请求延迟、按输出 token 计的生成速度和每分钟请求数限制 (超出时返回 429)，
+stream 为 true 时按生成速度分块推送，客户端断开后停止生成。
+/stats 返回请求数、被限流次数、中途断开的请求数和 token 用量。
+
+用法:
+  python fake_llm.py --port 8900 --latency 0.5 --tokens-per-second 200 --rpm 600
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import collections
+import json
+import math
+import threading
+import time
+import uuid
+
+
+def estimate_tokens(text: str) -> int:
+  return math.ceil(len(text.encode('utf-8')) / 4)
+
+
+class FakeLLM:
+  def __init__(self, latency: float = 0.5, tokens_per_second: float = 200, rpm: int = 0):
+    self.latency = latency
+    self.tokens_per_second = tokens_per_second
+    self.rpm = rpm
+    self.lock = threading.Lock()
+    self.recent = collections.deque()
+    self.stats = {'requests': 0, 'rate_limited': 0, 'disconnected': 0, 'prompt_tokens': 0, 'completion_tokens': 0}
+
+  def admit(self) -> bool:
+    """滑动窗口限流，返回 False 表示超出每分钟请求数"""
+    with self.lock:
+      now = time.monotonic()
+      while self.recent and now - self.recent[0] > 60:
+        self.recent.popleft()
+      if self.rpm and len(self.recent) >= self.rpm:
+        self.stats['rate_limited'] += 1
+        return False
+      self.recent.append(now)
+      self.stats['requests'] += 1
+      return True
+
+  def prepare(self, body: dict):
+    """返回 (译文, prompt token 数, 译文 token 数)"""
+    prompt = body['messages'][-1]['content']
+    # 翻译 prompt 的格式为 "要求\n\n段落"，把段落原样返回
+    content = prompt.split("\n\n", 1)[-1]
+    return content, estimate_tokens(prompt), estimate_tokens(content)
+
+  def record(self, prompt_tokens: int, completion_tokens: int):
+    with self.lock:
+      self.stats['prompt_tokens'] += prompt_tokens
+      self.stats['completion_tokens'] += completion_tokens
+
+  def complete(self, body: dict) -> dict:
+    content, prompt_tokens, completion_tokens = self.prepare(body)
+    time.sleep(self.latency + completion_tokens / self.tokens_per_second)
+    self.record(prompt_tokens, completion_tokens)
+    return {
+      'id': f"chatcmpl-{uuid.uuid4().hex}",
+      'object': 'chat.completion',
+      'created': int(time.time()),
+      'model': body.get('model', 'fake'),
+      'choices': [{
+        'index': 0,
+        'message': {'role': 'assistant', 'content': content},
+        'finish_reason': 'stop',
+      }],
+      'usage': {
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': completion_tokens,
+        'total_tokens': prompt_tokens + completion_tokens,
+      },
+    }
+
+  def stream(self, body: dict, wfile):
+    """以 SSE 格式按生成速度逐块推送译文，每块约 16 个 token，客户端断开时停止生成"""
+    content, prompt_tokens, completion_tokens = self.prepare(body)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+
+    def send(choices: list, usage: dict = None):
+      chunk = {
+        'id': completion_id,
+        'object': 'chat.completion.chunk',
+        'created': int(time.time()),
+        'model': body.get('model', 'fake'),
+        'choices': choices,
+        'usage': usage,
+      }
+      wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+      wfile.flush()
+
+    time.sleep(self.latency)
+    sent = 0
+    try:
+      for start in range(0, len(content), 64):
+        piece = content[start:start + 64]
+        time.sleep(estimate_tokens(piece) / self.tokens_per_second)
+        send([{'index': 0, 'delta': {'content': piece}, 'finish_reason': None}])
+        sent += estimate_tokens(piece)
+      send([{'index': 0, 'delta': {}, 'finish_reason': 'stop'}])
+      if (body.get('stream_options') or {}).get('include_usage'):
+        send([], {
+          'prompt_tokens': prompt_tokens,
+          'completion_tokens': completion_tokens,
+          'total_tokens': prompt_tokens + completion_tokens,
+        })
+      wfile.write(b"data: [DONE]\n\n")
+      wfile.flush()
+    except (BrokenPipeError, ConnectionResetError):
+      with self.lock:
+        self.stats['disconnected'] += 1
+    self.record(prompt_tokens, min(sent, completion_tokens))
+
+  def make_handler(self):
+    llm = self
+
+    class Handler(BaseHTTPRequestHandler):
+      def send_json(self, status: int, data: dict):
+        payload = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+      def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        if not self.path.endswith('/chat/completions'):
+          self.send_json(404, {'error': {'message': 'not found'}})
+        elif not llm.admit():
+          self.send_json(429, {'error': {'message': 'rate limit exceeded', 'type': 'rate_limit_error'}})
+        elif body.get('stream'):
+          self.send_response(200)
+          self.send_header('Content-Type', 'text/event-stream')
+          self.end_headers()
+          llm.stream(body, self.wfile)
+        else:
+          self.send_json(200, llm.complete(body))
+
+      def do_GET(self):
+        if self.path.rstrip('/').endswith('/stats'):
+          with llm.lock:
+            self.send_json(200, dict(llm.stats))
+        else:
+          self.send_json(404, {'error': {'message': 'not found'}})
+
+      def log_message(self, format, *args):
+        pass
+
+    return Handler
+
+  def serve(self, host: str = '127.0.0.1', port: int = 0) -> ThreadingHTTPServer:
+    """在后台线程中启动服务，port 为 0 时自动选择端口"""
+    server = ThreadingHTTPServer((host, port), self.make_handler())
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+  parser = argparse.ArgumentParser(description="本地的 OpenAI 兼容大模型服务")
+  parser.add_argument('--host', default='127.0.0.1')
+  parser.add_argument('--port', type=int, default=8900)
+  parser.add_argument('--latency', type=float, default=0.5, help="每个请求的固定延迟 (秒)")
+  parser.add_argument('--tokens-per-second', type=float, default=200, help="输出 token 的生成速度")
+  parser.add_argument('--rpm', type=int, default=0, help="每分钟请求数上限，0 表示不限")
+  args = parser.parse_args()
+  server = FakeLLM(args.latency, args.tokens_per_second, args.rpm).serve(args.host, args.port)
+  print(f"fake LLM 已启动: http://{args.host}:{server.server_address[1]}/v1")
+  threading.Event().wait()
+
+
+if __name__ == "__main__":
+  main()
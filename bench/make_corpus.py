@@ -0,0 +1,81 @@
+"""生成性能测试用的 PDF 语料
+
+不依赖第三方库，直接按 PDF 格式写出每页带一行文字的文档，
+页数在给定范围内随机，可以用随机内容填充每页以接近真实文档的大小。
+
+用法:
+  python make_corpus.py --out corpus --docs 20 --pages 8-40 --page-kb 50
+"""
+import argparse
+import os
+import random
+
+
+def make_pdf(path: str, pages: int, page_kb: int = 0, seed: int = 0):
+  """写出一个 pages 页的合法 PDF"""
+  rng = random.Random(seed)
+  objects = [
+    b"<< /Type /Catalog /Pages 2 0 R >>",
+    None,  # 页面树，最后填写
+    b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+  ]
+  page_ids = []
+  for page in range(pages):
+    text = f"BT /F1 12 Tf 72 720 Td (Document {seed} page {page + 1}) Tj ET\n".encode()
+    # 用 PDF 注释行填充，模拟扫描件等较大的页面
+    padding = b''.join(b"%" + rng.randbytes(32).hex().encode() + b"\n" for _ in range(page_kb * 1024 // 66))
+    stream = text + padding
+    objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+    content_id = len(objects)
+    objects.append(
+      b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+      b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+    )
+    page_ids.append(len(objects))
+  kids = b' '.join(b"%d 0 R" % i for i in page_ids)
+  objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, pages)
+
+  out = bytearray(b"%PDF-1.4\n")
+  offsets = []
+  for i, obj in enumerate(objects, start=1):
+    offsets.append(len(out))
+    out += b"%d 0 obj\n" % i + obj + b"\nendobj\n"
+  xref = len(out)
+  out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+  out += b''.join(b"%010d 00000 n \n" % offset for offset in offsets)
+  out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+  with open(path, 'wb') as f:
+    f.write(out)
+
+
+def make_corpus(out_dir: str, docs: int, min_pages: int, max_pages: int, page_kb: int = 0, seed: int = 0) -> list:
+  """生成 docs 个 PDF，返回文件路径列表"""
+  os.makedirs(out_dir, exist_ok=True)
+  rng = random.Random(seed)
+  paths = []
+  for i in range(docs):
+    path = os.path.join(out_dir, f"bench_{seed}_{i:04d}.pdf")
+    make_pdf(path, rng.randint(min_pages, max_pages), page_kb, seed * 100000 + i)
+    paths.append(path)
+  return paths
+
+
+def parse_range(value: str):
+  low, _, high = value.partition('-')
+  return int(low), int(high or low)
+
+
+def main():
+  parser = argparse.ArgumentParser(description="生成性能测试用的 PDF 语料")
+  parser.add_argument('--out', default='corpus')
+  parser.add_argument('--docs', type=int, default=20)
+  parser.add_argument('--pages', default='8-40', help="页数范围，如 8-40")
+  parser.add_argument('--page-kb', type=int, default=0, help="每页填充的大小 (KB)")
+  parser.add_argument('--seed', type=int, default=0)
+  args = parser.parse_args()
+  paths = make_corpus(args.out, args.docs, *parse_range(args.pages), args.page_kb, args.seed)
+  print(f"已生成 {len(paths)} 个 PDF: {args.out}")
+
+
+if __name__ == "__main__":
+  main()
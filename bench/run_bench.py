@@ -0,0 +1,233 @@
+"""离线端到端性能测试
+
+不需要 magic-pdf 和真实的大模型 API: 用 stub_mineru.py 代替 magic-pdf，用 fake_llm.py 代替
+大模型服务，并启动一个本地 Redis。生成 PDF 语料后通过 convert_pdf_to_markdown 提交任务，
+等待全部完成后报告每个步骤的耗时、每分钟完成的任务数、大模型请求数和 token 用量，
+以及 Redis 的网络流量。
+
+需要安装 Worker 的依赖和 redis-server。用法 (在 bench 目录下):
+  python run_bench.py --docs 20 --pages 8-40 --concurrency 8 --target-lang 中文
+"""
+from omegaconf import OmegaConf
+import argparse
+import datetime
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from fake_llm import FakeLLM
+from make_corpus import make_corpus, parse_range
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+WORKER_DIR = os.path.join(BENCH_DIR, "..", "worker")
+
+
+def free_port() -> int:
+  with socket.socket() as s:
+    s.bind(('127.0.0.1', 0))
+    return s.getsockname()[1]
+
+
+def start_redis(work_dir: str):
+  """启动一个不持久化的本地 redis-server，返回 (进程, 端口)"""
+  port = free_port()
+  proc = subprocess.Popen(
+    ["redis-server", "--port", str(port), "--save", "", "--appendonly", "no", "--dir", work_dir],
+    stdout=subprocess.DEVNULL,
+  )
+  deadline = time.monotonic() + 10
+  while time.monotonic() < deadline:
+    try:
+      socket.create_connection(('127.0.0.1', port), timeout=1).close()
+      return proc, port
+    except OSError:
+      time.sleep(0.1)
+  proc.kill()
+  raise RuntimeError("redis-server 启动失败")
+
+
+def write_config(work_dir: str, redis_host: str, redis_port: int, redis_db: int, llm_port: int, args):
+  """以 Worker 的 config.yaml 为基础，改为使用替身和本地服务"""
+  config = OmegaConf.load(os.path.join(WORKER_DIR, "config.yaml"))
+  config.settings.mineru_path = os.path.join(BENCH_DIR, "stub_mineru.py")
+  config.settings.temp_dir = os.path.join(work_dir, "tmp")
+  config.settings.cleanup_temp = True
+  config.redis.host, config.redis.port, config.redis.db = redis_host, redis_port, redis_db
+  config.api.base_url = f"http://127.0.0.1:{llm_port}/v1"
+  config.api.concurrency = args.llm_concurrency
+  config.mineru_service.enabled = False
+  config.metrics.enabled = False
+  config.cache.translation.enabled = args.cache
+  config.cache.mineru.enabled = args.cache
+  config.cache.mineru.dir = os.path.join(work_dir, "mineru_cache")
+  OmegaConf.save(config, os.path.join(work_dir, "config.yaml"))
+
+
+def percentile(values, q):
+  values = sorted(values)
+  return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def wait_latencies(submitted, timeout: float, poll_interval: float = 0.2):
+  """等待全部任务完成，返回每个任务从提交到完成的耗时
+
+  按完成的先后而不是提交的顺序收集结果，完成时间取结果后端记录的 date_done，
+  减去该任务自己的提交时间，不受等待其他任务的影响。
+  """
+  pending = dict(submitted)
+  latencies = []
+  deadline = time.monotonic() + timeout
+  while pending:
+    if time.monotonic() > deadline:
+      raise TimeoutError(f"{len(pending)} 个任务在 {timeout} 秒内没有完成")
+    for task_id, (result, submit_time) in list(pending.items()):
+      if not result.ready():
+        continue
+      result.get()  # 任务失败时抛出异常
+      done = result.date_done
+      if done is None:
+        done_time = time.time()
+      else:
+        if done.tzinfo is None:
+          done = done.replace(tzinfo=datetime.timezone.utc)
+        done_time = done.timestamp()
+      latencies.append(max(0.0, done_time - submit_time))
+      del pending[task_id]
+    if pending:
+      time.sleep(poll_interval)
+  return latencies
+
+
+def main():
+  parser = argparse.ArgumentParser(description="离线端到端性能测试")
+  parser.add_argument('--docs', type=int, default=10, help="文档数")
+  parser.add_argument('--pages', default='8-40', help="每个文档的页数范围")
+  parser.add_argument('--page-kb', type=int, default=20, help="每页 PDF 的填充大小 (KB)")
+  parser.add_argument('--target-lang', default='中文', help="目标语言，为空时只转换不翻译")
+  parser.add_argument('--concurrency', type=int, default=4, help="Worker 并发数")
+  parser.add_argument('--llm-concurrency', type=int, default=4, help="每个任务同时翻译的段落数")
+  parser.add_argument('--llm-latency', type=float, default=0.5, help="大模型请求的固定延迟 (秒)")
+  parser.add_argument('--llm-tokens-per-second', type=float, default=200)
+  parser.add_argument('--llm-rpm', type=int, default=0, help="大模型每分钟请求数上限，0 表示不限")
+  parser.add_argument('--mineru-startup', type=float, default=2, help="magic-pdf 每次启动的耗时 (秒)")
+  parser.add_argument('--mineru-page-seconds', type=float, default=0.1, help="magic-pdf 每页的耗时 (秒)")
+  parser.add_argument('--cache', action='store_true', help="启用翻译缓存和 MinerU 缓存")
+  parser.add_argument('--redis-url', default=None, help="使用已有的 Redis (redis://host:port/db)，默认启动本地 redis-server")
+  parser.add_argument('--timeout', type=int, default=3600)
+  parser.add_argument('--json', default=None, help="把结果另存为 JSON 文件")
+  args = parser.parse_args()
+
+  work_dir = tempfile.mkdtemp(prefix="pdf2zh-bench-")
+  redis_proc = worker = None
+  try:
+    if args.redis_url:
+      url = args.redis_url.removeprefix("redis://")
+      host_port, _, db = url.partition('/')
+      redis_host, _, redis_port = host_port.partition(':')
+      redis_port, redis_db = int(redis_port or 6379), int(db or 0)
+    else:
+      redis_proc, redis_port = start_redis(work_dir)
+      redis_host, redis_db = '127.0.0.1', 0
+
+    llm = FakeLLM(args.llm_latency, args.llm_tokens_per_second, args.llm_rpm)
+    llm_server = llm.serve()
+    write_config(work_dir, redis_host, redis_port, redis_db, llm_server.server_address[1], args)
+    corpus = make_corpus(os.path.join(work_dir, "corpus"), args.docs, *parse_range(args.pages), args.page_kb)
+
+    env = dict(
+      os.environ,
+      API_KEY="bench",
+      STUB_MINERU_STARTUP=str(args.mineru_startup),
+      STUB_MINERU_PAGE_SECONDS=str(args.mineru_page_seconds),
+    )
+    worker = subprocess.Popen(
+      [sys.executable, os.path.join(BENCH_DIR, "bench_worker.py"), str(args.concurrency)],
+      cwd=work_dir, env=env,
+    )
+
+    # Worker 的模块从当前目录读取 config.yaml
+    os.chdir(work_dir)
+    os.environ["API_KEY"] = "bench"
+    sys.path.insert(0, WORKER_DIR)
+    from config import r
+    from blob_store import blob_store
+    from celery_app import convert_pdf_to_markdown
+
+    r.delete("bench:steps")
+    net_before = r.info('stats')
+    target_lang = args.target_lang or None
+    start = time.perf_counter()
+    submitted = {}
+    for path in corpus:
+      filename = os.path.basename(path)
+      blob_store.put_file(filename, path)
+      submit_time = time.time()
+      result = convert_pdf_to_markdown.delay(filename=filename, target_lang=target_lang)
+      submitted[result.id] = (result, submit_time)
+    latencies = wait_latencies(submitted, args.timeout)
+    elapsed = time.perf_counter() - start
+
+    steps = {}
+    for item in r.lrange("bench:steps", 0, -1):
+      item = json.loads(item)
+      steps.setdefault(item['step'], []).append(item['seconds'])
+    net_after = r.info('stats')
+    with urllib.request.urlopen(f"http://127.0.0.1:{llm_server.server_address[1]}/stats") as f:
+      llm_stats = json.load(f)
+
+    report = {
+      'docs': args.docs,
+      'elapsed_seconds': round(elapsed, 2),
+      'tasks_per_minute': round(args.docs / elapsed * 60, 2),
+      'task_latency_p50': round(percentile(latencies, 0.5), 2),
+      'task_latency_p95': round(percentile(latencies, 0.95), 2),
+      'steps': {
+        name: {
+          'count': len(values),
+          'mean': round(statistics.mean(values), 3),
+          'p50': round(percentile(values, 0.5), 3),
+          'p95': round(percentile(values, 0.95), 3),
+          'total': round(sum(values), 2),
+        }
+        for name, values in sorted(steps.items(), key=lambda item: int(item[0][4:]))
+      },
+      'llm': llm_stats,
+      'redis_bytes': {
+        direction: net_after.get(f'total_net_{key}_bytes', 0) - net_before.get(f'total_net_{key}_bytes', 0)
+        for direction, key in (('in', 'input'), ('out', 'output'))
+      },
+    }
+
+    print(f"文档数: {report['docs']}，总耗时 {report['elapsed_seconds']} 秒，每分钟完成 {report['tasks_per_minute']} 个任务")
+    print(f"任务完成时间 p50 {report['task_latency_p50']} 秒，p95 {report['task_latency_p95']} 秒")
+    print(f"{'步骤':<8}{'次数':>6}{'平均':>10}{'p50':>10}{'p95':>10}{'合计':>10}")
+    for name, s in report['steps'].items():
+      print(f"{name:<10}{s['count']:>6}{s['mean']:>10}{s['p50']:>10}{s['p95']:>10}{s['total']:>10}")
+    print(
+      f"大模型: {llm_stats['requests']} 次请求，{llm_stats['rate_limited']} 次被限流，"
+      f"输入 {llm_stats['prompt_tokens']} tokens，输出 {llm_stats['completion_tokens']} tokens"
+    )
+    print(f"Redis 流量: 写入 {report['redis_bytes']['in'] / 2**20:.1f} MB，读出 {report['redis_bytes']['out'] / 2**20:.1f} MB")
+    if args.json:
+      with open(args.json, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+  finally:
+    if worker is not None:
+      worker.terminate()
+      worker.wait(timeout=30)
+    if redis_proc is not None:
+      redis_proc.terminate()
+      redis_proc.wait(timeout=10)
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+"""MinerU magic-pdf 命令行的替身，用于离线性能测试
+
+接受与 magic-pdf 相同的 `-p` / `-o` 参数，按 PDF 页数生成带标题、公式、表格和图片的
+markdown，输出目录结构与 magic-pdf 一致: {output}/{name}/auto/{name}.md 和 images/。
+通过环境变量模拟耗时:
+  STUB_MINERU_STARTUP       每次启动的耗时 (秒)，模拟加载模型，默认 2
+  STUB_MINERU_PAGE_SECONDS  每页的处理耗时 (秒)，默认 0.2
+"""
+import argparse
+import hashlib
+import os
+import random
+import re
+import struct
+import sys
+import time
+import zlib
+
+WORDS = (
+  "model training data learning neural network attention layer representation "
+  "performance results method approach propose evaluate experiment dataset "
+  "benchmark baseline accuracy loss function optimization gradient parameter "
+  "feature embedding transformer encoder decoder sequence token language vision "
+  "task framework analysis significant improvement state-of-the-art robust"
+).split()
+
+
+def count_pages(pdf_bytes: bytes) -> int:
+  return max(1, len(re.findall(rb'/Type\s*/Page\b', pdf_bytes)))
+
+
+def make_png(width: int, height: int, rng: random.Random) -> bytes:
+  """生成随机噪声的 PNG，与真实图片一样几乎无法再压缩"""
+  def chunk(tag, data):
+    return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+  raw = b''.join(b'\0' + rng.randbytes(width * 3) for _ in range(height))
+  return (
+    b'\x89PNG\r\n\x1a\n'
+    + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+    + chunk(b'IDAT', zlib.compress(raw, 1))
+    + chunk(b'IEND', b'')
+  )
+
+
+def sentence(rng: random.Random) -> str:
+  words = rng.choices(WORDS, k=rng.randint(8, 24))
+  if rng.random() < 0.3:
+    words.insert(rng.randrange(len(words)), f"$x_{{{rng.randint(1, 9)}}}^2$")
+  return ' '.join(words).capitalize() + '.'
+
+
+def paragraph(rng: random.Random) -> str:
+  return ' '.join(sentence(rng) for _ in range(rng.randint(3, 8)))
+
+
+def page_markdown(page: int, rng: random.Random, images_dir: str) -> str:
+  parts = []
+  if page % 3 == 0:
+    parts.append(f"# {page // 3 + 1} {' '.join(rng.choices(WORDS, k=3)).title()}")
+  elif rng.random() < 0.5:
+    parts.append(f"## {' '.join(rng.choices(WORDS, k=4)).title()}")
+  for _ in range(rng.randint(2, 4)):
+    parts.append(paragraph(rng))
+  if rng.random() < 0.4:
+    parts.append(f"$$\n\\mathcal{{L}} = \\sum_{{i=1}}^{{N}} \\log p(y_i | x_i; \\theta_{page})\n$$")
+  if rng.random() < 0.2:
+    cells = ''.join(f"<tr><td>{w}</td><td>{rng.random():.3f}</td></tr>" for w in rng.choices(WORDS, k=5))
+    parts.append(f"<html><body><table>{cells}</table></body></html>")
+  if rng.random() < 0.5:
+    image = hashlib.sha256(f"{page}-{rng.random()}".encode()).hexdigest() + ".png"
+    with open(os.path.join(images_dir, image), 'wb') as f:
+      f.write(make_png(rng.randint(200, 400), rng.randint(150, 300), rng))
+    parts.append(f"![](images/{image})")
+  return '\n\n'.join(parts)
+
+
+def main():
+  if '--version' in sys.argv:
+    print("magic-pdf, version stub")
+    return
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-p', '--path', required=True)
+  parser.add_argument('-o', '--output-dir', required=True)
+  parser.add_argument('-m', '--method', default='auto')
+  args = parser.parse_args()
+
+  time.sleep(float(os.getenv('STUB_MINERU_STARTUP', 2)))
+  with open(args.path, 'rb') as f:
+    pdf_bytes = f.read()
+  pages = count_pages(pdf_bytes)
+  rng = random.Random(hashlib.sha256(pdf_bytes).digest())
+
+  name = os.path.splitext(os.path.basename(args.path))[0]
+  md_dir = os.path.join(args.output_dir, name, args.method)
+  images_dir = os.path.join(md_dir, "images")
+  os.makedirs(images_dir, exist_ok=True)
+  page_seconds = float(os.getenv('STUB_MINERU_PAGE_SECONDS', 0.2))
+  parts = []
+  for page in range(pages):
+    time.sleep(page_seconds)
+    parts.append(page_markdown(page, rng, images_dir))
+  with open(os.path.join(md_dir, f"{name}.md"), 'w', encoding='utf-8') as f:
+    f.write('\n\n'.join(parts))
+
+
+if __name__ == "__main__":
+  main()
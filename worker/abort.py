@@ -0,0 +1,124 @@
+from collections import Counter
+from typing import Dict, List
+import os
+import signal
+import subprocess
+import threading
+import time
+
+from config import TASK_ABORT_CHANNEL, r
+
+
+class TaskCancelled(Exception):
+  """任务在执行过程中被取消"""
+
+
+def abort_flag_key(task_id: str) -> str:
+  """Web App 取消任务时留下的取消标记，需要和 Web App 保持一致"""
+  return f"{TASK_ABORT_CHANNEL}:{task_id}"
+
+
+class AbortWatcher:
+  """订阅 Web App 发布的取消信号，立即通知本进程中正在执行的对应任务
+
+  每个 Worker 进程在第一次登记任务时启动一个订阅线程 (prefork 的子进程各自启动)。
+  Web App 发布信号前先写入带过期时间的取消标记，登记任务时和每次 (重新) 订阅后都检查一遍标记，
+  订阅建立之前或断线期间发布的信号不会被错过。结果后端中的 ABORTED 状态仍会在步骤之间检查。
+  """
+  def __init__(self, channel: str = TASK_ABORT_CHANNEL):
+    self.channel = channel
+    self.events: Dict[str, threading.Event] = {}
+    self.refs = Counter()  # 多语言翻译的子任务可能在同一进程中以同一个原任务 ID 登记
+    self.lock = threading.Lock()
+    self.thread = None
+
+  def watch(self, task_id: str) -> threading.Event:
+    """登记正在执行的任务，返回收到取消信号时被设置的 Event"""
+    with self.lock:
+      if self.thread is None:
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+      self.refs[task_id] += 1
+      event = self.events.setdefault(task_id, threading.Event())
+    if r.exists(abort_flag_key(task_id)):
+      event.set()  # 登记之前已被取消
+    return event
+
+  def unwatch(self, task_id: str):
+    with self.lock:
+      self.refs[task_id] -= 1
+      if self.refs[task_id] <= 0:
+        del self.refs[task_id]
+        self.events.pop(task_id, None)
+
+  def check_flags(self):
+    """设置已留下取消标记的任务的 Event"""
+    with self.lock:
+      items = list(self.events.items())
+    if not items:
+      return
+    flags = r.mget([abort_flag_key(task_id) for task_id, _ in items])
+    for (_, event), flag in zip(items, flags):
+      if flag is not None:
+        event.set()
+
+  def run(self):
+    while True:
+      try:
+        pubsub = r.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel)
+        self.check_flags()  # 订阅建立之前发布的信号
+        for message in pubsub.listen():
+          with self.lock:
+            event = self.events.get(message['data'].decode())
+          if event is not None:
+            event.set()
+      except Exception as e:
+        # 连接断开后重新订阅
+        print(f"取消信号订阅中断: {str(e)}")
+        time.sleep(1)
+
+
+abort_watcher = AbortWatcher()
+
+
+def kill_process_tree(proc: subprocess.Popen, timeout: float = 5):
+  """终止子进程及其启动的所有进程，先请求退出，超时后强制结束"""
+  if os.name == 'nt':
+    subprocess.run(["taskkill", "/F", "/T", "/PID", str(proc.pid)], capture_output=True)
+    proc.wait()
+    return
+  try:
+    os.killpg(proc.pid, signal.SIGTERM)
+    proc.wait(timeout=timeout)
+  except subprocess.TimeoutExpired:
+    os.killpg(proc.pid, signal.SIGKILL)
+    proc.wait()
+  except ProcessLookupError:
+    pass  # 进程组已经全部退出
+
+
+def run_cancellable(args: List[str], cancelled: threading.Event, poll_interval: float = 0.5):
+  """在单独的进程组中运行子进程并等待其结束，期间任务被取消时终止整个进程组
+  Raises:
+    TaskCancelled: 任务被取消
+    subprocess.CalledProcessError: 子进程返回非 0
+  """
+  if os.name == 'nt':
+    proc = subprocess.Popen(args, creationflags=subprocess.CREATE_NEW_PROCESS_GROUP)
+  else:
+    proc = subprocess.Popen(args, start_new_session=True)
+  try:
+    while True:
+      try:
+        returncode = proc.wait(timeout=poll_interval)
+        break
+      except subprocess.TimeoutExpired:
+        if cancelled.is_set():
+          raise TaskCancelled()
+  except BaseException:
+    # 取消、Worker 退出等情况下不留下孤儿进程
+    kill_process_tree(proc)
+    raise
+  if returncode != 0:
+    raise subprocess.CalledProcessError(returncode, args)
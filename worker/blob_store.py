@@ -0,0 +1,325 @@
+"""Web App 和 Worker 之间传输文件的存储
+
+app/blob_store.py 和 worker/blob_store.py 是同一个文件的两份拷贝，两端读写同一份数据，
+修改时必须同时修改两份 (见 README 的「文件传输」)，worker/tests/test_blob_store.py 会检查两份是否一致。
+"""
+import os
+import re
+import shutil
+import time
+from typing import Iterator, Tuple
+
+import redis
+import zstandard
+
+from config import (
+  STORAGE_BACKEND, STORAGE_CHUNK_SIZE, STORAGE_COMPRESSION, STORAGE_COMPRESSION_LEVEL, STORAGE_SHARED_DIR, r
+)
+
+# 写入中的分块在 manifest 发布前的过期时间，写入方崩溃时留下的分块会自动回收
+PENDING_CHUNK_TTL = 86400
+
+# 分块的键名 `file:{name}:{version}:{i}` 去掉 `file:` 前缀后的结尾，用于和同为字符串值的旧格式文件区分
+CHUNK_SUFFIX_PATTERN = re.compile(r':[0-9a-f]{8}:\d+$')
+
+
+class RedisBlobWriter:
+  """分块写入 Redis 的文件对象，close 时才发布 manifest，读者不会看到写了一半的文件"""
+  def __init__(self, store: "RedisBlobStore", name: str, ttl: int | None = None):
+    self.store = store
+    self.name = name
+    self.ttl = ttl
+    self.version = os.urandom(4).hex()
+    self.codec = store.codec
+    # 每个分块单独压缩成一个 zstd 帧，读取时可以逐块解压
+    self.compressor = zstandard.ZstdCompressor(level=store.compression_level) if self.codec == 'zstd' else None
+    self.buffer = bytearray()
+    self.chunks = 0
+    self.size = 0
+    self.stored = 0
+    self.closed = False
+
+  def write(self, data) -> int:
+    self.buffer += data
+    while len(self.buffer) >= self.store.chunk_size:
+      self._flush_chunk(bytes(self.buffer[:self.store.chunk_size]))
+      del self.buffer[:self.store.chunk_size]
+    return len(data)
+
+  def flush(self):
+    pass
+
+  def _flush_chunk(self, chunk: bytes):
+    data = self.compressor.compress(chunk) if self.compressor is not None else chunk
+    r.set(self.store.chunk_key(self.name, self.version, self.chunks), data, ex=self.ttl or PENDING_CHUNK_TTL)
+    self.chunks += 1
+    self.size += len(chunk)
+    self.stored += len(data)
+
+  def close(self):
+    if self.closed:
+      return
+    self.closed = True
+    if self.buffer:
+      self._flush_chunk(bytes(self.buffer))
+      self.buffer.clear()
+    old = self.store.manifest(self.name)
+    manifest = {
+      'version': self.version,
+      'chunks': self.chunks,
+      'size': self.size,
+      'stored': self.stored,
+      'codec': self.codec,
+      'created': time.time(),
+    }
+    pipe = r.pipeline()
+    if old is not None and old['legacy']:
+      pipe.delete(self.store.manifest_key(self.name))  # 覆盖旧格式的文件，先删除字符串值才能写入哈希
+    pipe.hset(self.store.manifest_key(self.name), mapping=manifest)
+    self.store.set_expiry(pipe, self.name, manifest, self.ttl)
+    pipe.execute()
+    # 覆盖写入时清理旧版本的分块
+    if old is not None:
+      self.store.delete_chunks(self.name, old)
+
+  def abort(self):
+    """放弃写入，删除已经写入的分块"""
+    self.closed = True
+    self.store.delete_chunks(self.name, {'version': self.version, 'chunks': self.chunks})
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc, tb):
+    if exc_type is None:
+      self.close()
+    else:
+      self.abort()
+
+
+class RedisBlobStore:
+  """按固定大小分块存放在 Redis 中的文件
+
+  `file:{name}` 是记录版本号、分块数和大小的 manifest，
+  分块存放在 `file:{name}:{version}:{i}`，每次读写只涉及一个分块，
+  大文件传输不会长时间阻塞 Redis，读写双方也不需要把整个文件放进内存。
+  分块可以用 zstd 压缩，manifest 记录压缩方式和实际占用的字节数；
+  写入时可以指定过期时间，manifest 和分块同时过期。
+  升级前的版本把整个文件 SET 为 `file:{name}` 的字符串值，这样的旧文件仍然可以读取、修改过期时间和删除。
+  """
+  def __init__(
+    self,
+    chunk_size: int = STORAGE_CHUNK_SIZE,
+    codec: str = STORAGE_COMPRESSION,
+    compression_level: int = STORAGE_COMPRESSION_LEVEL,
+  ):
+    self.chunk_size = chunk_size
+    self.codec = codec
+    self.compression_level = compression_level
+
+  def manifest_key(self, name: str) -> str:
+    return f"file:{name}"
+
+  def chunk_key(self, name: str, version: str, i: int) -> str:
+    return f"file:{name}:{version}:{i}"
+
+  def manifest(self, name: str) -> dict | None:
+    """读取 manifest，文件不存在时返回 None"""
+    try:
+      data = r.hgetall(self.manifest_key(name))
+    except redis.ResponseError:
+      # WRONGTYPE: 旧格式的文件，整个文件是一个未压缩的字符串值，没有单独的分块
+      size = r.strlen(self.manifest_key(name))
+      return {
+        'version': '', 'chunks': 0, 'size': size, 'stored': size, 'codec': 'none', 'created': 0, 'legacy': True,
+      }
+    if not data:
+      return None
+    size = int(data[b'size'])
+    return {
+      'version': data[b'version'].decode(),
+      'chunks': int(data[b'chunks']),
+      'size': size,
+      # 旧版本写入的文件没有以下字段，分块未压缩
+      'stored': int(data.get(b'stored', size)),
+      'codec': data.get(b'codec', b'none').decode(),
+      'created': float(data.get(b'created', 0)),
+      'legacy': False,
+    }
+
+  def open_writer(self, name: str, ttl: int | None = None) -> RedisBlobWriter:
+    """打开一个分块写入的文件对象
+    Args:
+      ttl: 过期时间 (秒)，None 表示不过期
+    """
+    return RedisBlobWriter(self, name, ttl)
+
+  def put_file(self, name: str, path: str, ttl: int | None = None):
+    """分块上传本地文件"""
+    with open(path, 'rb') as f, self.open_writer(name, ttl) as writer:
+      shutil.copyfileobj(f, writer, self.chunk_size)
+
+  def iter_chunks(self, name: str) -> Iterator[bytes]:
+    """逐块读取文件内容"""
+    manifest = self.manifest(name)
+    if manifest is None:
+      raise FileNotFoundError(f"文件 {name} 不存在")
+    if manifest['legacy']:
+      # 旧格式的文件用 GETRANGE 逐段读取，同样不需要把整个文件放进内存
+      start = 0
+      while True:
+        data = r.getrange(self.manifest_key(name), start, start + self.chunk_size - 1)
+        if data:
+          yield data
+        if len(data) < self.chunk_size:
+          return
+        start += self.chunk_size
+    decompressor = zstandard.ZstdDecompressor() if manifest['codec'] == 'zstd' else None
+    for i in range(manifest['chunks']):
+      chunk = r.get(self.chunk_key(name, manifest['version'], i))
+      if chunk is None:
+        raise FileNotFoundError(f"文件 {name} 的第 {i} 个分块不存在")
+      yield decompressor.decompress(chunk) if decompressor is not None else chunk
+
+  def get_file(self, name: str, path: str):
+    """分块下载到本地文件"""
+    with open(path, 'wb') as f:
+      for chunk in self.iter_chunks(name):
+        f.write(chunk)
+
+  def exists(self, name: str) -> bool:
+    return r.exists(self.manifest_key(name)) > 0
+
+  def set_expiry(self, pipe, name: str, manifest: dict, ttl: int | None):
+    """在 pipeline 中设置 manifest 和所有分块的过期时间，ttl 为 None 时取消过期"""
+    keys = [self.manifest_key(name)]
+    keys += [self.chunk_key(name, manifest['version'], i) for i in range(manifest['chunks'])]
+    for key in keys:
+      if ttl is None:
+        pipe.persist(key)
+      else:
+        pipe.expire(key, ttl)
+
+  def expire(self, name: str, ttl: int | None):
+    """修改文件的过期时间，文件不存在时忽略"""
+    manifest = self.manifest(name)
+    if manifest is None:
+      return
+    pipe = r.pipeline()
+    self.set_expiry(pipe, name, manifest, ttl)
+    pipe.execute()
+
+  def iter_files(self) -> Iterator[Tuple[str, dict]]:
+    """遍历所有文件的 (文件名, manifest)，使用 SCAN 不会阻塞 Redis
+
+    旧格式的文件是字符串值，与分块同为字符串，按键名区分；其 manifest 的 created 为 0。
+    """
+    prefix = len(self.manifest_key(''))
+    for key_type in ('hash', 'string'):
+      for key in r.scan_iter(match=self.manifest_key('*'), count=1000, _type=key_type):
+        name = key.decode()[prefix:]
+        if key_type == 'string' and CHUNK_SUFFIX_PATTERN.search(name):
+          continue
+        manifest = self.manifest(name)
+        if manifest is not None:
+          yield name, manifest
+
+  def delete_chunks(self, name: str, manifest: dict):
+    keys = [self.chunk_key(name, manifest['version'], i) for i in range(manifest['chunks'])]
+    for i in range(0, len(keys), 512):
+      r.delete(*keys[i:i + 512])
+
+  def delete(self, name: str):
+    manifest = self.manifest(name)
+    r.delete(self.manifest_key(name))
+    if manifest is not None:
+      self.delete_chunks(name, manifest)
+
+
+class FileSystemBlobWriter:
+  """写入共享目录的文件对象，先写临时文件，close 时原子重命名"""
+  def __init__(self, path: str):
+    self.path = path
+    self.tmp_path = f"{path}.{os.urandom(4).hex()}.tmp"
+    self.f = open(self.tmp_path, 'wb')
+
+  def write(self, data) -> int:
+    return self.f.write(data)
+
+  def flush(self):
+    self.f.flush()
+
+  def close(self):
+    if self.f.closed:
+      return
+    self.f.close()
+    os.replace(self.tmp_path, self.path)
+
+  def abort(self):
+    self.f.close()
+    if os.path.exists(self.tmp_path):
+      os.remove(self.tmp_path)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc, tb):
+    if exc_type is None:
+      self.close()
+    else:
+      self.abort()
+
+
+class FileSystemBlobStore:
+  """存放在共享文件系统 (如 NFS) 目录中的文件，接口与 RedisBlobStore 相同
+
+  文件不压缩，也不支持过期时间，无人引用的文件由 Web App 的清理线程回收。
+  """
+  def __init__(self, root: str = STORAGE_SHARED_DIR, chunk_size: int = STORAGE_CHUNK_SIZE):
+    self.root = root
+    self.chunk_size = chunk_size
+    os.makedirs(self.root, exist_ok=True)
+
+  def path(self, name: str) -> str:
+    return os.path.join(self.root, name)
+
+  def open_writer(self, name: str, ttl: int | None = None) -> FileSystemBlobWriter:
+    return FileSystemBlobWriter(self.path(name))
+
+  def put_file(self, name: str, path: str, ttl: int | None = None):
+    with open(path, 'rb') as f, self.open_writer(name) as writer:
+      shutil.copyfileobj(f, writer, self.chunk_size)
+
+  def iter_chunks(self, name: str) -> Iterator[bytes]:
+    if not os.path.exists(self.path(name)):
+      raise FileNotFoundError(f"文件 {name} 不存在")
+    with open(self.path(name), 'rb') as f:
+      while chunk := f.read(self.chunk_size):
+        yield chunk
+
+  def get_file(self, name: str, path: str):
+    with open(path, 'wb') as f:
+      for chunk in self.iter_chunks(name):
+        f.write(chunk)
+
+  def exists(self, name: str) -> bool:
+    return os.path.exists(self.path(name))
+
+  def expire(self, name: str, ttl: int | None):
+    pass
+
+  def iter_files(self) -> Iterator[Tuple[str, dict]]:
+    for entry in os.scandir(self.root):
+      if entry.is_file() and not entry.name.endswith('.tmp'):
+        stat = entry.stat()
+        yield entry.name, {'size': stat.st_size, 'stored': stat.st_size, 'codec': 'none', 'created': stat.st_mtime}
+
+  def delete(self, name: str):
+    if os.path.exists(self.path(name)):
+      os.remove(self.path(name))
+
+
+if STORAGE_BACKEND == 'filesystem':
+  blob_store = FileSystemBlobStore()
+else:
+  blob_store = RedisBlobStore()
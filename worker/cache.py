@@ -0,0 +1,258 @@
+from typing import Dict
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import time
+
+from masking import MASK_PROMPT
+from config import (
+  MASKING_ENABLED, MINERU_CACHE_DIR, MINERU_CACHE_ENABLED, MINERU_CACHE_MAX_SIZE_MB, MINERU_PATH, MODEL, PROMPTS,
+  SECTION_STORE_ENABLED, SECTION_STORE_IGNORE_PROMPT_CHANGE, SECTION_STORE_TTL,
+  TRANSLATION_CACHE_ENABLED, TRANSLATION_CACHE_MAX_ENTRIES, TRANSLATION_CACHE_TTL, r
+)
+
+
+class TranslationCache:
+  """以段落内容寻址的翻译缓存，存放在 Redis 中
+
+  键由缓存格式版本、段落原文、目标语言、模型、prompts 和是否遮盖公式代码 (及遮盖时附加的 prompt)
+  共同哈希得到，任何一项变化都不会命中旧缓存。分块设置变化时块的原文随之变化，不需要单独计入。
+  每个条目带 TTL，同时用一个按最近访问时间排序的有序集合限制条目总数 (LRU 淘汰)。
+  """
+  prefix = "cache:translation"
+  version = "2"  # 译文的生成方式改变时递增，使旧条目全部失效
+
+  def __init__(self, ttl: int = TRANSLATION_CACHE_TTL, max_entries: int = TRANSLATION_CACHE_MAX_ENTRIES):
+    self.ttl = ttl
+    self.max_entries = max_entries
+    self.lru_key = f"{self.prefix}:lru"
+    self.stats_key = f"{self.prefix}:stats"
+
+  def make_key(self, section: str, target_lang: str, masking: bool = MASKING_ENABLED) -> str:
+    """计算段落的缓存键"""
+    h = hashlib.sha256()
+    for part in (self.version, MODEL, PROMPTS, MASK_PROMPT if masking else "", target_lang, section):
+      h.update(part.encode('utf-8'))
+      h.update(b'\0')
+    return h.hexdigest()
+
+  def get(self, key: str) -> str | None:
+    """查询缓存，命中时刷新访问时间，并记录命中/未命中次数"""
+    value = r.get(f"{self.prefix}:{key}")
+    pipe = r.pipeline()
+    if value is None:
+      pipe.zrem(self.lru_key, key)  # 条目可能已因 TTL 过期
+      pipe.hincrby(self.stats_key, "misses", 1)
+    else:
+      pipe.expire(f"{self.prefix}:{key}", self.ttl)
+      pipe.zadd(self.lru_key, {key: time.time()})
+      pipe.hincrby(self.stats_key, "hits", 1)
+    pipe.execute()
+    return None if value is None else value.decode('utf-8')
+
+  def set(self, key: str, value: str):
+    """写入缓存，超出条目上限时淘汰最久未访问的条目"""
+    pipe = r.pipeline()
+    pipe.set(f"{self.prefix}:{key}", value.encode('utf-8'), ex=self.ttl)
+    pipe.zadd(self.lru_key, {key: time.time()})
+    pipe.zcard(self.lru_key)
+    overflow = pipe.execute()[-1] - self.max_entries
+    if overflow > 0:
+      evicted = [k.decode() for k, _ in r.zpopmin(self.lru_key, overflow)]
+      r.delete(*[f"{self.prefix}:{k}" for k in evicted])
+
+  def stats(self) -> dict:
+    """返回全局命中/未命中次数和当前条目数"""
+    counters = r.hgetall(self.stats_key)
+    return {
+      'hits': int(counters.get(b'hits', 0)),
+      'misses': int(counters.get(b'misses', 0)),
+      'entries': r.zcard(self.lru_key),
+    }
+
+
+translation_cache = TranslationCache() if TRANSLATION_CACHE_ENABLED else None
+
+# 文件名末尾的版本号，如 arXiv 的 2401.12345v2
+VERSION_PATTERN = re.compile(r'[_\-\s]?v\d+$', re.IGNORECASE)
+
+
+class SectionStore:
+  """按文档保存最近一次翻译的各段落译文，论文修订后只翻译新增或修改过的段落
+
+  同一提交者上传的、文件名去掉版本号后相同的 PDF 视为同一文档的不同版本，不同提交者的同名文档互不影响。新版本按标题切分为段落后，
+  标题和内容都与上一版本某段相同的段落直接沿用其译文。每篇文档的每种语言只保留最近一个版本，
+  存放在 Redis 哈希 `cache:sections:{文档}` 中，字段为段落原文的哈希。
+  """
+  prefix = "cache:sections"
+
+  def __init__(self, ttl: int = SECTION_STORE_TTL, ignore_prompt_change: bool = SECTION_STORE_IGNORE_PROMPT_CHANGE):
+    self.ttl = ttl
+    self.ignore_prompt_change = ignore_prompt_change
+
+  @staticmethod
+  def document_id(filename: str, submitter: str) -> str:
+    """文档 ID，由提交者和去掉版本号的文件名决定"""
+    name = VERSION_PATTERN.sub('', os.path.splitext(os.path.basename(filename))[0]).lower()
+    return f"{submitter}\0{name}"
+
+  def document_key(self, document: str, target_lang: str) -> str:
+    """文档在 Redis 中的键，由文档 ID、目标语言和模型 (以及 prompts) 决定"""
+    parts = [MODEL, target_lang, document] + ([] if self.ignore_prompt_change else [PROMPTS])
+    h = hashlib.sha256()
+    for part in parts:
+      h.update(part.encode('utf-8'))
+      h.update(b'\0')
+    return f"{self.prefix}:{h.hexdigest()}"
+
+  @staticmethod
+  def section_key(section: str) -> str:
+    """段落原文的哈希，段落以标题开头，因此同时比较了标题和内容；忽略空行和行尾空白的差异"""
+    lines = [line.rstrip() for line in section.strip().splitlines() if line.strip()]
+    return hashlib.sha256('\n'.join(lines).encode('utf-8')).hexdigest()
+
+  def load(self, document_key: str) -> Dict[str, str]:
+    """读取文档上一版本的段落译文，以段落哈希为键"""
+    return {
+      key.decode(): text.decode('utf-8')
+      for key, text in r.hgetall(document_key).items()
+    }
+
+  def save(self, document_key: str, translations: Dict[str, str]):
+    """用本次的段落译文替换上一版本"""
+    pipe = r.pipeline()
+    pipe.delete(document_key)
+    if translations:
+      pipe.hset(document_key, mapping={key: text.encode('utf-8') for key, text in translations.items()})
+      pipe.expire(document_key, self.ttl)
+    pipe.execute()
+
+
+section_store = SectionStore() if SECTION_STORE_ENABLED else None
+
+
+def _link_or_copy(src, dst):
+  """优先用硬链接代替复制，跨文件系统时退回到复制"""
+  try:
+    os.link(src, dst)
+  except OSError:
+    shutil.copy2(src, dst)
+
+
+class MineruCache:
+  """按 PDF 内容哈希缓存 MinerU 的转换结果 (markdown 和图片)，存放在本地磁盘
+
+  每个条目是缓存目录下的一个子目录，目录名由 PDF 哈希和 MinerU 版本/配置共同决定，
+  目录的 mtime 作为最近访问时间，总大小超出上限时淘汰最久未访问的条目。
+  总大小在写入时累加，只有估计值超出上限或距上次统计超过 rescan_interval (其他进程也会写入) 时
+  才遍历缓存目录重新统计并淘汰，淘汰到上限的 low_water 倍，之后的若干次写入不需要再遍历。
+  """
+  md_name = "content.md"
+  rescan_interval = 600
+  low_water = 0.9
+
+  def __init__(self, cache_dir: str = MINERU_CACHE_DIR, max_size_mb: int = MINERU_CACHE_MAX_SIZE_MB):
+    self.cache_dir = cache_dir
+    self.max_size = max_size_mb * 1024 * 1024
+    self._fingerprint = None
+    self.size = None  # 估计的总大小，None 表示还没有统计过
+    self.scanned_at = 0.0
+    os.makedirs(self.cache_dir, exist_ok=True)
+
+  def fingerprint(self) -> str:
+    """MinerU 的版本和配置文件内容，任一变化都会使旧缓存失效"""
+    if self._fingerprint is None:
+      h = hashlib.sha256()
+      try:
+        version = subprocess.run(
+          [MINERU_PATH, "--version"], capture_output=True, text=True, timeout=120
+        ).stdout.strip()
+      except Exception:
+        version = "unknown"
+      h.update(version.encode('utf-8'))
+      config_path = os.getenv("MINERU_TOOLS_CONFIG_JSON", os.path.expanduser("~/magic-pdf.json"))
+      if os.path.exists(config_path):
+        with open(config_path, 'rb') as f:
+          h.update(f.read())
+      self._fingerprint = h.hexdigest()[:16]
+    return self._fingerprint
+
+  def make_key(self, pdf_hash: str) -> str:
+    """计算 PDF 的缓存键"""
+    return f"{pdf_hash}-{self.fingerprint()}"
+
+  def contains(self, key: str) -> bool:
+    return os.path.isdir(os.path.join(self.cache_dir, key))
+
+  def restore(self, key: str, auto_dir: str, pdf_name: str) -> bool:
+    """命中时把缓存内容还原成 magic-pdf 的输出目录结构，返回是否命中"""
+    entry = os.path.join(self.cache_dir, key)
+    if not os.path.isdir(entry):
+      return False
+    try:
+      os.makedirs(auto_dir, exist_ok=True)
+      _link_or_copy(os.path.join(entry, self.md_name), os.path.join(auto_dir, f"{pdf_name}.md"))
+      images_dir = os.path.join(entry, "images")
+      if os.path.exists(images_dir):
+        shutil.copytree(images_dir, os.path.join(auto_dir, "images"), copy_function=_link_or_copy)
+      os.utime(entry)  # 刷新访问时间
+      return True
+    except Exception as e:
+      # 条目可能正被其他进程淘汰，视为未命中
+      print(f"读取 MinerU 缓存失败: {str(e)}")
+      shutil.rmtree(auto_dir, ignore_errors=True)
+      return False
+
+  def store(self, key: str, auto_dir: str, pdf_name: str):
+    """把 magic-pdf 的输出保存为缓存条目，写入临时目录后原子重命名"""
+    entry = os.path.join(self.cache_dir, key)
+    if os.path.isdir(entry):
+      return
+    staging = os.path.join(self.cache_dir, f".{key}.{os.urandom(4).hex()}")
+    try:
+      os.makedirs(staging)
+      _link_or_copy(os.path.join(auto_dir, f"{pdf_name}.md"), os.path.join(staging, self.md_name))
+      images_dir = os.path.join(auto_dir, "images")
+      if os.path.exists(images_dir):
+        shutil.copytree(images_dir, os.path.join(staging, "images"), copy_function=_link_or_copy)
+      os.rename(staging, entry)
+      if self.size is not None:
+        self.size += self.entry_size(entry)
+    except Exception as e:
+      print(f"写入 MinerU 缓存失败: {str(e)}")
+    finally:
+      shutil.rmtree(staging, ignore_errors=True)
+    if self.size is None or self.size > self.max_size or time.time() - self.scanned_at > self.rescan_interval:
+      self.evict()
+
+  @staticmethod
+  def entry_size(path: str) -> int:
+    return sum(
+      os.path.getsize(os.path.join(root, f))
+      for root, _, files in os.walk(path) for f in files
+    )
+
+  def evict(self):
+    """重新统计总大小，超出上限时按最近访问时间淘汰条目，直到不超过上限的 low_water 倍"""
+    entries = []
+    total = 0
+    for name in os.listdir(self.cache_dir):
+      path = os.path.join(self.cache_dir, name)
+      if name.startswith('.') or not os.path.isdir(path):
+        continue
+      size = self.entry_size(path)
+      entries.append((os.path.getmtime(path), size, path))
+      total += size
+    if total > self.max_size:
+      for _, size, path in sorted(entries):
+        if total <= self.max_size * self.low_water:
+          break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+    self.size = total
+    self.scanned_at = time.time()
+
+
+mineru_cache = MineruCache() if MINERU_CACHE_ENABLED else None
@@ -1,61 +1,133 @@
 from translate import Executor, ProgressTracker
-from celery import Celery
+from abort import TaskCancelled, abort_watcher
+from blob_store import blob_store
+from celery import Celery, chord, group, states
+from celery.signals import before_task_publish, task_postrun, task_prerun, worker_init, worker_process_shutdown
+from events import publish_event
+from metrics import TaskMetrics, check_pool, mark_process_dead, start_metrics_server
 from datetime import datetime
+import os
+import time
 from celery.contrib.abortable import AbortableTask
 
 # 加载配置
-from config import REDIS_URL
+from config import (
+  CONVERT_QUEUE, METRICS_ENABLED, REDIS_URL, STORAGE_FINISHED_UPLOAD_TTL, TRANSLATE_QUEUE, VISIBILITY_TIMEOUT, r
+)
 
 app = Celery(
   'pdf_tasks',
   broker=REDIS_URL,
-  backend=REDIS_URL,
+  # 与 redis 后端相同，任务结束时在结果中附带耗时明细，写入进度时不覆盖取消状态
+  backend=f"result_backend:ResultBackend+{REDIS_URL}",
   task_serializer='json',
   accept_content=['json'],
-  result_serializer='json'
+  result_serializer='json',
+  # Worker 崩溃时任务会被重新投递，需大于最长任务的执行时间，避免运行中的任务被重复投递
+  broker_transport_options={
+    'visibility_timeout': VISIBILITY_TIMEOUT,
+    # 按优先级分档投递，需要和 Web App 保持一致，数字越小越先执行。
+    # 不设置 queue_order_strategy: 它决定的是 Worker 轮询多个队列的顺序而不是消息的优先级，
+    # 设为 priority 时同时监听两个队列的 Worker 会先取空转换队列，翻译阶段在持续上传时会一直等待
+    'priority_steps': list(range(10)),
+  },
+  # 每次只预取一个任务，避免预取的低优先级任务抢在之后到达的高优先级任务前面
+  worker_prefetch_multiplier=1,
+  # MinerU 转换和翻译分别使用不同的队列，可以分别部署和扩容对应的 Worker
+  task_routes={
+    'celery_app.convert_pdf_to_markdown': {'queue': CONVERT_QUEUE},
+    'celery_app.convert_shard': {'queue': CONVERT_QUEUE},
+    'celery_app.merge_shards': {'queue': CONVERT_QUEUE},
+    'celery_app.discard_shards': {'queue': CONVERT_QUEUE},
+    'celery_app.translate_markdown': {'queue': TRANSLATE_QUEUE},
+    'celery_app.translate_language': {'queue': TRANSLATE_QUEUE},
+    'celery_app.package_translations': {'queue': TRANSLATE_QUEUE},
+    'celery_app.discard_translations': {'queue': TRANSLATE_QUEUE},
+  },
 )
 
-TRANSLATE_STEPS = [
-# (任务, 该任务完成前的进度, 该任务完成后的进度)
+CONVERT_STEPS = [
+# (任务, 该任务完成前的进度)
   (Executor.step1, 0),
   (Executor.step2, 1),
   (Executor.step3, 2),
-  (Executor.step4, 6),
-  (Executor.step5, 7),
-  (Executor.step6, 8, 98),
-  (Executor.step7, 98),
-  (Executor.step8, 99),
+  (Executor.step4, 97),
+  (Executor.step5, 98),
+  (Executor.step7, 99),
 ]
 
-CONVERT_STEPS = [
+# 需要翻译时，转换阶段只把 MinerU 的结果打包交给翻译阶段
+CONVERT_STAGE_STEPS = [
 # (任务, 该任务完成前的进度)
   (Executor.step1, 0),
   (Executor.step2, 1),
   (Executor.step3, 2),
-  (Executor.step4, 96),
-  (Executor.step5, 97),
-  (Executor.step7, 98),
-  (Executor.step8, 99),
+  (Executor.step4, 6),
+  (Executor.step5, 7),
+  (Executor.step7, 7),
+]
+
+# 分片只需要转换并打包，进度由 convert_shard 统一汇报到原任务
+SHARD_STEPS = [
+  Executor.step1,
+  Executor.step2,
+  Executor.step3,
+  Executor.step4,
+  Executor.step5,
+  Executor.step7,
+]
+
+TRANSLATE_STAGE_STEPS = [
+# (任务, 该任务完成前的进度, 该任务完成后的进度)
+  (Executor.step1, 8),
+  (Executor.step9, 8),
+  (Executor.step6, 9, 99),
+  (Executor.step7, 99),
+]
+
+# 同时翻译为多种语言时，每种语言由一个子任务翻译，进度按各语言的平均值汇报到原任务
+LANG_STEPS = [
+# (任务, 该任务完成前的进度, 该任务完成后的进度)
+  (Executor.step1, 8),
+  (Executor.step9, 8),
+  (Executor.step6, 9, 98),
+  (Executor.step12, 98),
 ]
 
-@app.task(base=AbortableTask, bind=True)
-def convert_pdf_to_markdown(self, filename: str, target_lang: str = None) -> str:
-  executor = Executor(filename, target_lang)
+# 所有语言翻译完成后，由打包任务把各语言的译文和转换结果打包为最终结果
+PACKAGE_STEPS = [
+  (Executor.step1, 98),
+  (Executor.step9, 98),
+  (Executor.step13, 99),
+  (Executor.step7, 99),
+]
+
+def run_steps(task, executor: Executor, steps) -> bool:
+  """依次执行各步骤并更新进度
+  Returns:
+    bool: False 表示被取消
+  """
+  # 登记到取消信号的订阅，任务被取消时立即终止 MinerU 进程和进行中的翻译请求
+  task_id = executor.root_id or task.request.id
+  executor.cancelled = abort_watcher.watch(task_id)
   try:
-    for step in CONVERT_STEPS if target_lang is None else TRANSLATE_STEPS:
-      if executor.progress(self, step[1]):
-        return "Aborted"
+    for step in steps:
+      if executor.progress(task, step[1]):
+        return False
+      start = time.perf_counter()
       if len(step)==3:
-        tracker = ProgressTracker(self, executor, step[1], step[2])
+        tracker = ProgressTracker(task, executor, step[1], step[2])
         step[0](executor, tracker)
       else:
         step[0](executor)
-    
-    executor.clean_up()
-    return f"{executor.pdf_name}.zip"
-  
+      executor.metrics.step(step[0].__name__, time.perf_counter() - start)
+    return True
+
+  except TaskCancelled:
+    executor.clean_up(remove_temp=True)
+    return False
   except Exception as e:
-    self.update_state(
+    task.update_state(
       state='FAILURE',
       meta={
         'exc_type': type(e).__name__,
@@ -65,4 +137,267 @@ def convert_pdf_to_markdown(self, filename: str, target_lang: str = None) -> str
         'timestamp': datetime.now().isoformat()
       }
     )
-    raise  # 重新抛出异常以便Celery记录失败状态
\ No newline at end of file
+    raise  # 重新抛出异常以便Celery记录失败状态
+  finally:
+    abort_watcher.unwatch(task_id)
+
+def task_priority(task) -> int:
+  """当前任务的优先级，后续阶段沿用该优先级"""
+  return (task.request.delivery_info or {}).get('priority') or 0
+
+def finish_conversion(
+  task, executor: Executor, filename: str, target_lang: str | list, force: bool = False, submitter: str = None
+) -> str:
+  """转换阶段结束: 不需要翻译时返回结果文件名，否则用翻译阶段的任务替换当前任务
+
+  target_lang 为多种语言时，替换为各语言并行翻译的子任务，全部完成后由打包任务生成最终结果。
+  """
+  executor.clean_up()
+  if target_lang is None:
+    blob_store.expire(filename, STORAGE_FINISHED_UPLOAD_TTL)  # 上传的 PDF 已不再需要
+    return f"{executor.pdf_name}.zip"
+  if executor.cancelled.is_set() or task.is_aborted():
+    # 转换的最后一步之后才被取消，不再启动翻译
+    blob_store.delete(executor.converted_name)
+    return "Aborted"
+  priority = task_priority(task)
+  langs = [target_lang] if isinstance(target_lang, str) else list(target_lang)
+  if len(langs) == 1:
+    raise task.replace(translate_markdown.si(filename, langs[0], force, submitter).set(priority=priority))
+  r.delete(f"langs:{task.request.id}")
+  raise task.replace(chord(
+    group(
+      translate_language.si(filename, lang, task.request.id, len(langs), force, submitter).set(priority=priority)
+      for lang in langs
+    ),
+    package_translations.s(filename, langs).set(priority=priority)
+      .on_error(discard_translations.si(filename, langs, task.request.id)),
+  ))
+
+# acks_late: 任务执行完才确认，Worker 崩溃或重启后任务会被重新投递并从断点继续
+@app.task(base=AbortableTask, bind=True, acks_late=True, reject_on_worker_lost=True)
+def convert_pdf_to_markdown(
+  self, filename: str, target_lang: str | list = None, force: bool = False, title: str = None,
+  submitter: str = None,
+) -> str:
+  """转换阶段，在 CONVERT_QUEUE 上执行 MinerU 转换
+
+  需要翻译时，转换完成后用翻译阶段的任务替换自身，替换后的任务沿用同一个任务 ID，
+  因此 Web App 通过原任务 ID 即可看到整个流程的进度和最终结果。
+  页数较多的 PDF 会按页拆分为多个分片，由多个 Worker 并行转换后再合并。
+  force 为 True 时翻译阶段不沿用同一文档上一版本的译文，完整重新翻译。
+  filename 是 blob_store 中的文件名 (Web App 以任务 ID 命名)，title 是用户上传时的文件名，用于结果中的文件命名。
+  submitter 为提交者，同一提交者的同名文档才沿用上一版本的译文，未传入时不沿用。
+  """
+  executor = Executor(filename, target_lang, self.request.id, title)
+  steps = CONVERT_STEPS if target_lang is None else CONVERT_STAGE_STEPS
+  if not run_steps(self, executor, steps[:2] + [(Executor.step10, steps[2][1])]):
+    return "Aborted"
+
+  if executor.shard_names:
+    # 各分片并行转换，全部完成后由 merge_shards 合并，merge_shards 沿用当前任务 ID
+    r.set(f"shards:{self.request.id}", 0, ex=VISIBILITY_TIMEOUT)
+    progress_range = (steps[2][1], steps[3][1])
+    shard_count = len(executor.shard_names)
+    executor.clean_up()
+    priority = task_priority(self)
+    raise self.replace(chord(
+      group(
+        convert_shard.si(name, self.request.id, shard_count, progress_range).set(priority=priority)
+        for name in executor.shard_names
+      ),
+      merge_shards.s(filename, target_lang, executor.pdf_hash, force, title, submitter).set(priority=priority)
+        .on_error(discard_shards.si(executor.shard_names, self.request.id)),
+    ))
+
+  if not run_steps(self, executor, steps[2:]):
+    return "Aborted"
+  return finish_conversion(self, executor, filename, target_lang, force, submitter)
+
+def shard_result_name(shard_filename: str) -> str:
+  """分片转换结果的文件名"""
+  return f"{os.path.splitext(shard_filename)[0]}.zip"
+
+def shards_failed(root_id: str) -> bool:
+  """是否已有分片转换失败，此时其余分片的结果不会被合并"""
+  return r.exists(f"shards:{root_id}:failed") > 0
+
+@app.task(base=AbortableTask, bind=True, acks_late=True, reject_on_worker_lost=True)
+def convert_shard(self, shard_filename: str, root_id: str, shard_count: int, progress_range) -> str | None:
+  """转换一个分片并把结果打包上传，完成后更新原任务的进度
+  Returns:
+    str|None: 分片结果的文件名，None 表示原任务已被取消或其他分片已经失败
+  """
+  executor = Executor(shard_filename, None, self.request.id)
+  executor.metrics = TaskMetrics(root_id, prefix='shard_')  # 分片的明细汇总到原任务
+  executor.shard = True
+  executor.cancelled = abort_watcher.watch(root_id)
+  try:
+    for step in SHARD_STEPS:
+      if executor.cancelled.is_set() or self.is_aborted(task_id=root_id) or shards_failed(root_id):
+        raise TaskCancelled()
+      start = time.perf_counter()
+      step(executor)
+      executor.metrics.step(step.__name__, time.perf_counter() - start)
+  except TaskCancelled:
+    executor.clean_up(remove_temp=True)
+    blob_store.delete(shard_filename)
+    return None
+  finally:
+    abort_watcher.unwatch(root_id)
+  executor.clean_up()
+  blob_store.delete(shard_filename)
+  if shards_failed(root_id):
+    # 转换期间其他分片失败，discard_shards 可能已经清理过，结果不会再被使用
+    blob_store.delete(shard_result_name(shard_filename))
+    return None
+
+  done = r.incr(f"shards:{root_id}")
+  start, end = progress_range
+  progress = start + int((end - start) * done / shard_count)
+  if not self.backend.store_progress(root_id, {
+    'progress': progress,
+    'status': f'处理中... {progress}%',
+    'timestamp': datetime.now().isoformat()
+  }):
+    # 转换期间原任务被取消
+    blob_store.delete(shard_result_name(shard_filename))
+    return None
+  publish_event(root_id, 'PROGRESS', progress=progress)
+  return shard_result_name(shard_filename)
+
+@app.task
+def discard_shards(shard_filenames: list, root_id: str):
+  """某个分片转换失败时 chord 不会执行 merge_shards，由此删除所有分片的 PDF 和已上传的结果
+
+  同时留下失败标记，尚未开始的分片直接跳过，仍在转换的分片完成后自行删除结果。
+  """
+  r.set(f"shards:{root_id}:failed", 1, ex=VISIBILITY_TIMEOUT)
+  r.delete(f"shards:{root_id}")
+  for name in shard_filenames:
+    blob_store.delete(name)
+    blob_store.delete(shard_result_name(name))
+
+@app.task(base=AbortableTask, bind=True, acks_late=True, reject_on_worker_lost=True)
+def merge_shards(
+  self, shard_results: list, filename: str, target_lang: str | list, pdf_hash: str, force: bool = False,
+  title: str = None, submitter: str = None,
+) -> str:
+  """合并各分片的转换结果，之后的流程与不拆分时相同"""
+  r.delete(f"shards:{self.request.id}")
+  executor = Executor(filename, target_lang, self.request.id, title)
+  if None in shard_results:
+    for name in shard_results:
+      if name is not None:
+        blob_store.delete(name)
+    return "Aborted"
+  executor.shard_names = shard_results
+  executor.pdf_hash = pdf_hash
+  steps = CONVERT_STEPS if target_lang is None else CONVERT_STAGE_STEPS
+  if not run_steps(self, executor, [(Executor.step1, steps[3][1]), (Executor.step11, steps[3][1])] + steps[3:]):
+    return "Aborted"
+  return finish_conversion(self, executor, filename, target_lang, force, submitter)
+
+@app.task(base=AbortableTask, bind=True, acks_late=True, reject_on_worker_lost=True)
+def translate_markdown(self, filename: str, target_lang: str, force: bool = False, submitter: str = None) -> str:
+  """翻译阶段，在 TRANSLATE_QUEUE 上翻译转换阶段产出的 markdown 并打包最终结果"""
+  executor = Executor(filename, target_lang, self.request.id)
+  executor.force = force
+  executor.submitter = submitter
+  finished = run_steps(self, executor, TRANSLATE_STAGE_STEPS)
+  blob_store.delete(executor.converted_name)  # 中间结果已不再需要
+  if not finished:
+    return "Aborted"
+  executor.clean_up()
+  blob_store.expire(filename, STORAGE_FINISHED_UPLOAD_TTL)  # 上传的 PDF 已不再需要
+  return f"{executor.pdf_name}.zip"
+
+
+def task_metrics(task) -> TaskMetrics:
+  """任务所属的原任务的耗时明细，各阶段和分片都以 Web App 提交的原任务为根任务"""
+  root_id = task.request.root_id or task.request.id
+  return TaskMetrics(root_id, prefix='shard_' if task.name == convert_shard.name else '')
+
+@app.task(base=AbortableTask, bind=True, acks_late=True, reject_on_worker_lost=True)
+def translate_language(
+  self, filename: str, target_lang: str, root_id: str, lang_count: int, force: bool = False,
+  submitter: str = None,
+) -> str | None:
+  """多语言翻译中的一种语言: 翻译转换阶段产出的 markdown 并上传译文
+  Returns:
+    str|None: 译文的文件名，None 表示原任务已被取消
+  """
+  executor = Executor(filename, target_lang, self.request.id)
+  executor.metrics = TaskMetrics(root_id)  # 明细汇总到原任务
+  executor.root_id = root_id
+  executor.lang_count = lang_count
+  executor.force = force
+  executor.submitter = submitter
+  if not run_steps(self, executor, LANG_STEPS):
+    blob_store.delete(executor.translation_name(target_lang))
+    return None
+  executor.clean_up()
+  return executor.translation_name(target_lang)
+
+@app.task
+def discard_translations(filename: str, target_langs: list, root_id: str):
+  """某种语言翻译失败时 chord 不会执行 package_translations，由此删除转换结果和已上传的各语言译文"""
+  executor = Executor(filename, target_langs, root_id)
+  blob_store.delete(executor.converted_name)
+  for lang in target_langs:
+    blob_store.delete(executor.translation_name(lang))
+  r.delete(f"langs:{root_id}")
+
+@app.task(base=AbortableTask, bind=True, acks_late=True, reject_on_worker_lost=True)
+def package_translations(self, translation_names: list, filename: str, target_langs: list) -> str:
+  """把各语言的译文和转换结果打包为最终结果，沿用原任务 ID"""
+  executor = Executor(filename, target_langs, self.request.id)
+  finished = None not in translation_names and run_steps(self, executor, PACKAGE_STEPS)
+  # 中间结果已不再需要
+  blob_store.delete(executor.converted_name)
+  for name in translation_names:
+    if name is not None:
+      blob_store.delete(name)
+  r.delete(f"langs:{self.request.id}")
+  if not finished:
+    return "Aborted"
+  executor.clean_up()
+  blob_store.expire(filename, STORAGE_FINISHED_UPLOAD_TTL)  # 上传的 PDF 已不再需要
+  return f"{executor.pdf_name}.zip"
+
+
+@before_task_publish.connect
+def stamp_enqueue_time(headers=None, **kwargs):
+  """记录入队时间，用于统计排队等待时间，阶段替换和分片产生的新任务重新记录"""
+  headers.setdefault('enqueued_at', time.time())
+
+@task_prerun.connect
+def record_queue_wait(task=None, **kwargs):
+  enqueued_at = task.request.get('enqueued_at')
+  if enqueued_at is not None:
+    queue = (task.request.delivery_info or {}).get('routing_key') or ''
+    task_metrics(task).queue_wait(queue, max(0, time.time() - enqueued_at))
+
+@task_postrun.connect
+def publish_task_result(task_id=None, task=None, retval=None, state=None, **kwargs):
+  """任务结束时推送最终状态并删除 Redis 中的明细，被替换为下一阶段的任务 (IGNORED) 不推送
+
+  耗时明细已由 ResultBackend (见 result_backend.py) 随结果一起保存，并记在 request.metrics 上。
+  """
+  if state in states.READY_STATES and task.request.root_id in (None, task_id):
+    breakdown = task.request.get('metrics') or {}
+    try:
+      TaskMetrics(task_id).clear()
+    except Exception as e:
+      print(f"删除任务指标失败: {str(e)}")
+    publish_event(task_id, state, result=retval if state == states.SUCCESS else None, metrics=breakdown)
+
+@worker_init.connect
+def start_metrics(sender=None, **kwargs):
+  if METRICS_ENABLED:
+    check_pool(getattr(sender, 'pool_cls', ''))
+    start_metrics_server()
+
+@worker_process_shutdown.connect
+def clean_up_process_metrics(pid=None, **kwargs):
+  mark_process_dead(pid)
@@ -0,0 +1,46 @@
+from typing import Dict
+
+from config import CHECKPOINT_TTL, r
+
+
+class Checkpoint:
+  """任务的断点信息，Worker 崩溃或任务被重新投递后据此继续执行
+
+  `checkpoint:{task_id}` 记录 MinerU 输出所在的临时目录等信息，
+  `checkpoint:{task_id}:sections` 按分块序号记录已经完成的译文。
+  """
+  def __init__(self, task_id: str, ttl: int = CHECKPOINT_TTL):
+    self.key = f"checkpoint:{task_id}"
+    self.sections_key = f"checkpoint:{task_id}:sections"
+    self.ttl = ttl
+
+  def get(self, field: str) -> str | None:
+    value = r.hget(self.key, field)
+    return None if value is None else value.decode('utf-8')
+
+  def set(self, **fields):
+    pipe = r.pipeline()
+    pipe.hset(self.key, mapping=fields)
+    pipe.expire(self.key, self.ttl)
+    pipe.execute()
+
+  def load_sections(self, source_hash: str) -> Dict[int, str]:
+    """读取已完成的译文；原文分块发生变化时丢弃旧的译文"""
+    if self.get('source') != source_hash:
+      r.delete(self.sections_key)
+      self.set(source=source_hash)
+      return {}
+    return {
+      int(i): text.decode('utf-8')
+      for i, text in r.hgetall(self.sections_key).items()
+    }
+
+  def save_section(self, i: int, text: str):
+    """保存第 i 个分块的译文"""
+    pipe = r.pipeline()
+    pipe.hset(self.sections_key, i, text.encode('utf-8'))
+    pipe.expire(self.sections_key, self.ttl)
+    pipe.execute()
+
+  def clear(self):
+    r.delete(self.key, self.sections_key)
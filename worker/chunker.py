@@ -0,0 +1,163 @@
+import math
+import re
+from typing import List, Tuple
+
+from config import CHUNK_MAX_TOKENS
+
+# 确保#后面有空格，避免匹配代码中的注释
+HEADER_PATTERN = re.compile(r'^#{1,6}\s+.+$')
+FENCE_PATTERN = re.compile(r'^\s*(`{3,}|~{3,})')
+CJK_PATTERN = re.compile(r'[぀-ヿ㐀-䶿一-鿿가-힯＀-￯]')
+SENTENCE_PATTERN = re.compile(r'(?<=[.!?。！？])\s+')
+
+# 块的类型: 标题、普通文本，以及不能从中间拆开的代码块、公式块、表格、HTML 块
+HEADING, TEXT, ATOMIC = 'heading', 'text', 'atomic'
+
+
+def estimate_tokens(text: str) -> int:
+  """粗略估计文本的 token 数: 中日韩字符约 1 字符 1 token，其余约 4 字符 1 token"""
+  cjk = len(CJK_PATTERN.findall(text))
+  return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def _collect_until(lines, i, is_end):
+  """从第 i 行开始收集，直到 is_end 返回 True 的那一行 (包含该行) 或文件结尾"""
+  j = i + 1
+  while j < len(lines) and not is_end(lines[j]):
+    j += 1
+  return min(j + 1, len(lines))
+
+
+def parse_blocks(markdown_content: str) -> List[Tuple[str, str]]:
+  """把 markdown 解析为 (类型, 文本) 块的列表，按换行拼接所有块可以还原原文"""
+  lines = markdown_content.split('\n')
+  blocks = []
+  i = 0
+  while i < len(lines):
+    line = lines[i]
+    stripped = line.strip()
+    fence = FENCE_PATTERN.match(line)
+    if fence:
+      marker = fence.group(1)
+      end = _collect_until(lines, i, lambda l: l.strip().startswith(marker))
+      kind = ATOMIC
+    elif stripped.startswith('$$'):
+      if len(stripped) > 2 and stripped.endswith('$$'):
+        end = i + 1
+      else:
+        end = _collect_until(lines, i, lambda l: l.strip().endswith('$$'))
+      kind = ATOMIC
+    elif stripped.startswith('|'):
+      end = i + 1
+      while end < len(lines) and lines[end].strip().startswith('|'):
+        end += 1
+      kind = ATOMIC
+    elif stripped.startswith('<html') or stripped.startswith('<table'):
+      closing = '</html>' if stripped.startswith('<html') else '</table>'
+      if closing in line:
+        end = i + 1
+      else:
+        end = _collect_until(lines, i, lambda l: closing in l)
+      kind = ATOMIC
+    elif HEADER_PATTERN.match(line):
+      end = i + 1
+      kind = HEADING
+    elif not stripped:
+      # 空行附加到前一个块上
+      if blocks:
+        blocks[-1] = (blocks[-1][0], blocks[-1][1] + '\n' + line)
+      else:
+        blocks.append((TEXT, line))
+      i += 1
+      continue
+    else:
+      end = i + 1
+      while end < len(lines):
+        nxt = lines[end]
+        s = nxt.strip()
+        if (not s or FENCE_PATTERN.match(nxt) or s.startswith('$$') or s.startswith('|')
+            or s.startswith('<html') or s.startswith('<table') or HEADER_PATTERN.match(nxt)):
+          break
+        end += 1
+      kind = TEXT
+    blocks.append((kind, '\n'.join(lines[i:end])))
+    i = end
+  return blocks
+
+
+def split_sections(markdown_content: str) -> List[str]:
+  """将markdown内容按照标题分段，代码块等内部形似标题的行不会被当作标题"""
+  sections = []
+  current_section = []
+  for kind, text in parse_blocks(markdown_content):
+    if kind == HEADING and current_section:
+      sections.append('\n'.join(current_section))
+      current_section = []
+    current_section.append(text)
+  if current_section:
+    sections.append('\n'.join(current_section))
+  return sections
+
+
+def _pack_groups(pieces: List[str], max_tokens: int, sep: str = '\n') -> List[List[int]]:
+  """按顺序把若干片段分组，每组不超过 token 预算，单个超出预算的片段独占一组，返回各组的片段序号
+
+  拼接片段的分隔符也计入预算，否则按空格拼接的大量短片段会明显超出预算。
+  """
+  groups = []
+  current, current_tokens = [], 0
+  for i, piece in enumerate(pieces):
+    tokens = estimate_tokens(sep + piece) if current else estimate_tokens(piece)
+    if current and current_tokens + tokens > max_tokens:
+      groups.append(current)
+      current, current_tokens = [], 0
+      tokens = estimate_tokens(piece)
+    current.append(i)
+    current_tokens += tokens
+  if current:
+    groups.append(current)
+  return groups
+
+
+def _pack(pieces: List[str], max_tokens: int, sep: str) -> List[str]:
+  """按顺序把若干片段合并成不超过 token 预算的块，单个超出预算的片段独占一块"""
+  return [sep.join(pieces[i] for i in group) for group in _pack_groups(pieces, max_tokens, sep)]
+
+
+def _split_section(section: str, max_tokens: int) -> List[str]:
+  """把超出预算的段落按块拆分，超长的普通文本块再按句子拆分"""
+  pieces = []
+  for kind, text in parse_blocks(section):
+    if kind == TEXT and estimate_tokens(text) > max_tokens:
+      sentences = []
+      for sentence in SENTENCE_PATTERN.split(text):
+        if estimate_tokens(sentence) > max_tokens:
+          sentences.extend(sentence.split(' '))  # 没有句读的超长文本退化为按空格拆分
+        else:
+          sentences.append(sentence)
+      pieces.extend(_pack(sentences, max_tokens, ' '))
+    else:
+      pieces.append(text)  # 代码块、公式块、表格即使超出预算也不拆开
+  return _pack(pieces, max_tokens, '\n')
+
+
+def chunk_sections(sections: List[str], max_tokens: int = CHUNK_MAX_TOKENS) -> List[Tuple[str, List[int]]]:
+  """按 token 预算把连续的若干段落切分为块，返回各块的文本及其涉及的段落序号
+
+  相邻的小段落合并成一块以减少请求次数，超出预算的段落再按块和句子拆分，
+  代码块、$$ 公式块、表格和 HTML 块不会被拆开。
+  """
+  pieces, owners = [], []
+  for i, section in enumerate(sections):
+    parts = _split_section(section, max_tokens) if estimate_tokens(section) > max_tokens else [section]
+    pieces.extend(parts)
+    owners.extend([i] * len(parts))
+  return [
+    ('\n'.join(pieces[j] for j in group), list(dict.fromkeys(owners[j] for j in group)))
+    for group in _pack_groups(pieces, max_tokens)
+  ]
+
+
+def chunk_markdown(markdown_content: str, max_tokens: int = CHUNK_MAX_TOKENS) -> List[str]:
+  """按 token 预算切分 markdown，用于逐块发送给大模型翻译，优先在标题处切分"""
+  return [chunk for chunk, _ in chunk_sections(split_sections(markdown_content), max_tokens)]
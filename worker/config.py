@@ -8,10 +8,60 @@ import redis
 config = OmegaConf.load('config.yaml')
 
 REDIS_URL=f"redis://{config.redis.host}:{config.redis.port}/{config.redis.db}"
+CONVERT_QUEUE=config.queues.convert
+TRANSLATE_QUEUE=config.queues.translate
 CLEAN_UP_TEMP=config.settings.cleanup_temp
 MINERU_PATH=config.settings.mineru_path
+MINERU_SERVICE_ENABLED=config.mineru_service.enabled
+MINERU_SERVICE_PYTHON=config.mineru_service.python
+MINERU_SERVICE_PORT=int(config.mineru_service.port)
+MINERU_SERVICE_AUTHKEY=config.mineru_service.authkey
+MINERU_SERVICE_CONCURRENCY=int(config.mineru_service.concurrency)
+MINERU_SERVICE_STARTUP_TIMEOUT=int(config.mineru_service.startup_timeout)
 TEMP_DIR=config.settings.temp_dir
+CHECKPOINT_TTL=int(config.settings.checkpoint_ttl)
+VISIBILITY_TIMEOUT=int(config.settings.visibility_timeout)
+TASK_EVENTS_CHANNEL=config.events.channel
+TASK_ABORT_CHANNEL=config.events.abort_channel
 MODEL=config.api.model
+STORAGE_BACKEND=config.storage.backend
+STORAGE_CHUNK_SIZE=int(config.storage.chunk_size_kb) * 1024
+STORAGE_SHARED_DIR=config.storage.shared_dir
+STORAGE_COMPRESSION=config.storage.compression
+STORAGE_COMPRESSION_LEVEL=int(config.storage.compression_level)
+STORAGE_RESULT_TTL=int(config.storage.result_ttl)
+STORAGE_INTERMEDIATE_TTL=int(config.storage.intermediate_ttl)
+STORAGE_FINISHED_UPLOAD_TTL=int(config.storage.finished_upload_ttl)
+TRANSLATE_CONCURRENCY=int(config.api.concurrency)
+MAX_OUTPUT_TOKENS=int(config.api.max_tokens)
+API_TIMEOUT=float(config.api.timeout)
+RATE_LIMIT_RPM=int(config.rate_limit.rpm)
+RATE_LIMIT_TPM=int(config.rate_limit.tpm)
+RATE_LIMIT_BURST=float(config.rate_limit.burst)
+RATE_LIMIT_MAX_RETRIES=int(config.rate_limit.max_retries)
+RATE_LIMIT_BACKOFF_BASE=float(config.rate_limit.backoff_base)
+RATE_LIMIT_BACKOFF_MAX=float(config.rate_limit.backoff_max)
+RATE_LIMIT_DECREASE=float(config.rate_limit.decrease)
+RATE_LIMIT_MIN_SCALE=float(config.rate_limit.min_scale)
+RATE_LIMIT_RECOVERY=float(config.rate_limit.recovery)
+CHUNK_MAX_TOKENS=int(config.chunking.max_tokens)
+MASKING_ENABLED=config.masking.enabled
+MASKING_SKIP_REFERENCES=config.masking.skip_references
+SHARDING_ENABLED=config.sharding.enabled
+SHARD_MIN_PAGES=int(config.sharding.min_pages)
+SHARD_PAGES=int(config.sharding.shard_pages)
+TRANSLATION_CACHE_ENABLED=config.cache.translation.enabled
+TRANSLATION_CACHE_TTL=int(config.cache.translation.ttl)
+TRANSLATION_CACHE_MAX_ENTRIES=int(config.cache.translation.max_entries)
+SECTION_STORE_ENABLED=config.cache.sections.enabled
+SECTION_STORE_TTL=int(config.cache.sections.ttl)
+SECTION_STORE_IGNORE_PROMPT_CHANGE=config.cache.sections.ignore_prompt_change
+MINERU_CACHE_ENABLED=config.cache.mineru.enabled
+MINERU_CACHE_DIR=config.cache.mineru.dir
+MINERU_CACHE_MAX_SIZE_MB=int(config.cache.mineru.max_size_mb)
+METRICS_ENABLED=config.metrics.enabled
+METRICS_PORT=int(config.metrics.port)
+METRICS_MULTIPROC_DIR=config.metrics.multiproc_dir
 
 # 拼接 prompts
 PROMPTS = ""
@@ -31,8 +81,10 @@ r = redis.Redis(
 # 加载 .env 环境变量
 load_dotenv()
 
-# 连接 LLM
+# 连接 LLM，重试由 rate_limit 统一控制，客户端自身不重试
 client = OpenAI(
   api_key=os.getenv("API_KEY"),
-  base_url=config.api.base_url
+  base_url=config.api.base_url,
+  max_retries=0,
+  timeout=API_TIMEOUT,
 )
\ No newline at end of file
@@ -0,0 +1,19 @@
+from datetime import datetime
+import json
+
+from config import TASK_EVENTS_CHANNEL, r
+
+
+def publish_event(task_id: str, state: str, **fields):
+  """在 Redis pub/sub 频道上发布任务的进度或状态变化，Web App 订阅后只刷新受影响的任务"""
+  event = {
+    'id': task_id,
+    'state': state,
+    'timestamp': datetime.now().isoformat(),
+    **fields,
+  }
+  try:
+    r.publish(TASK_EVENTS_CHANNEL, json.dumps(event))
+  except Exception as e:
+    # 推送失败时 Web App 仍会定期轮询，不影响任务执行
+    print(f"发布任务事件失败: {str(e)}")
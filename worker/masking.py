@@ -0,0 +1,68 @@
+import re
+from collections import Counter
+from typing import List, Tuple
+
+from chunker import ATOMIC, parse_blocks
+
+# 占位符使用正文中几乎不会出现的括号，大模型也容易原样保留
+PLACEHOLDER = '⟦{}⟧'
+PLACEHOLDER_PATTERN = re.compile(r'⟦\s*(\d+)\s*⟧')
+
+# 行内不需要翻译的内容: 图片链接、行内代码、行内的 $$ 公式、$ 公式和 \( \) 公式
+INLINE_PATTERN = re.compile(
+  r'!\[[^\]\n]*\]\([^)\n]*\)'
+  r'|`[^`\n]+`'
+  r'|\$\$[^$\n]+\$\$'
+  r'|(?<![\\$])\$(?![\s$])[^$\n]+?(?<![\s\\])\$(?!\d)'  # 与金额区分: $ 内侧不能是空白，结尾后不能紧跟数字
+  r'|\\\(.+?\\\)'
+)
+
+# 参考文献段落的标题
+REFERENCES_PATTERN = re.compile(
+  r'^#{1,6}\s+(?:[\dIVX]+\.?\s*)?(?:references|bibliography|works cited|参考文献)\s*$',
+  re.IGNORECASE
+)
+
+# 告诉大模型保留占位符，附加在 prompts 之后
+MASK_PROMPT = '文中形如⟦0⟧的占位符代表公式、代码、表格等不需要翻译的内容，必须原样保留在译文中的对应位置。'
+
+
+def is_references(section: str) -> bool:
+  """段落是否为参考文献"""
+  return bool(REFERENCES_PATTERN.match(section.lstrip().split('\n', 1)[0].strip()))
+
+
+def mask(text: str) -> Tuple[str, List[str]]:
+  """把公式、代码块、HTML 块和图片链接等替换为占位符
+  Returns:
+    (替换后的文本, 按占位符序号排列的原文)，文本本身含有占位符时不做替换
+  """
+  if PLACEHOLDER_PATTERN.search(text):
+    return text, []
+  spans = []
+
+  def replace(span: str) -> str:
+    placeholder = PLACEHOLDER.format(len(spans))
+    if len(placeholder) >= len(span):
+      return span  # 比占位符还短的内容不替换
+    spans.append(span)
+    return placeholder
+
+  blocks = []
+  for kind, block in parse_blocks(text):
+    content = block.rstrip()
+    # 表格中的文字仍需要翻译，只替换其中的行内内容
+    if kind == ATOMIC and not content.lstrip().startswith('|'):
+      indent = content[:len(content) - len(content.lstrip())]
+      blocks.append(indent + replace(content.lstrip()) + block[len(content):])
+    else:
+      blocks.append(INLINE_PATTERN.sub(lambda m: replace(m.group(0)), block))
+  return '\n'.join(blocks), spans
+
+
+def unmask(text: str, spans: List[str]) -> str | None:
+  """把译文中的占位符还原为原文，占位符缺失、重复或多出时返回 None"""
+  counts = Counter(int(m.group(1)) for m in PLACEHOLDER_PATTERN.finditer(text))
+  if counts != Counter(range(len(spans))):
+    return None
+  return PLACEHOLDER_PATTERN.sub(lambda m: spans[int(m.group(1))], text)
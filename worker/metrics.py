@@ -0,0 +1,160 @@
+"""Worker 的 Prometheus 指标，以及按任务汇总的耗时明细"""
+import os
+import shutil
+
+from config import CHECKPOINT_TTL, METRICS_MULTIPROC_DIR, METRICS_PORT, r
+
+# 多进程模式必须在导入 prometheus_client 之前设置，prefork 的各子进程把指标写入该目录，由主进程汇总导出
+if METRICS_MULTIPROC_DIR:
+  os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', METRICS_MULTIPROC_DIR)
+
+from prometheus_client import CollectorRegistry, Counter, Histogram, multiprocess, start_http_server
+
+STEP_SECONDS = Histogram(
+  'pdf2zh_step_seconds', 'Executor 各步骤的耗时 (秒)', ['step'],
+  buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600),
+)
+LLM_REQUEST_SECONDS = Histogram(
+  'pdf2zh_llm_request_seconds', '单次大模型请求的耗时 (秒)',
+  buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300),
+)
+LLM_REQUESTS = Counter(
+  'pdf2zh_llm_requests_total', '翻译段落数，result 为 ok、cached (命中翻译缓存)、rate_limited (429) 或 error', ['result']
+)
+LLM_THROTTLE_SECONDS = Counter('pdf2zh_llm_throttle_seconds_total', '请求前等待集群限流的总时间 (秒)')
+LLM_TOKENS = Counter('pdf2zh_llm_tokens_total', '大模型消耗的 token 数，kind 为 prompt 或 completion', ['kind'])
+TOKENS_SAVED = Counter(
+  'pdf2zh_tokens_saved_total', '估算的节省的原文 token 数，kind 为 masked (替换为占位符) 或 references (跳过参考文献)', ['kind']
+)
+SECTIONS_REUSED = Counter('pdf2zh_sections_reused_total', '增量翻译时沿用上一版本译文的段落数')
+TRANSFER_BYTES = Counter('pdf2zh_transfer_bytes_total', '经 blob_store 传输的字节数，direction 为 download 或 upload', ['direction'])
+QUEUE_WAIT_SECONDS = Histogram(
+  'pdf2zh_queue_wait_seconds', '任务从入队到开始执行的等待时间 (秒)', ['queue'],
+  buckets=(1, 5, 10, 30, 60, 300, 600, 1800, 3600, 7200, 21600),
+)
+
+
+def check_pool(pool) -> None:
+  """prefork 的子进程各自记录指标，未设置 multiproc_dir 时主进程导出的指标始终为空，直接拒绝启动
+  Args:
+    pool: Worker 的进程池，名称或实现类
+  """
+  name = pool if isinstance(pool, str) else getattr(pool, '__module__', '')
+  if not METRICS_MULTIPROC_DIR and ('prefork' in name or name == 'processes'):
+    raise SystemExit(
+      "metrics.enabled 为 true 时使用 prefork 进程池需要设置 metrics.multiproc_dir，"
+      "或改用 --pool=threads / --pool=solo，或关闭 metrics.enabled"
+    )
+
+
+def start_metrics_server():
+  """在 Worker 主进程中启动指标导出的 HTTP 服务"""
+  if METRICS_MULTIPROC_DIR:
+    # 清理上次运行留下的指标文件，避免已退出进程的计数被重复汇总
+    shutil.rmtree(METRICS_MULTIPROC_DIR, ignore_errors=True)
+    os.makedirs(METRICS_MULTIPROC_DIR, exist_ok=True)
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    start_http_server(METRICS_PORT, registry=registry)
+  else:
+    start_http_server(METRICS_PORT)
+
+
+def mark_process_dead(pid: int):
+  """prefork 子进程退出时清理其仍在变化的指标 (如 Gauge)，多进程模式下才需要"""
+  if METRICS_MULTIPROC_DIR:
+    multiprocess.mark_process_dead(pid)
+
+
+class CountingWriter:
+  """统计写入字节数的文件对象包装"""
+  def __init__(self, fileobj):
+    self.fileobj = fileobj
+    self.bytes = 0
+
+  def write(self, data) -> int:
+    self.bytes += len(data)
+    return self.fileobj.write(data)
+
+  def flush(self):
+    self.fileobj.flush()
+
+
+class TaskMetrics:
+  """记录一个任务的耗时明细并更新 Prometheus 指标
+
+  明细累加在 Redis 哈希 `metrics:{task_id}` 中，转换、翻译两个阶段和各个分片在不同的 Worker 上执行，
+  只要使用原任务 ID 就会汇总到一起。累加使用 HINCRBYFLOAT，可以在翻译线程中并发调用。
+  """
+  def __init__(self, task_id: str, prefix: str = '', ttl: int = CHECKPOINT_TTL):
+    self.key = f"metrics:{task_id}"
+    self.prefix = prefix  # 分片的明细加上前缀，与原任务自身的步骤区分
+    self.ttl = ttl
+
+  def add(self, **fields):
+    try:
+      pipe = r.pipeline()
+      for field, value in fields.items():
+        pipe.hincrbyfloat(self.key, self.prefix + field, value)
+      pipe.expire(self.key, self.ttl)
+      pipe.execute()
+    except Exception as e:
+      # 记录明细失败不影响任务执行
+      print(f"记录任务指标失败: {str(e)}")
+
+  def step(self, name: str, seconds: float):
+    STEP_SECONDS.labels(name).observe(seconds)
+    self.add(**{f"{name}_seconds": seconds})
+
+  def llm_request(self, seconds: float, prompt_tokens: int, completion_tokens: int):
+    LLM_REQUEST_SECONDS.observe(seconds)
+    LLM_REQUESTS.labels('ok').inc()
+    LLM_TOKENS.labels('prompt').inc(prompt_tokens)
+    LLM_TOKENS.labels('completion').inc(completion_tokens)
+    self.add(llm_requests=1, llm_seconds=seconds, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+  def llm_error(self, seconds: float, rate_limited: bool = False):
+    LLM_REQUEST_SECONDS.observe(seconds)
+    if rate_limited:
+      LLM_REQUESTS.labels('rate_limited').inc()
+      self.add(llm_rate_limited=1, llm_seconds=seconds)
+    else:
+      LLM_REQUESTS.labels('error').inc()
+      self.add(llm_errors=1, llm_seconds=seconds)
+
+  def llm_throttled(self, seconds: float):
+    LLM_THROTTLE_SECONDS.inc(seconds)
+    self.add(llm_throttle_seconds=seconds)
+
+  def llm_cache_hit(self):
+    LLM_REQUESTS.labels('cached').inc()
+    self.add(llm_cache_hits=1)
+
+  def tokens_saved(self, kind: str, count: int):
+    """记录没有发送给大模型的原文 token 数，替换为占位符的内容也不需要大模型输出，输出 token 节省约同样多"""
+    TOKENS_SAVED.labels(kind).inc(count)
+    self.add(**{f"{kind}_tokens_saved": count})
+
+  def sections_reused(self, count: int):
+    SECTIONS_REUSED.inc(count)
+    self.add(sections_reused=count)
+
+  def transfer(self, direction: str, nbytes: int):
+    TRANSFER_BYTES.labels(direction).inc(nbytes)
+    self.add(**{f"{direction}_bytes": nbytes})
+
+  def queue_wait(self, queue: str, seconds: float):
+    QUEUE_WAIT_SECONDS.labels(queue).observe(seconds)
+    self.add(queue_wait_seconds=seconds)
+
+  def breakdown(self) -> dict:
+    """返回汇总的明细，计数类的字段为整数，耗时保留三位小数"""
+    breakdown = {}
+    for field, value in r.hgetall(self.key).items():
+      field, value = field.decode(), float(value)
+      breakdown[field] = round(value, 3) if field.endswith('_seconds') else int(value)
+    return dict(sorted(breakdown.items()))
+
+  def clear(self):
+    r.delete(self.key)
+
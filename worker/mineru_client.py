@@ -0,0 +1,114 @@
+from multiprocessing.connection import Client
+import json
+import os
+import subprocess
+import threading
+import time
+
+from abort import TaskCancelled
+from config import (
+  MINERU_SERVICE_AUTHKEY, MINERU_SERVICE_CONCURRENCY, MINERU_SERVICE_ENABLED, MINERU_SERVICE_PORT,
+  MINERU_SERVICE_PYTHON, MINERU_SERVICE_STARTUP_TIMEOUT, TEMP_DIR
+)
+
+SERVICE_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mineru_service.py")
+
+# 与 mineru_service.py 一致: 未设置或仍是旧版本公开的默认密钥时拒绝使用
+INSECURE_AUTHKEYS = {'', 'pdf2zh-md'}
+
+
+class MineruService:
+  """本机常驻 MinerU 服务 (mineru_service.py) 的客户端
+
+  服务未运行或已崩溃时自动 (重新) 启动，启动失败或转换失败时返回 False，
+  由调用方退回到每个任务启动一次 magic-pdf 子进程的方式。
+  服务只监听本机回环地址，请求和响应都以 JSON 传输。
+  """
+  host = '127.0.0.1'
+
+  def __init__(
+    self, port: int = MINERU_SERVICE_PORT, authkey: str = MINERU_SERVICE_AUTHKEY,
+    concurrency: int = MINERU_SERVICE_CONCURRENCY
+  ):
+    if authkey in INSECURE_AUTHKEYS:
+      raise ValueError("启用常驻 MinerU 服务时必须把 mineru_service.authkey 设置为随机字符串")
+    self.address = (self.host, port)
+    self.authkey = authkey.encode()
+    self.concurrency = concurrency
+    self.start_lock = threading.Lock()
+
+  def request(self, cancelled: threading.Event = None, **request) -> dict:
+    """发送请求并等待响应，cancelled 被设置时通知服务取消、断开连接并抛出 TaskCancelled"""
+    with Client(self.address, authkey=self.authkey) as conn:
+      conn.send_bytes(json.dumps(request).encode('utf-8'))
+      while cancelled is not None and not conn.poll(0.5):
+        if cancelled.is_set():
+          try:
+            conn.send_bytes(json.dumps({'cmd': 'cancel'}).encode('utf-8'))
+          except OSError:
+            pass  # 服务已断开
+          raise TaskCancelled()
+      return json.loads(conn.recv_bytes())
+
+  def ping(self) -> bool:
+    """健康检查"""
+    try:
+      return self.request(cmd='ping').get('ok', False)
+    except Exception:
+      return False
+
+  def ensure_running(self) -> bool:
+    """服务不可用时启动服务进程并等待其就绪"""
+    if self.ping():
+      return True
+    with self.start_lock:
+      if self.ping():
+        return True
+      print("MinerU 服务不可用，正在启动...")
+      log = open(os.path.join(TEMP_DIR, "mineru_service.log"), 'ab')
+      # 服务进程独立于 Worker 进程运行，Worker 重启后服务仍然常驻；密钥通过环境变量传递，不出现在命令行中
+      subprocess.Popen(
+        [MINERU_SERVICE_PYTHON, SERVICE_SCRIPT,
+         "--host", self.host, "--port", str(self.address[1]), "--concurrency", str(self.concurrency)],
+        stdout=log, stderr=subprocess.STDOUT, start_new_session=True,
+        env={**os.environ, 'MINERU_SERVICE_AUTHKEY': self.authkey.decode()},
+      )
+      log.close()
+      deadline = time.monotonic() + MINERU_SERVICE_STARTUP_TIMEOUT
+      while time.monotonic() < deadline:
+        if self.ping():
+          return True
+        time.sleep(1)
+      return False
+
+  def convert(self, pdf_path: str, output_dir: str, cancelled: threading.Event = None) -> bool:
+    """通过服务转换 PDF，输出目录结构与 magic-pdf 命令行一致
+
+    任务被取消时通知服务: 排队中的请求被丢弃，正在转换的文档所在的子进程被终止。
+    Returns:
+      bool: False 表示服务不可用或转换失败，调用方应退回到子进程方式
+    Raises:
+      TaskCancelled: 等待期间任务被取消
+    """
+    try:
+      if not self.ensure_running():
+        print("MinerU 服务启动超时")
+        return False
+      response = self.request(
+        cancelled,
+        cmd='convert',
+        pdf_path=os.path.abspath(pdf_path),
+        output_dir=os.path.abspath(output_dir),
+      )
+      if not response.get('ok'):
+        print(f"MinerU 服务转换失败: {response.get('error')}")
+      return response.get('ok', False)
+    except TaskCancelled:
+      raise
+    except Exception as e:
+      # 服务在转换过程中崩溃，下一次请求时会重新启动
+      print(f"MinerU 服务请求失败: {str(e)}")
+      return False
+
+
+mineru_service = MineruService() if MINERU_SERVICE_ENABLED else None
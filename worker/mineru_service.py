@@ -0,0 +1,194 @@
+"""常驻的 MinerU 转换服务
+
+在安装了 magic-pdf 的环境中运行。每个并发槽位对应一个常驻的转换子进程，模型在其第一次转换时加载并常驻内存，
+之后的转换不再需要重新启动解释器和加载模型。Worker 通过本地 socket 提交转换请求，
+参见 mineru_client.py。本脚本不依赖 Worker 环境中的其他模块。
+任务被取消时 Worker 在同一连接上发送 cancel，服务终止正在转换该文档的子进程并启动一个新的子进程代替。
+
+连接建立时用认证密钥做 HMAC 质询，请求和响应都是 JSON，不会反序列化任意对象。
+密钥从环境变量 MINERU_SERVICE_AUTHKEY 读取 (不出现在进程的命令行中)，未设置或仍是旧版本的公开默认值时拒绝启动。
+
+用法:
+  MINERU_SERVICE_AUTHKEY=<随机字符串> python mineru_service.py --port 6380 --concurrency 1
+"""
+from multiprocessing.connection import Listener
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import traceback
+
+# 旧版本配置文件中公开的默认密钥，知道密钥的人可以让服务读写本机上的任意路径
+INSECURE_AUTHKEYS = {'', 'pdf2zh-md'}
+
+
+def convert(pdf_path: str, output_dir: str):
+  """转换 PDF，输出目录结构与 magic-pdf 命令行一致: {output_dir}/{name}/auto/{name}.md 和 images
+
+  在转换子进程中执行，magic-pdf 在子进程中导入，服务主进程不加载模型。
+  """
+  from magic_pdf.config.enums import SupportedPdfParseMethod
+  from magic_pdf.data.data_reader_writer import FileBasedDataWriter
+  from magic_pdf.data.dataset import PymuDocDataset
+  from magic_pdf.model.doc_analyze_by_custom_model import doc_analyze
+
+  name = os.path.splitext(os.path.basename(pdf_path))[0]
+  md_dir = os.path.join(output_dir, name, "auto")
+  image_dir = os.path.join(md_dir, "images")
+  os.makedirs(image_dir, exist_ok=True)
+  image_writer = FileBasedDataWriter(image_dir)
+  md_writer = FileBasedDataWriter(md_dir)
+
+  with open(pdf_path, 'rb') as f:
+    ds = PymuDocDataset(f.read())
+  if ds.classify() == SupportedPdfParseMethod.OCR:
+    pipe_result = ds.apply(doc_analyze, ocr=True).pipe_ocr_mode(image_writer)
+  else:
+    pipe_result = ds.apply(doc_analyze, ocr=False).pipe_txt_mode(image_writer)
+  pipe_result.dump_md(md_writer, f"{name}.md", "images")
+
+
+def convert_loop(conn, convert_fn):
+  """转换子进程: 依次执行主进程发来的转换请求，直到主进程关闭管道"""
+  while True:
+    try:
+      pdf_path, output_dir = conn.recv()
+    except EOFError:
+      return
+    try:
+      convert_fn(pdf_path, output_dir)
+      conn.send((True, None))
+    except Exception:
+      conn.send((False, traceback.format_exc()))
+
+
+class ConvertProcess:
+  """一个常驻的转换子进程"""
+  def __init__(self, ctx, convert_fn):
+    self.conn, child_conn = ctx.Pipe()
+    self.process = ctx.Process(target=convert_loop, args=(child_conn, convert_fn))
+    self.process.start()
+    child_conn.close()
+
+  def kill(self):
+    """终止子进程，正在进行的转换随之中止"""
+    self.process.kill()
+    self.process.join()
+    self.conn.close()
+
+
+class ConvertPool:
+  """固定数量的转换子进程，空闲的子进程放在队列中，取消或崩溃的子进程由新的子进程代替"""
+  def __init__(self, size: int = 1, convert_fn=convert, context: str = 'spawn'):
+    # spawn: 子进程不继承主进程的线程和已初始化的 CUDA 状态
+    self.ctx = multiprocessing.get_context(context)
+    self.convert_fn = convert_fn
+    self.idle = queue.Queue()
+    for _ in range(max(1, size)):
+      self.idle.put(ConvertProcess(self.ctx, convert_fn))
+
+  def replace(self, process: ConvertProcess):
+    process.kill()
+    self.idle.put(ConvertProcess(self.ctx, self.convert_fn))
+
+
+# 同时转换的文档数由 --concurrency 设置，默认一次只转换一个文档，避免多个文档争抢显存
+pool: ConvertPool = None
+
+
+def send(conn, response: dict):
+  conn.send_bytes(json.dumps(response).encode('utf-8'))
+
+
+def client_cancelled(conn) -> bool:
+  """客户端在等待转换期间发来了 cancel 或已断开"""
+  if not conn.poll():
+    return False
+  try:
+    conn.recv_bytes()  # 等待转换期间客户端只会发送 cancel
+  except EOFError:
+    pass
+  return True
+
+
+def run_convert(conn, pdf_path: str, output_dir: str) -> dict | None:
+  """由空闲的转换子进程转换，客户端取消时终止该子进程并返回 None"""
+  while True:
+    try:
+      process = pool.idle.get(timeout=0.5)
+      break
+    except queue.Empty:
+      if client_cancelled(conn):
+        return None  # 排队期间被取消，不再转换
+  if client_cancelled(conn):
+    pool.idle.put(process)
+    return None
+  try:
+    process.conn.send((pdf_path, output_dir))
+    while not process.conn.poll(0.5):
+      if client_cancelled(conn):
+        pool.replace(process)
+        return None
+    ok, error = process.conn.recv()
+  except (EOFError, OSError):
+    pool.replace(process)
+    return {'ok': False, 'error': "转换子进程意外退出"}
+  pool.idle.put(process)
+  return {'ok': True} if ok else {'ok': False, 'error': error}
+
+
+def handle(conn):
+  """处理一个连接上的请求，直到对方关闭连接"""
+  with conn:
+    while True:
+      try:
+        request = json.loads(conn.recv_bytes())
+      except EOFError:
+        return
+      except ValueError:
+        send(conn, {'ok': False, 'error': "请求不是合法的 JSON"})
+        continue
+      if request.get('cmd') == 'ping':
+        send(conn, {'ok': True})
+      elif request.get('cmd') == 'convert':
+        try:
+          response = run_convert(conn, request['pdf_path'], request['output_dir'])
+        except Exception:
+          response = {'ok': False, 'error': traceback.format_exc()}
+        if response is None:
+          return  # 任务被取消
+        send(conn, response)
+      elif request.get('cmd') == 'cancel':
+        continue  # 转换已经完成后才到达的取消
+      else:
+        send(conn, {'ok': False, 'error': f"未知命令: {request.get('cmd')}"})
+
+
+def main():
+  global pool
+  parser = argparse.ArgumentParser(description="常驻的 MinerU 转换服务")
+  parser.add_argument('--host', default='127.0.0.1', help="监听地址，默认只接受本机的连接")
+  parser.add_argument('--port', type=int, default=6380)
+  parser.add_argument('--concurrency', type=int, default=1, help="同时转换的文档数，显存足够时可以调大")
+  args = parser.parse_args()
+  authkey = os.environ.get('MINERU_SERVICE_AUTHKEY', '')
+  if authkey in INSECURE_AUTHKEYS:
+    parser.error("需要通过环境变量 MINERU_SERVICE_AUTHKEY 设置一个随机的认证密钥")
+
+  # 端口已被占用说明本机已有服务在运行，直接退出
+  with Listener((args.host, args.port), authkey=authkey.encode()) as listener:
+    pool = ConvertPool(args.concurrency)
+    print(f"MinerU 服务已启动: {args.host}:{args.port}", flush=True)
+    while True:
+      try:
+        conn = listener.accept()
+      except Exception as e:
+        print(f"接受连接失败: {str(e)}", flush=True)
+        continue
+      threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+
+if __name__ == "__main__":
+  main()
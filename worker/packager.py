@@ -0,0 +1,32 @@
+import os
+import shutil
+import zipfile
+
+# 已经压缩过的格式直接存储，再用 deflate 压缩只会浪费 CPU
+STORED_SUFFIXES = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.zip', '.gz', '.pdf'}
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def compress_type(arcname: str) -> int:
+  if os.path.splitext(arcname)[1].lower() in STORED_SUFFIXES:
+    return zipfile.ZIP_STORED
+  return zipfile.ZIP_DEFLATED
+
+
+def write_zip(fileobj, entries):
+  """把若干文件以 zip 格式流式写入 fileobj，fileobj 只需要支持 write，不需要支持 seek
+
+  Args:
+    entries: (zip 中的文件名, 来源) 的列表，来源是本地文件路径，
+      或者 (ZipFile, ZipInfo)，表示直接从另一个 zip 中复制该文件
+  """
+  with zipfile.ZipFile(fileobj, 'w') as zf:
+    for arcname, source in entries:
+      if isinstance(source, str):
+        zf.write(source, arcname, compress_type=compress_type(arcname))
+      else:
+        src_zip, src_info = source
+        info = zipfile.ZipInfo(arcname, date_time=src_info.date_time)
+        info.compress_type = compress_type(arcname)
+        with src_zip.open(src_info) as src, zf.open(info, 'w', force_zip64=src_info.file_size > 2 ** 31) as dst:
+          shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
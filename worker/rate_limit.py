@@ -0,0 +1,172 @@
+import random
+import threading
+import time
+
+import httpx
+import openai
+
+from abort import TaskCancelled
+from config import (
+  RATE_LIMIT_BACKOFF_BASE, RATE_LIMIT_BACKOFF_MAX, RATE_LIMIT_BURST, RATE_LIMIT_DECREASE, RATE_LIMIT_MIN_SCALE,
+  RATE_LIMIT_RECOVERY, RATE_LIMIT_RPM, RATE_LIMIT_TPM, r
+)
+
+# 取令牌: 熔断打开时返回剩余的毫秒数；两个桶都够时扣减并返回 0，否则返回需要等待的毫秒数
+# KEYS: 请求数桶、token 桶、熔断标记、速率系数  ARGV: rpm、tpm、本次请求的 token 数、桶容量占每分钟限额的比例
+ACQUIRE_SCRIPT = """
+local open = redis.call('PTTL', KEYS[3])
+if open > 0 then
+  return open
+end
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local scale = tonumber(redis.call('GET', KEYS[4]) or '1')
+local buckets = {{KEYS[1], tonumber(ARGV[1]), 1}, {KEYS[2], tonumber(ARGV[2]), tonumber(ARGV[3])}}
+local wait = 0
+local levels = {}
+for i, bucket in ipairs(buckets) do
+  local key, limit, cost = bucket[1], bucket[2], bucket[3]
+  if limit > 0 then
+    local rate = limit * scale / 60000
+    local capacity = math.max(1, limit * tonumber(ARGV[4]))
+    local state = redis.call('HMGET', key, 'level', 'ts')
+    local level = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    level = math.min(capacity, level + math.max(0, now - ts) * rate)
+    cost = math.min(cost, capacity)
+    if level < cost then
+      wait = math.max(wait, math.ceil((cost - level) / rate))
+    end
+    levels[i] = {key, level, cost}
+  end
+end
+for _, item in pairs(levels) do
+  local level = item[2]
+  if wait == 0 then
+    level = level - item[3]
+  end
+  redis.call('HSET', item[1], 'level', level, 'ts', now)
+  redis.call('PEXPIRE', item[1], 120000)
+end
+return wait
+"""
+
+# 请求成功: 按实际用量修正 token 桶，速率系数逐步恢复
+# KEYS: token 桶、速率系数  ARGV: 实际用量减去预扣的 token 数、每次恢复的幅度
+SETTLE_SCRIPT = """
+local delta = tonumber(ARGV[1])
+if delta ~= 0 and redis.call('EXISTS', KEYS[1]) == 1 then
+  redis.call('HINCRBYFLOAT', KEYS[1], 'level', -delta)
+end
+local scale = tonumber(redis.call('GET', KEYS[2]) or '1')
+if scale < 1 then
+  scale = scale + tonumber(ARGV[2])
+  if scale >= 1 then
+    redis.call('DEL', KEYS[2])
+  else
+    redis.call('SET', KEYS[2], scale, 'EX', 3600)
+  end
+end
+return 0
+"""
+
+# 收到 429: 打开熔断，整个集群暂停 cooldown 毫秒；熔断已打开时不再重复降速，避免同时收到 429 的请求把速率压得过低
+# KEYS: 熔断标记、速率系数  ARGV: cooldown 毫秒、降速倍数、最低速率系数
+THROTTLE_SCRIPT = """
+if redis.call('PTTL', KEYS[1]) > 0 then
+  return 0
+end
+redis.call('SET', KEYS[1], 1, 'PX', ARGV[1])
+local scale = tonumber(redis.call('GET', KEYS[2]) or '1')
+scale = math.max(tonumber(ARGV[3]), scale * tonumber(ARGV[2]))
+redis.call('SET', KEYS[2], scale, 'EX', 3600)
+return 1
+"""
+
+# 可以重试的错误: 429、超时、连接失败和服务端错误，流式接收过程中断开时抛出的是 httpx 的异常
+RETRYABLE_ERRORS = (
+  openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError,
+  httpx.TransportError,
+)
+
+
+class RateLimiter:
+  """整个集群共享的大模型请求限流器，状态存放在 Redis 中，由 Lua 脚本原子地更新
+
+  `ratelimit:requests` 和 `ratelimit:tokens` 是按每分钟请求数 (rpm) 和 token 数 (tpm) 匀速补充的令牌桶，
+  容量只有每分钟限额的 burst 倍，任意一分钟内的用量不超过限额的 1 + burst 倍。
+  请求前按估算的 token 数预扣，请求完成后按实际用量修正。
+  收到 429 时打开熔断 (`ratelimit:open`)，所有 Worker 暂停到冷却结束，并把速率系数 (`ratelimit:scale`)
+  乘以 decrease，之后每次成功的请求把系数恢复 recovery，使整个集群的速率贴近服务商的实际限额。
+  """
+  prefix = "ratelimit"
+
+  def __init__(
+    self, rpm: int = RATE_LIMIT_RPM, tpm: int = RATE_LIMIT_TPM, burst: float = RATE_LIMIT_BURST,
+    decrease: float = RATE_LIMIT_DECREASE, min_scale: float = RATE_LIMIT_MIN_SCALE, recovery: float = RATE_LIMIT_RECOVERY
+  ):
+    self.rpm = rpm
+    self.tpm = tpm
+    self.burst = burst
+    self.decrease = decrease
+    self.min_scale = min_scale
+    self.recovery = recovery
+    self.requests_key = f"{self.prefix}:requests"
+    self.tokens_key = f"{self.prefix}:tokens"
+    self.open_key = f"{self.prefix}:open"
+    self.scale_key = f"{self.prefix}:scale"
+    self.acquire_script = r.register_script(ACQUIRE_SCRIPT)
+    self.settle_script = r.register_script(SETTLE_SCRIPT)
+    self.throttle_script = r.register_script(THROTTLE_SCRIPT)
+
+  def acquire(self, tokens: int, cancelled: threading.Event = None) -> float:
+    """等待到可以发送一个消耗约 tokens 个 token 的请求，返回等待的秒数
+    Raises:
+      TaskCancelled: 等待期间 cancelled 被设置
+    """
+    waited = 0.0
+    while True:
+      wait_ms = self.acquire_script(
+        keys=[self.requests_key, self.tokens_key, self.open_key, self.scale_key],
+        args=[self.rpm, self.tpm, tokens, self.burst],
+      )
+      if wait_ms <= 0:
+        return waited
+      # 加上少量随机等待，避免所有 Worker 同时醒来争抢
+      delay = wait_ms / 1000 * random.uniform(1, 1.2)
+      if cancelled is None:
+        time.sleep(delay)
+      elif cancelled.wait(delay):
+        raise TaskCancelled()
+      waited += delay
+
+  def settle(self, estimated: int, actual: int):
+    """请求成功后按实际 token 用量修正预扣的数量，并逐步恢复速率"""
+    self.settle_script(keys=[self.tokens_key, self.scale_key], args=[actual - estimated, self.recovery])
+
+  def throttle(self, cooldown: float):
+    """收到 429 后暂停整个集群 cooldown 秒并降低速率"""
+    self.throttle_script(
+      keys=[self.open_key, self.scale_key],
+      args=[max(1, int(cooldown * 1000)), self.decrease, self.min_scale],
+    )
+
+  def backoff(self, error: Exception, attempt: int) -> float | None:
+    """第 attempt 次 (从 0 开始) 请求失败后需要等待的秒数，不可重试的错误返回 None
+
+    使用带随机抖动的指数退避 (在 [0, base * 2^attempt] 内随机)，429 时至少等到服务端返回的 Retry-After，
+    并打开熔断让其他 Worker 也暂停。
+    """
+    if not isinstance(error, RETRYABLE_ERRORS):
+      return None
+    delay = random.uniform(0, min(RATE_LIMIT_BACKOFF_MAX, RATE_LIMIT_BACKOFF_BASE * 2 ** attempt))
+    if isinstance(error, openai.RateLimitError):
+      try:
+        delay = max(delay, float(error.response.headers.get('retry-after', 0)))
+      except ValueError:
+        pass
+      self.throttle(max(delay, RATE_LIMIT_BACKOFF_BASE))
+    return delay
+
+
+llm_limiter = RateLimiter()
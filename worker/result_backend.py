@@ -0,0 +1,53 @@
+"""Worker 使用的 Celery 结果后端: 在 redis 后端的基础上附带耗时明细，并保证进度不会覆盖取消状态"""
+from celery import states
+from celery.backends.redis import RedisBackend
+
+from metrics import TaskMetrics
+
+# 结果后端中的状态不是 ABORTED 时才写入进度，Web App 取消任务后进度不会把取消状态覆盖掉
+STORE_PROGRESS_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if current and string.find(current, '"status":%s*"ABORTED"') then
+  return 0
+end
+if tonumber(ARGV[2]) > 0 then
+  redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+else
+  redis.call('SET', KEYS[1], ARGV[1])
+end
+redis.call('PUBLISH', KEYS[1], ARGV[1])
+return 1
+"""
+
+
+class ResultBackend(RedisBackend):
+  """与 redis 后端读写相同的键，Web App 仍按 redis 后端读取
+
+  - 原任务 (包括被替换后沿用原任务 ID 的下一阶段) 结束时，把 Redis 中汇总的耗时明细和结果在同一次写入中
+    保存到 `metrics` 字段，不需要在结果保存之后再读出、修改、写回。明细同时记在 request.metrics 上，供 task_postrun 推送。
+  - store_progress 在同一个 Lua 脚本中检查并写入进度，检查和写入之间到达的取消不会被覆盖。
+  """
+  def _get_result_meta(self, result, state, traceback, request, *args, **kwargs):
+    meta = super()._get_result_meta(result, state, traceback, request, *args, **kwargs)
+    task_id = getattr(request, 'id', None)
+    if state in states.READY_STATES and task_id and getattr(request, 'root_id', None) in (None, task_id):
+      try:
+        request.metrics = TaskMetrics(task_id).breakdown()
+        meta['metrics'] = request.metrics
+      except Exception as e:
+        # 读取明细失败不影响保存结果
+        print(f"读取任务指标失败: {str(e)}")
+    return meta
+
+  def store_progress(self, task_id: str, meta: dict) -> bool:
+    """把任务的状态设为 PROGRESS
+    Returns:
+      bool: False 表示任务已被取消，没有写入
+    """
+    result_meta = self._get_result_meta(meta, 'PROGRESS', None, None)
+    result_meta['task_id'] = task_id
+    expires = int(self.expires or 0)
+    stored = self.client.eval(
+      STORE_PROGRESS_SCRIPT, 1, self.get_key_for_task(task_id), self.encode(result_meta), expires
+    )
+    return bool(stored)
@@ -0,0 +1,30 @@
+"""Worker 的单元测试，在 worker 目录下运行: python -m pytest
+
+Worker 的模块之间按脚本方式互相导入，并从当前目录读取 config.yaml，因此这里把 worker 目录加入 sys.path
+并切换到该目录。Redis 替换为 fakeredis (需要 lupa 才能执行 Lua 脚本)，Celery 的结果后端也读写同一个 fakeredis，
+测试不需要 Redis、大模型或 MinerU。
+"""
+import os
+import sys
+
+from celery.backends.redis import RedisBackend
+import fakeredis
+import pytest
+
+WORKER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, WORKER_DIR)
+os.chdir(WORKER_DIR)
+os.environ.setdefault("API_KEY", "test")
+
+import config  # noqa: E402
+
+# 必须在导入其他模块之前替换，各模块在导入时就通过 from config import r 引用了连接
+config.r = fakeredis.FakeRedis()
+RedisBackend._create_client = lambda self, **params: config.r
+
+
+@pytest.fixture(autouse=True)
+def redis_db():
+  """每个测试使用空的 Redis"""
+  config.r.flushdb()
+  yield config.r
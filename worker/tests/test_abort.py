@@ -0,0 +1,38 @@
+import threading
+
+from abort import AbortWatcher, abort_flag_key
+from config import TASK_ABORT_CHANNEL, r
+
+
+def idle_watcher() -> AbortWatcher:
+  """不启动订阅线程的 AbortWatcher"""
+  watcher = AbortWatcher()
+  watcher.thread = threading.current_thread()
+  return watcher
+
+
+def test_flag_left_before_watch_cancels_immediately():
+  r.set(abort_flag_key('t1'), 1)
+  watcher = idle_watcher()
+  assert watcher.watch('t1').is_set()
+  assert not watcher.watch('t2').is_set()
+
+
+def test_flags_are_checked_after_subscribing():
+  watcher = idle_watcher()
+  first, second = watcher.watch('t1'), watcher.watch('t2')
+  r.set(abort_flag_key('t2'), 1)  # 登记之后、订阅建立之前被取消
+  watcher.check_flags()
+  assert not first.is_set() and second.is_set()
+
+
+def test_published_abort_sets_event():
+  watcher = AbortWatcher()
+  event = watcher.watch('t1')
+  for _ in range(50):
+    r.publish(TASK_ABORT_CHANNEL, 't1')  # 订阅线程可能还没有订阅，重复发布直到收到
+    if event.wait(0.1):
+      break
+  assert event.is_set()
+  watcher.unwatch('t1')
+  assert 't1' not in watcher.events
@@ -0,0 +1,91 @@
+import filecmp
+import os
+
+import pytest
+
+from blob_store import RedisBlobStore
+from config import r
+
+WORKER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_app_and_worker_copies_are_identical():
+  app_copy = os.path.join(WORKER_DIR, '..', 'app', 'blob_store.py')
+  assert filecmp.cmp(os.path.join(WORKER_DIR, 'blob_store.py'), app_copy, shallow=False)
+
+
+@pytest.mark.parametrize('codec', ['zstd', 'none'])
+def test_chunked_round_trip(tmp_path, codec):
+  store = RedisBlobStore(chunk_size=1024, codec=codec)
+  data = os.urandom(2500) + b'a' * 3000
+  src, dst = tmp_path / 'src.pdf', tmp_path / 'dst.pdf'
+  src.write_bytes(data)
+  store.put_file('a.pdf', str(src), ttl=60)
+  manifest = store.manifest('a.pdf')
+  assert (manifest['chunks'], manifest['size'], manifest['codec'], manifest['legacy']) == (6, len(data), codec, False)
+  assert 0 < r.ttl(store.chunk_key('a.pdf', manifest['version'], 0)) <= 60
+  store.get_file('a.pdf', str(dst))
+  assert dst.read_bytes() == data
+
+
+def test_overwrite_removes_old_chunks():
+  store = RedisBlobStore(chunk_size=4)
+  with store.open_writer('a.txt') as writer:
+    writer.write(b'12345678')
+  old = store.manifest('a.txt')
+  with store.open_writer('a.txt') as writer:
+    writer.write(b'abc')
+  assert b''.join(store.iter_chunks('a.txt')) == b'abc'
+  assert not r.exists(store.chunk_key('a.txt', old['version'], 0))
+
+
+def test_failed_write_leaves_nothing():
+  store = RedisBlobStore(chunk_size=4)
+  with pytest.raises(RuntimeError):
+    with store.open_writer('a.txt') as writer:
+      writer.write(b'12345678')
+      raise RuntimeError()
+  assert not store.exists('a.txt') and not r.keys('file:*')
+
+
+def test_legacy_string_blob_is_readable_and_replaceable():
+  store = RedisBlobStore(chunk_size=4)
+  r.set(store.manifest_key('old.pdf'), b'legacy data')
+  manifest = store.manifest('old.pdf')
+  assert manifest['legacy'] and manifest['size'] == 11
+  assert b''.join(store.iter_chunks('old.pdf')) == b'legacy data'
+  with store.open_writer('old.pdf') as writer:
+    writer.write(b'new')
+  assert not store.manifest('old.pdf')['legacy']
+  assert b''.join(store.iter_chunks('old.pdf')) == b'new'
+
+
+def test_legacy_string_blob_delete_and_expire():
+  store = RedisBlobStore()
+  r.set(store.manifest_key('old.pdf'), b'legacy data')
+  store.expire('old.pdf', 30)
+  assert 0 < r.ttl(store.manifest_key('old.pdf')) <= 30
+  store.delete('old.pdf')
+  assert not store.exists('old.pdf')
+  with pytest.raises(FileNotFoundError):
+    list(store.iter_chunks('old.pdf'))
+
+
+def test_iter_files_lists_legacy_blobs_but_not_chunks():
+  store = RedisBlobStore(chunk_size=4)
+  with store.open_writer('a.txt') as writer:
+    writer.write(b'12345678')  # 两个分块，同为字符串值
+  r.set(store.manifest_key('old.pdf'), b'legacy data')
+  files = dict(store.iter_files())
+  assert sorted(files) == ['a.txt', 'old.pdf']
+  assert not files['a.txt']['legacy']
+  assert files['old.pdf']['legacy'] and files['old.pdf']['created'] == 0 and files['old.pdf']['size'] == 11
+
+
+def test_legacy_blob_is_read_in_ranges(monkeypatch):
+  store = RedisBlobStore(chunk_size=4)
+  r.set(store.manifest_key('old.pdf'), b'0123456789')
+  r.set(store.manifest_key('even.pdf'), b'01234567')
+  monkeypatch.setattr(r, 'get', lambda key: pytest.fail("旧格式的文件不应整个读入内存"))
+  assert list(store.iter_chunks('old.pdf')) == [b'0123', b'4567', b'89']
+  assert list(store.iter_chunks('even.pdf')) == [b'0123', b'4567']
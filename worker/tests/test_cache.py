@@ -0,0 +1,144 @@
+import os
+
+import pytest
+
+import cache
+from cache import MineruCache, TranslationCache
+from config import r
+
+
+@pytest.fixture
+def translation_cache():
+  return TranslationCache(ttl=60, max_entries=3)
+
+
+def test_key_covers_every_input(translation_cache, monkeypatch):
+  key = translation_cache.make_key("# Intro\ntext", "中文", masking=True)
+  assert translation_cache.make_key("# Intro\ntext", "中文", masking=True) == key
+  assert translation_cache.make_key("# Intro\ntext!", "中文", masking=True) != key
+  assert translation_cache.make_key("# Intro\ntext", "日本語", masking=True) != key
+  assert translation_cache.make_key("# Intro\ntext", "中文", masking=False) != key
+  # 各部分之间有分隔符，移动边界不会得到相同的键
+  assert translation_cache.make_key("text", "中文a") != translation_cache.make_key("atext", "中文")
+
+  for name, value in [('MODEL', 'another-model'), ('PROMPTS', 'another prompt'), ('MASK_PROMPT', 'another mask prompt')]:
+    with monkeypatch.context() as m:
+      m.setattr(cache, name, value)
+      assert translation_cache.make_key("# Intro\ntext", "中文", masking=True) != key, name
+  with monkeypatch.context() as m:
+    m.setattr(TranslationCache, 'version', 'next')
+    assert translation_cache.make_key("# Intro\ntext", "中文", masking=True) != key
+
+
+def test_prompt_change_misses(translation_cache, monkeypatch):
+  translation_cache.set(translation_cache.make_key("text", "中文"), "译文")
+  assert translation_cache.get(translation_cache.make_key("text", "中文")) == "译文"
+  monkeypatch.setattr(cache, 'PROMPTS', 'a new prompt')
+  assert translation_cache.get(translation_cache.make_key("text", "中文")) is None
+
+
+def test_hit_miss_stats(translation_cache):
+  assert translation_cache.get("a") is None
+  translation_cache.set("a", "译文")
+  assert translation_cache.get("a") == "译文"
+  assert translation_cache.get("a") == "译文"
+  assert translation_cache.get("b") is None
+  assert translation_cache.stats() == {'hits': 2, 'misses': 2, 'entries': 1}
+
+
+def test_lru_eviction(translation_cache):
+  for key in "abc":
+    translation_cache.set(key, key.upper())
+  translation_cache.get("a")  # a 变为最近访问
+  translation_cache.set("d", "D")
+  assert translation_cache.get("b") is None  # 最久未访问的 b 被淘汰
+  assert [translation_cache.get(key) for key in "acd"] == ["A", "C", "D"]
+  assert not r.exists(f"{TranslationCache.prefix}:b")
+  assert translation_cache.stats()['entries'] == 3
+
+
+def test_ttl_is_set_and_refreshed(translation_cache):
+  translation_cache.set("a", "A")
+  key = f"{TranslationCache.prefix}:a"
+  assert 0 < r.ttl(key) <= 60
+  r.expire(key, 5)
+  translation_cache.get("a")
+  assert r.ttl(key) > 5  # 命中时刷新过期时间
+
+
+def test_expired_entry_is_dropped_from_lru(translation_cache):
+  translation_cache.set("a", "A")
+  r.delete(f"{TranslationCache.prefix}:a")  # 模拟 TTL 到期
+  assert translation_cache.get("a") is None
+  assert translation_cache.stats()['entries'] == 0
+
+
+def make_output(tmp_path, name, size):
+  """magic-pdf 的输出目录: markdown 和一张图片"""
+  auto_dir = tmp_path / name / "auto"
+  (auto_dir / "images").mkdir(parents=True)
+  (auto_dir / f"{name}.md").write_bytes(b"# md\n")
+  (auto_dir / "images" / "fig.jpg").write_bytes(b"x" * (size - 5))
+  return str(auto_dir)
+
+
+@pytest.fixture
+def mineru_config(tmp_path, monkeypatch):
+  path = tmp_path / "magic-pdf.json"
+  path.write_text('{"device-mode": "cpu"}')
+  monkeypatch.setenv("MINERU_TOOLS_CONFIG_JSON", str(path))
+  monkeypatch.setattr(cache, 'MINERU_PATH', str(tmp_path / "missing-magic-pdf"))
+  return path
+
+
+def test_mineru_cache_round_trip(tmp_path, mineru_config):
+  mineru_cache = MineruCache(str(tmp_path / "cache"))
+  key = mineru_cache.make_key("pdfhash")
+  mineru_cache.store(key, make_output(tmp_path, "paper", 100), "paper")
+  assert mineru_cache.contains(key)
+  restored = tmp_path / "restored" / "auto"
+  assert mineru_cache.restore(key, str(restored), "copy")
+  assert (restored / "copy.md").read_bytes() == b"# md\n"
+  assert (restored / "images" / "fig.jpg").stat().st_size == 95
+
+
+def test_mineru_config_change_misses(tmp_path, mineru_config):
+  mineru_cache = MineruCache(str(tmp_path / "cache"))
+  key = mineru_cache.make_key("pdfhash")
+  mineru_cache.store(key, make_output(tmp_path, "paper", 100), "paper")
+  mineru_config.write_text('{"device-mode": "cuda"}')
+  # 新启动的 Worker 重新计算指纹，旧条目不再命中
+  changed = MineruCache(str(tmp_path / "cache"))
+  assert changed.make_key("pdfhash") != key
+  assert not changed.contains(changed.make_key("pdfhash"))
+  assert not changed.restore(changed.make_key("pdfhash"), str(tmp_path / "restored"), "paper")
+
+
+def test_mineru_cache_evicts_least_recently_used(tmp_path, mineru_config):
+  mineru_cache = MineruCache(str(tmp_path / "cache"))
+  mineru_cache.max_size = 1000
+  for i, name in enumerate(["a", "b", "c"]):
+    mineru_cache.store(name, make_output(tmp_path, name, 300), name)
+    os.utime(os.path.join(mineru_cache.cache_dir, name), (i, i))
+  mineru_cache.restore("a", str(tmp_path / "restored" / "auto"), "a")  # a 变为最近访问
+  mineru_cache.store("d", make_output(tmp_path, "d", 300), "d")
+  # 超出上限后淘汰到上限的 low_water 倍 (900) 以内
+  assert [mineru_cache.contains(name) for name in "abcd"] == [True, False, True, True]
+  assert mineru_cache.size == 900
+
+
+def test_mineru_cache_only_rescans_past_high_water_mark(tmp_path, mineru_config, monkeypatch):
+  mineru_cache = MineruCache(str(tmp_path / "cache"))
+  mineru_cache.max_size = 1000
+  scans = []
+  evict = mineru_cache.evict
+  monkeypatch.setattr(mineru_cache, 'evict', lambda: scans.append(1) or evict())
+  mineru_cache.store("a", make_output(tmp_path, "a", 300), "a")  # 第一次写入时统计
+  mineru_cache.store("b", make_output(tmp_path, "b", 300), "b")
+  mineru_cache.store("c", make_output(tmp_path, "c", 300), "c")
+  assert (len(scans), mineru_cache.size) == (1, 900)
+  mineru_cache.store("d", make_output(tmp_path, "d", 300), "d")  # 估计值超出上限
+  assert len(scans) == 2 and mineru_cache.size <= 900
+  mineru_cache.scanned_at -= MineruCache.rescan_interval + 1  # 其他进程写入的条目由定期统计发现
+  mineru_cache.store("e", make_output(tmp_path, "e", 100), "e")
+  assert len(scans) == 3
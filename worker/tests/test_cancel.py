@@ -0,0 +1,122 @@
+"""取消在转换阶段结束之后、翻译子任务开始之前到达时，不再向大模型发送请求"""
+import io
+import threading
+import zipfile
+
+from celery.contrib.abortable import AbortableAsyncResult
+import pytest
+
+import translate
+from abort import abort_flag_key
+from blob_store import blob_store
+from celery_app import app, discard_translations, finish_conversion, translate_language
+from config import r
+from translate import Executor
+
+ROOT_ID = 'root-task'
+LANGS = ['中文', '日本語']
+MARKDOWN = "# Introduction\n\nSome text.\n\n# Method\n\nMore text.\n"
+
+
+@pytest.fixture
+def llm_calls(monkeypatch, tmp_path):
+  """记录发送给大模型的请求，并准备好转换阶段的结果"""
+  calls = []
+  def request_translation(section, target_lang, *args, **kwargs):
+    calls.append(section)
+    return f"[{target_lang}] {section}"
+  monkeypatch.setattr(translate, 'request_translation', request_translation)
+  monkeypatch.setattr(translate, 'translation_cache', None)
+  monkeypatch.setattr(translate, 'section_store', None)
+  monkeypatch.setattr(translate, 'TEMP_DIR', str(tmp_path))
+  buffer = io.BytesIO()
+  with zipfile.ZipFile(buffer, 'w') as zf:
+    zf.writestr('paper_original.md', MARKDOWN)
+  with blob_store.open_writer(f"{ROOT_ID}.converted.zip") as writer:
+    writer.write(buffer.getvalue())
+  app.backend.store_progress(ROOT_ID, {'progress': 7})  # 转换阶段写入的进度
+  return calls
+
+
+def run_language(lang):
+  return translate_language.apply(args=(f"{ROOT_ID}.pdf", lang, ROOT_ID, len(LANGS))).get()
+
+
+def abort_root():
+  """与 Web App 删除任务时相同: 结果后端标记 ABORTED 并留下取消标记"""
+  AbortableAsyncResult(ROOT_ID, app=app).abort()
+  r.set(abort_flag_key(ROOT_ID), 1)
+
+
+def test_languages_are_translated_without_abort(llm_calls):
+  assert run_language(LANGS[0]) == f"{ROOT_ID}.translated_{LANGS[0]}.md"
+  assert llm_calls
+
+
+def test_abort_before_first_language_makes_no_llm_call(llm_calls):
+  abort_root()
+  # 另一种语言在取消前读到的状态过时，它写入的进度不能覆盖取消状态
+  assert not app.backend.store_progress(ROOT_ID, {'progress': 9})
+  assert [run_language(lang) for lang in LANGS] == [None, None]
+  assert llm_calls == []
+  assert AbortableAsyncResult(ROOT_ID, app=app).is_aborted()
+  assert not any(blob_store.exists(f"{ROOT_ID}.translated_{lang}.md") for lang in LANGS)
+
+
+def test_abort_flag_alone_stops_translation(llm_calls):
+  # 结果后端中的取消状态已被覆盖 (如升级前的 Worker)，仍可从取消标记中发现
+  r.set(abort_flag_key(ROOT_ID), 1)
+  assert run_language(LANGS[0]) is None
+  assert llm_calls == []
+
+
+class AbortedTask:
+  """转换阶段的任务在 finish_conversion 之前被取消"""
+  request = type('Request', (), {'id': ROOT_ID})()
+
+  def is_aborted(self):
+    return True
+
+  def replace(self, sig):
+    raise AssertionError("被取消的任务不应启动翻译")
+
+
+def test_finish_conversion_does_not_fan_out_after_abort(llm_calls):
+  executor = Executor(f"{ROOT_ID}.pdf", LANGS, ROOT_ID)
+  executor.cancelled = threading.Event()
+  assert finish_conversion(AbortedTask(), executor, f"{ROOT_ID}.pdf", LANGS) == "Aborted"
+  assert not blob_store.exists(executor.converted_name)
+  assert llm_calls == []
+
+
+class Replaced(Exception):
+  pass
+
+
+class ConvertingTask:
+  """转换阶段的任务，记录替换成的翻译阶段"""
+  request = type('Request', (), {'id': ROOT_ID, 'delivery_info': {}})()
+
+  def is_aborted(self):
+    return False
+
+  def replace(self, sig):
+    self.replaced = sig
+    raise Replaced()
+
+
+def test_failed_language_discards_intermediate_results(llm_calls):
+  task = ConvertingTask()
+  executor = Executor(f"{ROOT_ID}.pdf", LANGS, ROOT_ID)
+  with pytest.raises(Replaced):
+    finish_conversion(task, executor, f"{ROOT_ID}.pdf", LANGS)
+  errbacks = task.replaced.body.options['link_error']
+  assert [errback['task'] for errback in errbacks] == [discard_translations.name]
+
+  # 第一种语言成功上传了译文，第二种语言失败，chord 不会执行打包
+  assert run_language(LANGS[0]) == f"{ROOT_ID}.translated_{LANGS[0]}.md"
+  r.set(f"langs:{ROOT_ID}", 1)
+  app.signature(errbacks[0]).apply()
+  assert not blob_store.exists(executor.converted_name)
+  assert not any(blob_store.exists(executor.translation_name(lang)) for lang in LANGS)
+  assert not r.exists(f"langs:{ROOT_ID}")
@@ -0,0 +1,101 @@
+"""翻译的断点续传: 重新执行时跳过已保存的分块，原文变化时丢弃旧译文，任务成功后删除断点"""
+import io
+import time
+import zipfile
+
+import pytest
+
+import chunker
+import translate
+from blob_store import blob_store
+from celery_app import app, translate_markdown
+from checkpoint import Checkpoint
+from config import r
+from translate import translate_text
+
+TASK_ID = 'checkpoint-task'
+SECTIONS = [f"# Section {i}\n" + f"Paragraph {i} of the paper. " * 10 for i in range(3)]
+TEXT = "\n\n".join(SECTIONS)
+
+
+class Tracker:
+  def split_progress(self, total):
+    pass
+
+  def step(self):
+    return False
+
+
+@pytest.fixture
+def sent(monkeypatch, tmp_path):
+  """每个段落单独成块，依次翻译，记录发送的原文"""
+  sent = []
+
+  def fake_translate_section(section, target_lang, *args):
+    sent.append(section)
+    return f"[{target_lang}] {section}"
+
+  monkeypatch.setattr(translate, 'translate_section', fake_translate_section)
+  monkeypatch.setattr(translate, 'chunk_sections', lambda sections: chunker.chunk_sections(sections, max_tokens=80))
+  monkeypatch.setattr(translate, 'TRANSLATE_CONCURRENCY', 1)
+  monkeypatch.setattr(translate, 'section_store', None)
+  monkeypatch.setattr(translate, 'MASKING_SKIP_REFERENCES', False)
+  monkeypatch.setattr(translate, 'TEMP_DIR', str(tmp_path))
+  return sent
+
+
+def test_resume_skips_saved_sections(sent, monkeypatch):
+  checkpoint = Checkpoint(TASK_ID)
+
+  def crash_on_second(section, target_lang, *args):
+    if "Section 1" in section:
+      # 等第一个分块的译文保存后再模拟 Worker 崩溃
+      deadline = time.time() + 5
+      while not r.hexists(checkpoint.sections_key, 0) and time.time() < deadline:
+        time.sleep(0.01)
+      raise RuntimeError("worker lost")
+    sent.append(section)
+    return f"[中文] {section}"
+
+  monkeypatch.setattr(translate, 'translate_section', crash_on_second)
+  with pytest.raises(RuntimeError):
+    translate_text(TEXT, "中文", Tracker(), checkpoint)
+  saved = set(r.hkeys(checkpoint.sections_key))
+  assert b'0' in saved and b'1' not in saved
+
+  resumed = []
+  monkeypatch.setattr(
+    translate, 'translate_section', lambda section, *args: resumed.append(section) or f"[中文] {section}"
+  )
+  result = translate_text(TEXT, "中文", Tracker(), checkpoint)
+  assert not any("Section 0" in section for section in resumed)
+  assert any("Section 1" in section for section in resumed)
+  assert all(f"[中文] # Section {i}" in result for i in range(3))
+
+
+def test_changed_source_invalidates_checkpoint(sent):
+  checkpoint = Checkpoint(TASK_ID)
+  checkpoint.set(source='hash of an older version')
+  checkpoint.save_section(0, "stale translation")
+  result = translate_text(TEXT, "中文", Tracker(), checkpoint)
+  assert "stale translation" not in result
+  assert len(sent) == 3
+  # 同一原文再次执行时全部沿用
+  sent.clear()
+  assert translate_text(TEXT, "中文", Tracker(), checkpoint) == result
+  assert sent == []
+
+
+def test_checkpoint_is_removed_on_success(sent):
+  buffer = io.BytesIO()
+  with zipfile.ZipFile(buffer, 'w') as zf:
+    zf.writestr('paper_original.md', TEXT)
+  with blob_store.open_writer(f"{TASK_ID}.converted.zip") as writer:
+    writer.write(buffer.getvalue())
+  app.backend.store_progress(TASK_ID, {'progress': 7})
+  checkpoint = Checkpoint(TASK_ID)
+  checkpoint.save_section(0, "saved before a restart")
+
+  result = translate_markdown.apply(args=(f"{TASK_ID}.pdf", "中文"), task_id=TASK_ID).get()
+  assert result == f"{TASK_ID}.zip"
+  assert not r.exists(checkpoint.key) and not r.exists(checkpoint.sections_key)
@@ -0,0 +1,65 @@
+from chunker import ATOMIC, HEADING, TEXT, chunk_markdown, chunk_sections, estimate_tokens, parse_blocks, split_sections
+
+PARAGRAPH = "The model is trained on a large corpus. " * 10  # 约 100 token
+
+
+def test_estimate_tokens():
+  assert estimate_tokens("abcd" * 10) == 10
+  assert estimate_tokens("中文字符") == 4
+  assert estimate_tokens("") == 0
+
+
+def test_parse_blocks_round_trip():
+  markdown = "# Title\n\ntext line 1\ntext line 2\n\n```python\n# not a heading\n```\n\n$$\nx = 1\n$$\n| a | b |\n| - | - |\n"
+  blocks = parse_blocks(markdown)
+  assert '\n'.join(text for _, text in blocks) == markdown
+  assert [kind for kind, _ in blocks] == [HEADING, TEXT, ATOMIC, ATOMIC, ATOMIC]
+
+
+def test_split_sections_ignores_headings_in_code():
+  markdown = "# A\nintro\n```\n# comment\n```\n## B\nbody"
+  sections = split_sections(markdown)
+  assert sections == ["# A\nintro\n```\n# comment\n```", "## B\nbody"]
+
+
+def test_small_sections_are_merged_within_budget():
+  sections = [f"# S{i}\n{PARAGRAPH}" for i in range(5)]
+  chunks = chunk_sections(sections, max_tokens=250)
+  assert [owners for _, owners in chunks] == [[0, 1], [2, 3], [4]]
+  for chunk, _ in chunks:
+    assert estimate_tokens(chunk) <= 250
+  assert '\n'.join(chunk for chunk, _ in chunks) == '\n'.join(sections)
+
+
+def test_oversized_section_is_split_by_sentence():
+  section = "# Long\n" + PARAGRAPH * 3
+  chunks = chunk_sections([section], max_tokens=120)
+  assert len(chunks) > 1
+  assert all(owners == [0] for _, owners in chunks)
+  assert all(estimate_tokens(chunk) <= 120 for chunk, _ in chunks)
+  # 拆分只发生在句子之间
+  assert all(chunk.rstrip().endswith(('.', 'Long')) for chunk, _ in chunks)
+
+
+def test_code_blocks_and_tables_are_never_split():
+  code = "```\n" + "\n".join(f"x{i} = {i}" for i in range(200)) + "\n```"
+  table = "\n".join(f"| row {i} | value {i} |" for i in range(100))
+  section = f"# Code\n{PARAGRAPH}\n{code}\n{table}\n{PARAGRAPH}"
+  chunks = [chunk for chunk, _ in chunk_sections([section], max_tokens=150)]
+  assert code in chunks
+  assert table in chunks
+  assert estimate_tokens(code) > 150 and estimate_tokens(table) > 150
+
+
+def test_oversized_sentence_without_punctuation_falls_back_to_words():
+  section = "# Words\n" + " ".join(["word"] * 400)
+  chunks = chunk_markdown(section, max_tokens=50)
+  assert len(chunks) > 1
+  assert all(estimate_tokens(chunk) <= 50 for chunk in chunks)
+  assert sum(chunk.count("word") for chunk in chunks) == 400
+
+
+def test_chunk_markdown_prefers_heading_boundaries():
+  markdown = "\n".join(f"# S{i}\n{PARAGRAPH}" for i in range(4))
+  chunks = chunk_markdown(markdown, max_tokens=250)
+  assert all(chunk.startswith("# S") for chunk in chunks)
@@ -0,0 +1,79 @@
+import pytest
+
+import translate
+from masking import PLACEHOLDER_PATTERN, is_references, mask, unmask
+
+
+def test_inline_formula_and_code_round_trip():
+  text = "The loss $L = \\sum_i x_i$ is computed by `compute_loss()` as in \\(a + b\\)."
+  masked, spans = mask(text)
+  assert spans == ["$L = \\sum_i x_i$", "`compute_loss()`", "\\(a + b\\)"]
+  assert masked == "The loss ⟦0⟧ is computed by ⟦1⟧ as in ⟦2⟧."
+  assert unmask(masked, spans) == text
+
+
+def test_blocks_round_trip():
+  text = "# Method\nWe minimize\n$$\nL = \\sum_i (y_i - f(x_i))^2\n$$\nusing\n```python\nloss.backward()\n```\nbelow."
+  masked, spans = mask(text)
+  assert len(spans) == 2
+  assert "\\sum" not in masked and "backward" not in masked
+  assert "We minimize" in masked and "below." in masked
+  assert unmask(masked, spans) == text
+
+
+def test_round_trip_after_reordering():
+  masked, spans = mask("Use `foo_bar()` then `baz_qux()`.")
+  # 译文可以调整占位符的顺序，也可以在括号内多出空白
+  assert unmask("先用 ⟦ 1 ⟧ 再用 ⟦0⟧。", spans) == "先用 `baz_qux()` 再用 `foo_bar()`。"
+
+
+def test_money_and_short_spans_are_kept():
+  text = "It costs $5 and $10, see `x`."
+  assert mask(text) == (text, [])
+
+
+def test_table_text_is_translated():
+  masked, spans = mask("| name | value |\n| - | - |\n| loss | $\\alpha + \\beta$ |")
+  assert spans == ["$\\alpha + \\beta$"]
+  assert "| loss |" in masked
+
+
+def test_text_with_placeholders_is_not_masked():
+  text = "literal ⟦0⟧ and `some_code()`"
+  assert mask(text) == (text, [])
+
+
+@pytest.mark.parametrize("translated", ["只有 ⟦0⟧", "⟦0⟧ ⟦1⟧ ⟦1⟧", "⟦0⟧ ⟦1⟧ ⟦2⟧", "没有占位符"])
+def test_unmask_rejects_incomplete_placeholders(translated):
+  assert unmask(translated, ["`a_b`", "`c_d`"]) is None
+
+
+def test_is_references():
+  assert is_references("## References\n[1] A. Author")
+  assert is_references("# 7. Bibliography")
+  assert is_references("# 参考文献\n")
+  assert not is_references("# Related Work\nSee references below.")
+
+
+def test_translate_section_falls_back_to_original_when_placeholder_dropped(monkeypatch):
+  section = "The loss $L = \\sum_i x_i$ is small."
+  requests = []
+
+  def fake_request(text, target_lang, metrics=None, extra_prompt="", cancelled=None):
+    requests.append(text)
+    if PLACEHOLDER_PATTERN.search(text):
+      return "损失很小。"  # 漏掉了占位符
+    return text.replace("is small", "很小")
+
+  monkeypatch.setattr(translate, 'request_translation', fake_request)
+  monkeypatch.setattr(translate, 'translation_cache', None)
+  monkeypatch.setattr(translate, 'MASKING_ENABLED', True)
+  assert translate.translate_section(section, "中文") == "The loss $L = \\sum_i x_i$ 很小."
+  assert requests == ["The loss ⟦0⟧ is small.", section]
+
+
+def test_translate_section_restores_placeholders(monkeypatch):
+  monkeypatch.setattr(translate, 'request_translation', lambda text, *args, **kwargs: f"译文: {text}")
+  monkeypatch.setattr(translate, 'translation_cache', None)
+  monkeypatch.setattr(translate, 'MASKING_ENABLED', True)
+  assert translate.translate_section("Call `run_all()` now.", "中文") == "译文: Call `run_all()` now."
@@ -0,0 +1,52 @@
+import io
+import os
+import re
+import zipfile
+
+import pytest
+
+import translate
+from blob_store import blob_store
+from translate import Executor
+
+TASK_ID = 'merge-task'
+
+
+def upload_shard(name, markdown, images):
+  buffer = io.BytesIO()
+  with zipfile.ZipFile(buffer, 'w') as zf:
+    zf.writestr(f"{os.path.splitext(name)[0]}_original.md", markdown)
+    for image, data in images.items():
+      zf.writestr(f"images/{image}", data)
+  with blob_store.open_writer(name) as writer:
+    writer.write(buffer.getvalue())
+
+
+@pytest.fixture
+def executor(monkeypatch, tmp_path):
+  monkeypatch.setattr(translate, 'mineru_cache', None)
+  executor = Executor(f"{TASK_ID}.pdf", None, TASK_ID)
+  executor.temp_dir = str(tmp_path)
+  executor.pdf_hash = 'hash'
+  return executor
+
+
+def test_clashing_images_are_prefixed_and_links_resolve(executor, tmp_path):
+  # 两个分片都有 fig.jpg，第二个分片还有名称以 fig.jpg 开头的图片
+  upload_shard(f"{TASK_ID}.shard0.zip", "# A\n![](images/fig.jpg)\n见 other_images/fig.jpg", {'fig.jpg': b'first'})
+  upload_shard(
+    f"{TASK_ID}.shard1.zip",
+    '# B\n![](images/fig.jpg "caption")\n<img src="images/fig.jpg.png">\n![](images/fig.jpg)',
+    {'fig.jpg': b'second', 'fig.jpg.png': b'third'},
+  )
+  executor.shard_names = [f"{TASK_ID}.shard0.zip", f"{TASK_ID}.shard1.zip"]
+  executor.step11()
+
+  auto_dir = tmp_path / TASK_ID / "auto"
+  md = (auto_dir / f"{TASK_ID}.md").read_text(encoding='utf-8')
+  links = re.findall(r'(?<![\w/])images/[^\s)"]+', md)
+  assert links == ["images/s0_fig.jpg", "images/s1_fig.jpg", "images/s1_fig.jpg.png", "images/s1_fig.jpg"]
+  assert [(auto_dir / link).read_bytes() for link in links] == [b'first', b'second', b'third', b'second']
+  assert "other_images/fig.jpg" in md  # 不是 MinerU 输出的图片，不改写
+  assert md.index("# A") < md.index("# B")
+  assert not any(blob_store.exists(name) for name in executor.shard_names)
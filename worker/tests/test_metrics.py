@@ -0,0 +1,14 @@
+import pytest
+
+from metrics import check_pool
+
+
+@pytest.mark.parametrize('pool', ['prefork', 'processes'])
+def test_prefork_without_multiproc_dir_is_rejected(pool):
+  with pytest.raises(SystemExit, match='multiproc_dir'):
+    check_pool(pool)
+
+
+@pytest.mark.parametrize('pool', ['threads', 'solo'])
+def test_single_process_pools_are_accepted(pool):
+  check_pool(pool)
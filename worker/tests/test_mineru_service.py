@@ -0,0 +1,96 @@
+"""常驻 MinerU 服务的取消: 任务取消时终止正在转换的子进程，由新的子进程代替
+
+转换函数替换为按文件名决定快慢的替身，不需要安装 magic-pdf。
+"""
+from multiprocessing.connection import Listener
+import os
+import threading
+import time
+
+import pytest
+
+import mineru_service
+from abort import TaskCancelled
+from mineru_client import MineruService
+
+AUTHKEY = 'test-authkey'
+
+
+def fake_convert(pdf_path, output_dir):
+  """slow.pdf 一直转换直到被终止，其他文件立即生成 markdown"""
+  name = os.path.splitext(os.path.basename(pdf_path))[0]
+  md_dir = os.path.join(output_dir, name, "auto")
+  os.makedirs(md_dir, exist_ok=True)
+  with open(os.path.join(output_dir, f"{name}.pid"), 'w') as f:
+    f.write(str(os.getpid()))
+  if name == 'slow':
+    time.sleep(60)
+  with open(os.path.join(md_dir, f"{name}.md"), 'w') as f:
+    f.write("# converted")
+
+
+def wait_for(predicate, timeout=20):
+  deadline = time.monotonic() + timeout
+  while not predicate():
+    assert time.monotonic() < deadline, "等待超时"
+    time.sleep(0.05)
+
+
+def is_alive(pid):
+  try:
+    os.kill(pid, 0)
+  except ProcessLookupError:
+    return False
+  # 已退出但尚未被回收的子进程
+  with open(f"/proc/{pid}/stat") as f:
+    return f.read().split()[2] != 'Z'
+
+
+@pytest.fixture
+def client(monkeypatch):
+  monkeypatch.setattr(mineru_service, 'pool', mineru_service.ConvertPool(1, fake_convert))
+  listener = Listener(('127.0.0.1', 0), authkey=AUTHKEY.encode())
+
+  def serve():
+    while True:
+      try:
+        conn = listener.accept()
+      except OSError:
+        return
+      threading.Thread(target=mineru_service.handle, args=(conn,), daemon=True).start()
+
+  threading.Thread(target=serve, daemon=True).start()
+  yield MineruService(port=listener.address[1], authkey=AUTHKEY)
+  listener.close()
+  while not mineru_service.pool.idle.empty():
+    mineru_service.pool.idle.get().kill()
+
+
+def test_convert_through_service(client, tmp_path):
+  assert client.convert(str(tmp_path / "paper.pdf"), str(tmp_path))
+  assert (tmp_path / "paper" / "auto" / "paper.md").read_text() == "# converted"
+
+
+def test_cancel_kills_in_flight_conversion(client, tmp_path):
+  cancelled = threading.Event()
+  errors = []
+
+  def run():
+    try:
+      client.convert(str(tmp_path / "slow.pdf"), str(tmp_path), cancelled)
+    except TaskCancelled as e:
+      errors.append(e)
+
+  thread = threading.Thread(target=run)
+  thread.start()
+  wait_for(lambda: (tmp_path / "slow.pid").exists() and (tmp_path / "slow.pid").read_text())
+  pid = int((tmp_path / "slow.pid").read_text())
+  cancelled.set()
+  thread.join(5)
+  assert errors and not thread.is_alive()
+  wait_for(lambda: not is_alive(pid))
+  assert not (tmp_path / "slow" / "auto" / "slow.md").exists()
+
+  # 新的子进程代替被终止的子进程，之后的转换不受影响
+  assert client.convert(str(tmp_path / "next.pdf"), str(tmp_path))
+  assert int((tmp_path / "next.pid").read_text()) != pid
@@ -0,0 +1,79 @@
+import io
+import os
+import zipfile
+
+from packager import write_zip
+
+
+class NonSeekableWriter:
+  """只支持 write 的文件对象，与 blob_store 的写入对象相同"""
+  def __init__(self):
+    self.buffer = io.BytesIO()
+
+  def write(self, data) -> int:
+    return self.buffer.write(data)
+
+  def flush(self):
+    pass
+
+  def seekable(self):
+    return False
+
+  def tell(self):
+    raise io.UnsupportedOperation("tell")
+
+  def seek(self, *args):
+    raise io.UnsupportedOperation("seek")
+
+
+def test_compress_type_by_suffix_and_round_trip(tmp_path):
+  files = {
+    'paper_original.md': b"# Title\n" + b"text " * 1000,
+    'images/a.PNG': os.urandom(2048),
+    'images/b.jpg': os.urandom(2048),
+    'layout.json': b'{"pages": []}' * 100,
+  }
+  entries = []
+  for name, data in files.items():
+    path = tmp_path / name.replace('/', '_')
+    path.write_bytes(data)
+    entries.append((name, str(path)))
+
+  writer = NonSeekableWriter()
+  write_zip(writer, entries)
+  with zipfile.ZipFile(io.BytesIO(writer.buffer.getvalue())) as zf:
+    assert zf.namelist() == list(files)
+    types = {info.filename: info.compress_type for info in zf.infolist()}
+    assert types == {
+      'paper_original.md': zipfile.ZIP_DEFLATED,
+      'images/a.PNG': zipfile.ZIP_STORED,
+      'images/b.jpg': zipfile.ZIP_STORED,
+      'layout.json': zipfile.ZIP_DEFLATED,
+    }
+    for name, data in files.items():
+      assert zf.read(name) == data
+    assert zf.testzip() is None
+
+
+def test_entries_are_copied_from_source_zip(tmp_path):
+  image = os.urandom(4096)
+  source = io.BytesIO()
+  with zipfile.ZipFile(source, 'w', zipfile.ZIP_DEFLATED) as zf:
+    zf.writestr('paper_original.md', "# 标题\n正文" * 100)
+    zf.writestr('images/fig.png', image)
+  translated = tmp_path / 'paper_translated.md'
+  translated.write_text("# Title\ntext", encoding='utf-8')
+
+  writer = NonSeekableWriter()
+  with zipfile.ZipFile(source) as src_zip:
+    write_zip(writer, [(info.filename, (src_zip, info)) for info in src_zip.infolist()] + [
+      ('paper_translated.md', str(translated)),
+    ])
+  with zipfile.ZipFile(io.BytesIO(writer.buffer.getvalue())) as zf:
+    assert zf.read('paper_original.md').decode('utf-8') == "# 标题\n正文" * 100
+    assert zf.read('images/fig.png') == image
+    assert zf.read('paper_translated.md') == b"# Title\ntext"
+    # 按目标文件名重新选择压缩方式，不沿用来源 zip 的设置
+    assert zf.getinfo('images/fig.png').compress_type == zipfile.ZIP_STORED
+    assert zf.getinfo('paper_original.md').compress_type == zipfile.ZIP_DEFLATED
+    assert zf.testzip() is None
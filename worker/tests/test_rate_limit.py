@@ -0,0 +1,147 @@
+import threading
+
+import httpx
+import openai
+import pytest
+
+import rate_limit
+from abort import TaskCancelled
+from rate_limit import RateLimiter
+
+
+@pytest.fixture
+def limiter():
+  # 每分钟 60 个请求、6000 个 token，桶容量为限额的 0.1 倍: 6 个请求、600 个 token
+  return RateLimiter(rpm=60, tpm=6000, burst=0.1, decrease=0.5, min_scale=0.2, recovery=0.25)
+
+
+def acquire_once(limiter, tokens):
+  """执行一次取令牌的脚本，返回需要等待的毫秒数"""
+  return limiter.acquire_script(
+    keys=[limiter.requests_key, limiter.tokens_key, limiter.open_key, limiter.scale_key],
+    args=[limiter.rpm, limiter.tpm, tokens, limiter.burst],
+  )
+
+
+def level(redis_db, key):
+  return float(redis_db.hget(key, 'level'))
+
+
+def rate_limit_error(headers):
+  response = httpx.Response(429, headers=headers, request=httpx.Request('POST', 'http://llm/v1/chat/completions'))
+  return openai.RateLimitError("rate limited", response=response, body=None)
+
+
+def test_acquire_deducts_from_both_buckets(limiter, redis_db):
+  assert limiter.acquire(100) == 0
+  assert level(redis_db, limiter.requests_key) == pytest.approx(5, abs=0.01)
+  assert level(redis_db, limiter.tokens_key) == pytest.approx(500, abs=1)
+
+
+def test_acquire_waits_without_deducting(limiter, redis_db):
+  assert acquire_once(limiter, 600) == 0
+  # token 桶每毫秒补充 0.1 个，300 个 token 需要约 3 秒
+  assert 2900 <= acquire_once(limiter, 300) <= 3000
+  assert level(redis_db, limiter.tokens_key) < 10
+  assert level(redis_db, limiter.requests_key) == pytest.approx(5, abs=0.01)
+
+
+def test_requests_bucket_limits_small_requests(limiter):
+  for _ in range(6):
+    assert acquire_once(limiter, 1) == 0
+  # 每秒补充 1 个请求
+  assert 900 <= acquire_once(limiter, 1) <= 1000
+
+
+def test_buckets_refill_up_to_capacity(limiter, redis_db):
+  assert acquire_once(limiter, 600) == 0
+  ts = int(redis_db.hget(limiter.tokens_key, 'ts'))
+  redis_db.hset(limiter.tokens_key, 'ts', ts - 2000)  # 2 秒前: 补充 200 个
+  assert acquire_once(limiter, 150) == 0
+  assert level(redis_db, limiter.tokens_key) == pytest.approx(50, abs=1)
+  redis_db.hset(limiter.tokens_key, 'ts', ts - 60000)  # 1 分钟前: 补满但不超过容量
+  assert acquire_once(limiter, 0) == 0
+  assert level(redis_db, limiter.tokens_key) == pytest.approx(600, abs=1)
+
+
+def test_cost_larger_than_capacity_is_capped(limiter):
+  # 单个请求超出桶容量时按容量扣减，不会永远等待
+  assert acquire_once(limiter, 5000) == 0
+  assert acquire_once(limiter, 5000) > 0
+
+
+def test_settle_corrects_estimate(limiter, redis_db):
+  limiter.acquire(100)
+  limiter.settle(estimated=100, actual=250)
+  assert level(redis_db, limiter.tokens_key) == pytest.approx(350, abs=1)
+  limiter.settle(estimated=100, actual=50)
+  assert level(redis_db, limiter.tokens_key) == pytest.approx(400, abs=1)
+
+
+def test_settle_without_bucket_does_not_create_it(limiter, redis_db):
+  limiter.settle(estimated=100, actual=250)
+  assert not redis_db.exists(limiter.tokens_key)
+
+
+def test_throttle_opens_breaker_and_lowers_scale(limiter, redis_db):
+  limiter.throttle(5)
+  assert 4900 <= redis_db.pttl(limiter.open_key) <= 5000
+  assert float(redis_db.get(limiter.scale_key)) == 0.5
+  # 熔断打开期间取令牌返回剩余的冷却时间
+  assert 4900 <= acquire_once(limiter, 1) <= 5000
+  # 同时收到的其他 429 不再重复降速
+  limiter.throttle(5)
+  assert float(redis_db.get(limiter.scale_key)) == 0.5
+
+
+def test_breaker_closes_and_scale_recovers(limiter, redis_db):
+  limiter.throttle(5)
+  redis_db.delete(limiter.open_key)  # 冷却结束
+  limiter.throttle(5)
+  limiter.throttle(5)
+  assert float(redis_db.get(limiter.scale_key)) == 0.25
+  redis_db.delete(limiter.open_key)
+  limiter.throttle(5)
+  assert float(redis_db.get(limiter.scale_key)) == 0.2  # 不低于 min_scale
+
+  redis_db.delete(limiter.open_key)
+  assert acquire_once(limiter, 1) == 0
+  # 降速后桶按 scale 倍的速率补充
+  for _ in range(5):
+    acquire_once(limiter, 1)
+  assert 4500 <= acquire_once(limiter, 1) <= 5000
+  # 每次成功的请求恢复 recovery，恢复到 1 后删除系数
+  for expected in (0.45, 0.7, 0.95):
+    limiter.settle(1, 1)
+    assert float(redis_db.get(limiter.scale_key)) == pytest.approx(expected)
+  limiter.settle(1, 1)
+  assert not redis_db.exists(limiter.scale_key)
+
+
+def test_acquire_stops_waiting_when_cancelled(limiter):
+  limiter.throttle(60)
+  cancelled = threading.Event()
+  cancelled.set()
+  with pytest.raises(TaskCancelled):
+    limiter.acquire(1, cancelled)
+
+
+def test_backoff_honours_retry_after(limiter, redis_db, monkeypatch):
+  monkeypatch.setattr(rate_limit.random, 'uniform', lambda a, b: a)
+  assert limiter.backoff(rate_limit_error({'retry-after': '7'}), 0) == 7
+  assert 6900 <= redis_db.pttl(limiter.open_key) <= 7000
+
+
+def test_backoff_ignores_unparsable_retry_after(limiter, redis_db, monkeypatch):
+  monkeypatch.setattr(rate_limit.random, 'uniform', lambda a, b: b)
+  delay = limiter.backoff(rate_limit_error({'retry-after': 'Wed, 21 Oct 2015 07:28:00 GMT'}), 1)
+  assert delay == min(rate_limit.RATE_LIMIT_BACKOFF_MAX, rate_limit.RATE_LIMIT_BACKOFF_BASE * 2)
+  assert redis_db.pttl(limiter.open_key) > 0
+
+
+def test_backoff_for_other_errors(limiter, redis_db):
+  request = httpx.Request('POST', 'http://llm/v1/chat/completions')
+  assert limiter.backoff(openai.APITimeoutError(request), 0) is not None
+  assert not redis_db.exists(limiter.open_key)  # 只有 429 打开熔断
+  response = httpx.Response(400, request=request)
+  assert limiter.backoff(openai.BadRequestError("bad request", response=response, body=None), 0) is None
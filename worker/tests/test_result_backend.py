@@ -0,0 +1,40 @@
+from celery.app.task import Context
+from celery.contrib.abortable import AbortableAsyncResult
+import pytest
+
+from celery_app import app
+from metrics import TaskMetrics
+
+
+@pytest.fixture
+def backend():
+  return app.backend
+
+
+def test_root_task_result_carries_metrics(backend):
+  TaskMetrics('root').add(llm_requests=2, step1_seconds=0.5)
+  request = Context(id='root', root_id='root')
+  meta = backend._get_result_meta('a.zip', 'SUCCESS', None, request)
+  assert meta['metrics'] == {'llm_requests': 2, 'step1_seconds': 0.5}
+  assert request.metrics == meta['metrics']
+
+
+def test_progress_and_child_tasks_do_not_carry_metrics(backend):
+  TaskMetrics('root').add(llm_requests=1)
+  assert 'metrics' not in backend._get_result_meta(None, 'PROGRESS', None, Context(id='root', root_id='root'))
+  assert 'metrics' not in backend._get_result_meta('s.zip', 'SUCCESS', None, Context(id='shard', root_id='root'))
+
+
+def test_store_progress(backend):
+  assert backend.store_progress('t', {'progress': 10})
+  result = AbortableAsyncResult('t', app=app)
+  assert (result.state, result.info['progress']) == ('PROGRESS', 10)
+  assert backend.store_progress('t', {'progress': 20})
+  assert AbortableAsyncResult('t', app=app).info['progress'] == 20
+
+
+def test_store_progress_never_overwrites_aborted(backend):
+  backend.store_progress('t', {'progress': 10})
+  AbortableAsyncResult('t', app=app).abort()
+  assert not backend.store_progress('t', {'progress': 20})
+  assert AbortableAsyncResult('t', app=app).is_aborted()
@@ -0,0 +1,80 @@
+import pytest
+
+import translate
+from cache import SectionStore
+from translate import split_translations, translate_text
+
+V1 = "# Intro\nintro text\n\n# Method\nmethod text\n\n# Results\nresults text"
+V2 = "# Intro\nintro text\n\n# Method\nmethod text, revised\n\n# Results\nresults text"
+
+
+def lines(text):
+  """忽略空行比较 markdown"""
+  return [line for line in text.splitlines() if line.strip()]
+
+
+class Tracker:
+  def split_progress(self, total):
+    pass
+
+  def step(self):
+    return False
+
+
+@pytest.fixture
+def sent(monkeypatch):
+  """替换大模型请求，记录发送的原文，译文为原文加上标记"""
+  sent = []
+
+  def fake_translate_section(section, target_lang, *args):
+    sent.append(section)
+    return section.replace(" text", " 译文")
+
+  monkeypatch.setattr(translate, 'translate_section', fake_translate_section)
+  monkeypatch.setattr(translate, 'section_store', SectionStore(ttl=60))
+  monkeypatch.setattr(translate, 'MASKING_SKIP_REFERENCES', False)
+  return sent
+
+
+def test_split_translations():
+  chunks = [("# A\na", [0]), ("# B\nb\n# C\nc", [1, 2]), ("# D\nd\n# E\ne", [3, 4])]
+  translated = ["# A\n甲", "# B\n乙\n# C\n丙", "# D\n丁 戊"]  # 最后一块的标题被合并
+  assert split_translations(chunks, translated) == {0: "# A\n甲", 1: "# B\n乙", 2: "# C\n丙"}
+
+
+def test_split_translations_joins_pieces_of_one_section():
+  chunks = [("# A\npart 1", [0]), ("part 2", [0]), ("# B\nb", [1])]
+  assert split_translations(chunks, ["# A\n一", "二", "# B\n乙"]) == {0: "# A\n一\n\n二", 1: "# B\n乙"}
+
+
+def test_document_id_ignores_version_suffix():
+  assert SectionStore.document_id("2401.12345v2.pdf", "alice") == SectionStore.document_id("2401.12345V1.pdf", "alice")
+  assert SectionStore.document_id("paper.pdf", "alice") != SectionStore.document_id("paper.pdf", "bob")
+
+
+def test_unchanged_sections_are_reused(sent):
+  document = SectionStore.document_id("paper_v1", "alice")
+  first = translate_text(V1, "中文", Tracker(), document=document)
+  assert first == V1.replace(" text", " 译文")
+
+  sent.clear()
+  document = SectionStore.document_id("paper_v2", "alice")
+  second = translate_text(V2, "中文", Tracker(), document=document)
+  # 只有修改过的段落发送给大模型，未变化的段落沿用上一版本的译文
+  assert [section.strip() for section in sent] == ["# Method\nmethod text, revised"]
+  assert lines(second) == lines(V2.replace(" text", " 译文"))
+
+
+def test_same_name_from_another_submitter_is_not_reused(sent):
+  translate_text(V1, "中文", Tracker(), document=SectionStore.document_id("paper", "alice"))
+  sent.clear()
+  translate_text(V1, "中文", Tracker(), document=SectionStore.document_id("paper", "bob"))
+  assert sent == [V1]
+
+
+def test_force_translates_everything(sent):
+  document = SectionStore.document_id("paper", "alice")
+  translate_text(V1, "中文", Tracker(), document=document)
+  sent.clear()
+  translate_text(V1, "中文", Tracker(), document=document, force=True)
+  assert sent == [V1]
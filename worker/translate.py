@@ -1,67 +1,248 @@
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
+from typing import Dict, List, Tuple
+import fitz  # PyMuPDF库，用于按页拆分 PDF
+import hashlib
+import openai
 import os
-import shutil
-import subprocess
 import re
+import shutil
+import threading
+import time
+import zipfile
 
 from celery.contrib.abortable import AbortableTask
 
 # 加载配置
-from config import CLEAN_UP_TEMP, MINERU_PATH, MODEL, PROMPTS, TEMP_DIR, client, r
+from config import (
+  CHECKPOINT_TTL, CLEAN_UP_TEMP, MASKING_ENABLED, MASKING_SKIP_REFERENCES, MAX_OUTPUT_TOKENS, MINERU_PATH, MODEL,
+  PROMPTS, RATE_LIMIT_MAX_RETRIES, SHARD_MIN_PAGES, SHARD_PAGES, SHARDING_ENABLED, STORAGE_INTERMEDIATE_TTL,
+  STORAGE_RESULT_TTL, TEMP_DIR, TRANSLATE_CONCURRENCY, client, r
+)
+from chunker import chunk_sections, estimate_tokens, split_sections
+from masking import MASK_PROMPT, is_references, mask, unmask
+from abort import TaskCancelled, run_cancellable
+from checkpoint import Checkpoint
+from blob_store import blob_store
+from cache import SectionStore, mineru_cache, section_store, translation_cache
+from mineru_client import mineru_service
+from packager import write_zip
+from events import publish_event
+from metrics import CountingWriter, TaskMetrics
+from rate_limit import llm_limiter
 
 
-def split_markdown_by_headers(markdown_content):
-  """将markdown内容按照大标题分段"""
-  # 使用正则表达式匹配以#开头的标题
-  # 确保#后面有空格，避免匹配代码中的注释
-  header_pattern = r'^(#{1,6}\s+.+)$'
-  sections = []
-  current_section = []
-  
-  for line in markdown_content.split('\n'):
-    if re.match(header_pattern, line):
-      if current_section:
-        sections.append('\n'.join(current_section))
-      current_section = [line]
-    else:
-      current_section.append(line)
-  
-  if current_section:
-    sections.append('\n'.join(current_section))
-  
-  return sections
+def request_translation(
+  section, target_lang, metrics: TaskMetrics = None, extra_prompt: str = "", cancelled: threading.Event = None
+):
+  """向大模型发送一次翻译请求，发送前经过整个集群共享的限流，429、超时等错误按退避规则重试
+
+  译文以流式接收，任务被取消时在收到下一个数据块时关闭连接，服务商随即停止生成。
+  Args:
+    extra_prompt: 附加在 prompts 之后的要求
+    cancelled: 任务被取消时被设置
+  Raises:
+    TaskCancelled: 请求过程中任务被取消
+  """
+  prompt = f"请将以下Markdown格式的论文段落逐句翻译成{target_lang}。"
+  prompt += PROMPTS + extra_prompt
+  prompt += "\n\n" + section
+  # 译文的长度按原文估算，请求完成后按实际用量修正
+  estimated = estimate_tokens(prompt) + estimate_tokens(section)
 
-def translate_text(text, target_lang, tracker):
-  """将文本按标题分段
+  for attempt in range(RATE_LIMIT_MAX_RETRIES + 1):
+    waited = llm_limiter.acquire(estimated, cancelled)
+    if metrics is not None and waited:
+      metrics.llm_throttled(waited)
+    start = time.perf_counter()
+    try:
+      stream = client.chat.completions.create(
+        messages=[
+          {
+            "role": "user",
+            "content": prompt,
+          }
+        ],
+        model=MODEL,
+        max_tokens=MAX_OUTPUT_TOKENS,
+        stream=True,
+        stream_options={"include_usage": True},
+      )
+      parts, usage = [], None
+      with stream:
+        for chunk in stream:
+          if cancelled is not None and cancelled.is_set():
+            raise TaskCancelled()
+          if chunk.choices:
+            parts.append(chunk.choices[0].delta.content or "")
+          if chunk.usage is not None:
+            usage = chunk.usage
+    except TaskCancelled:
+      raise
+    except Exception as e:
+      if metrics is not None:
+        metrics.llm_error(time.perf_counter() - start, rate_limited=isinstance(e, openai.RateLimitError))
+      delay = llm_limiter.backoff(e, attempt)
+      if delay is None or attempt == RATE_LIMIT_MAX_RETRIES:
+        raise
+      print(f"翻译请求失败，{delay:.1f} 秒后重试: {str(e)}")
+      if cancelled is None:
+        time.sleep(delay)
+      elif cancelled.wait(delay):
+        raise TaskCancelled()
+      continue
+    llm_limiter.settle(estimated, usage.total_tokens if usage else estimated)
+    if metrics is not None:
+      metrics.llm_request(
+        time.perf_counter() - start,
+        usage.prompt_tokens if usage else 0,
+        usage.completion_tokens if usage else 0,
+      )
+    return "".join(parts)
+
+def translate_section(
+  section, target_lang, metrics: TaskMetrics = None, refresh: bool = False, cancelled: threading.Event = None
+):
+  """使用大模型API翻译单个段落，命中翻译缓存时直接返回缓存结果
+
+  公式、代码块等不需要翻译的内容替换为占位符后再发送，译文返回后还原；
+  译文中的占位符不完整时改为发送原文重新翻译。
+  Args:
+    metrics: 传入时记录请求耗时和 token 用量
+    refresh: 为 True 时不读取缓存，重新翻译后覆盖缓存
+    cancelled: 任务被取消时被设置，进行中的请求随即中止
+  """
+  if translation_cache is not None:
+    cache_key = translation_cache.make_key(section, target_lang)
+    cached = None if refresh else translation_cache.get(cache_key)
+    if cached is not None:
+      if metrics is not None:
+        metrics.llm_cache_hit()
+      return cached
+
+  translated = None
+  masked, spans = mask(section) if MASKING_ENABLED else (section, [])
+  if spans:
+    translated = unmask(request_translation(masked, target_lang, metrics, MASK_PROMPT, cancelled), spans)
+    if translated is None:
+      print("译文中的占位符不完整，改为翻译原文")
+    elif metrics is not None:
+      metrics.tokens_saved('masked', estimate_tokens(section) - estimate_tokens(masked))
+  if translated is None:
+    translated = request_translation(section, target_lang, metrics, cancelled=cancelled)
+  if translation_cache is not None:
+    translation_cache.set(cache_key, translated)
+  return translated
+
+def split_translations(chunks: List[Tuple[str, List[int]]], translated_chunks: List[str]) -> Dict[int, str]:
+  """把各块的译文拆回段落，返回段落序号到译文的映射
+
+  只涉及一个段落的块整块归属该段落；涉及多个段落的块按译文中的标题拆分，
+  拆出的数量与段落数不一致时 (如大模型合并或漏掉了标题) 放弃这些段落，下次仍重新翻译。
+  """
+  parts = defaultdict(list)
+  failed = set()
+  for (_, owners), translated in zip(chunks, translated_chunks):
+    pieces = [translated] if len(owners) == 1 else split_sections(translated.strip())
+    if len(pieces) != len(owners):
+      failed.update(owners)
+      continue
+    for i, piece in zip(owners, pieces):
+      parts[i].append(piece.strip())
+  return {i: '\n\n'.join(pieces) for i, pieces in parts.items() if i not in failed}
+
+def translate_text(
+  text, target_lang, tracker, checkpoint: Checkpoint = None, metrics: TaskMetrics = None,
+  document: str = None, force: bool = False, cancelled: threading.Event = None
+):
+  """将文本按标题分段、按 token 预算分块，并发翻译各块后按原顺序合并
+  Args:
+    checkpoint: 传入时每完成一个段落都保存译文，重新执行时跳过已完成的段落
+    metrics: 传入时记录每次大模型请求的耗时和 token 用量
+    document: 文档 ID (见 SectionStore.document_id)，传入时与该文档上一版本相同的段落沿用旧译文，只翻译新增或修改过的段落
+    force: 为 True 时不沿用旧译文、不读取翻译缓存，完整重新翻译
+    cancelled: 任务被取消时被设置，不等待进行中的段落立即返回
   Returns:
     None|str :返回  None 表示被取消
   """
-  """使用大模型API翻译文本"""
-  sections = split_markdown_by_headers(text)
-  translated_sections = []
-  tracker.split_progress(len(sections))
-  
-  for section in sections:
-    prompt = f"请将以下Markdown格式的论文段落逐句翻译成{target_lang}。"
-    prompt += PROMPTS
-    prompt += "\n\n" + section
-
-    chat_completion = client.chat.completions.create(
-      messages=[
-        {
-          "role": "user",
-          "content": prompt,
-        }
-      ],
-      model=MODEL,
-      max_tokens=8192,
-    )
-    translated_sections.append(chat_completion.choices[0].message.content)
+  doc_sections = split_sections(text)
+  reused = {}
+  if section_store is not None and document is not None:
+    document_key = section_store.document_key(document, target_lang)
+    section_keys = [SectionStore.section_key(section) for section in doc_sections]
+    previous = {} if force else section_store.load(document_key)
+    reused = {i: previous[key] for i, key in enumerate(section_keys) if key in previous}
+    if metrics is not None:
+      metrics.sections_reused(len(reused))
+  # 参考文献不需要翻译，原样保留
+  kept = {}
+  if MASKING_SKIP_REFERENCES:
+    kept = {i: section for i, section in enumerate(doc_sections) if i not in reused and is_references(section)}
+    if kept and metrics is not None:
+      metrics.tokens_saved('references', sum(estimate_tokens(section) for section in kept.values()))
+  fixed = {**reused, **kept}
+
+  # 每一段连续的待翻译段落各自分块，沿用的译文和原样保留的段落按原位置插入
+  chunks = []  # (块的原文, 涉及的段落序号)
+  outline = []  # 按原文顺序排列的 (不需要翻译的段落序号, None) 或 (None, 块序号)
+  start = 0
+  for i in range(len(doc_sections) + 1):
+    if i == len(doc_sections) or i in fixed:
+      for chunk, owners in chunk_sections(doc_sections[start:i]):
+        outline.append((None, len(chunks)))
+        chunks.append((chunk, [start + k for k in owners]))
+      if i < len(doc_sections):
+        outline.append((i, None))
+      start = i + 1
+
+  sections = [chunk for chunk, _ in chunks]
+  translated_sections = [None] * len(sections)
+  tracker.split_progress(max(len(sections), 1))
+
+  done = {}
+  if checkpoint is not None:
+    source_hash = hashlib.sha256('\0'.join([target_lang] + sections).encode('utf-8')).hexdigest()
+    done = checkpoint.load_sections(source_hash)
+  for i, translated in done.items():
+    translated_sections[i] = translated
     if tracker.step():
       return None  # 翻译过程被取消
+
+  # 最多同时有 TRANSLATE_CONCURRENCY 个段落在请求中
+  pool = ThreadPoolExecutor(max_workers=TRANSLATE_CONCURRENCY)
+  try:
+    futures = {
+      pool.submit(translate_section, section, target_lang, metrics, force, cancelled): i
+      for i, section in enumerate(sections) if i not in done
+    }
+    pending = set(futures)
+    while pending:
+      # 定时醒来检查取消信号，不必等到下一个段落完成
+      finished, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+      if cancelled is not None and cancelled.is_set():
+        return None  # 翻译过程被取消
+      for future in finished:
+        i = futures[future]
+        translated_sections[i] = future.result()
+        if checkpoint is not None:
+          checkpoint.save_section(i, translated_sections[i])
+        if tracker.step():
+          return None  # 翻译过程被取消
+  finally:
+    # 取消或出错时丢弃尚未开始的段落，不等待进行中的请求
+    pool.shutdown(wait=False, cancel_futures=True)
   
-  # 合并所有翻译后的段落
-  return '\n\n'.join(translated_sections)
+  if section_store is not None and document is not None:
+    # 保存本次的段落译文，供下一版本使用
+    translations = {**reused, **split_translations(chunks, translated_sections)}
+    section_store.save(document_key, {section_keys[i]: text for i, text in translations.items()})
+
+  # 按原顺序合并所有翻译后的段落
+  return '\n\n'.join(
+    fixed[i] if j is None else translated_sections[j]
+    for i, j in outline
+  )
 
 class ProgressTracker:
   """用于追踪 LLM 翻译过程的进度情况"""
@@ -80,10 +261,28 @@ class ProgressTracker:
     self.progress += self.progress_step
     return self.executor.progress(self.task, self.progress)
 
+# markdown 中引用 MinerU 输出图片的路径，不匹配 other_images/ 等其他目录
+IMAGE_LINK_PATTERN = re.compile(r'(?<![\w./-])images/([^\s()\[\]<>"\']+)')
+
 class Executor:
-  def __init__(self, filename, target_lang):
+  def __init__(self, filename, target_lang, task_id, title=None):
+    """
+    Args:
+      filename: 上传的 PDF 在 blob_store 中的文件名，中间结果和最终结果都以其去掉扩展名的部分为前缀
+      title: 用户上传时的文件名，只用于结果 zip 中的文件命名，默认与 filename 相同
+    """
     self.target_lang=target_lang
     self.filename = filename
+    self.title = os.path.splitext(os.path.basename(title or filename))[0]
+    self.checkpoint = Checkpoint(task_id)
+    self.metrics = TaskMetrics(task_id)
+    self.shard = False  # 分片的转换结果只是中间结果
+    self.force = False  # 不沿用上一版本的译文和翻译缓存，完整重新翻译
+    self.submitter = None  # 提交者，为空时不沿用上一版本的译文
+    self.cancelled = threading.Event()  # 收到取消信号时被设置，由 run_steps 登记
+    # 多语言翻译的子任务: 进度汇总到原任务，取消原任务时一并取消
+    self.root_id = None
+    self.lang_count = 1
   
   def progress(self, task, progress) -> bool:
     """检查取消状态并更新进度
@@ -93,46 +292,83 @@ class Executor:
     Returns:
       bool: True 表示被取消
     """
-    if task.is_aborted():  # 检查取消状态
-      self.clean_up()
+    task_id = self.root_id or task.request.id
+    if self.cancelled.is_set() or task.is_aborted(task_id=task_id):  # 检查取消状态
+      self.clean_up(remove_temp=True)
       return True
     else:
-      task.update_state(
-        state='PROGRESS', 
-        meta={
-          'progress': progress,
-          'status': f'处理中... {progress}%',
-          'timestamp': datetime.now().isoformat()
-        }
-      )
+      if self.root_id is not None:
+        # 记录本语言的进度，原任务的进度取各语言的平均值
+        pipe = r.pipeline()
+        pipe.hset(f"langs:{self.root_id}", self.target_lang, progress)
+        pipe.expire(f"langs:{self.root_id}", CHECKPOINT_TTL)
+        pipe.hvals(f"langs:{self.root_id}")
+        progress = sum(int(p) for p in pipe.execute()[-1]) // self.lang_count
+      # 检查之后才到达的取消不会被进度覆盖，写入被拒绝时同样视为已取消
+      if not task.backend.store_progress(task_id, {
+        'progress': progress,
+        'status': f'处理中... {progress}%',
+        'timestamp': datetime.now().isoformat(),
+        'metrics': self.metrics.breakdown(),
+      }):
+        self.clean_up(remove_temp=True)
+        return True
+      publish_event(task_id, 'PROGRESS', progress=progress)
       return False
 
   def step1(self):
-    """创建本任务使用的临时目录"""
+    """创建本任务使用的临时目录，任务被重新执行时沿用上次的临时目录"""
     try:
-      self.temp_dir = os.path.join(TEMP_DIR, os.urandom(8).hex())
+      temp_dir = self.checkpoint.get('temp_dir')
+      if temp_dir is None or not os.path.isdir(temp_dir):
+        temp_dir = os.path.join(TEMP_DIR, os.urandom(8).hex())
+        self.checkpoint.set(temp_dir=temp_dir)
+      self.temp_dir = temp_dir
       os.makedirs(self.temp_dir, exist_ok=True)
     except Exception as e:
       raise Exception("创建临时目录失败") from e
 
   def step2(self):
-    """保存上传到 Redis 的 PDF"""
+    """分块下载上传到 Redis 的 PDF，同时计算内容哈希"""
     try:
       self.input_pdf_path = os.path.join(self.temp_dir, self.filename)
-      file_data = r.get(f"file:{self.filename}")
+      pdf_hash = hashlib.sha256()
       with open(self.input_pdf_path, 'wb') as f:
-        f.write(file_data)
+        for chunk in blob_store.iter_chunks(self.filename):
+          f.write(chunk)
+          pdf_hash.update(chunk)
+      self.pdf_hash = pdf_hash.hexdigest()
+      self.metrics.transfer('download', os.path.getsize(self.input_pdf_path))
     except Exception as e:
       raise Exception("保存上传到 Redis 的 PDF 失败") from e
 
   def step3(self):
-    """使用 MinerU magic-pdf 转换 PDF 生成 markdown 和图片"""
+    """使用 MinerU magic-pdf 转换 PDF 生成 markdown 和图片，相同的 PDF 直接使用缓存的转换结果
+
+    分片不读写缓存: 分片的内容哈希只对应某一种拆分方式，合并后的结果已按整个 PDF 的哈希缓存。
+    """
     try:
-      subprocess.run([
-        MINERU_PATH,
-        "-p", self.input_pdf_path,
-        "-o", self.temp_dir
-      ], check=True)
+      pdf_name = os.path.splitext(os.path.basename(self.input_pdf_path))[0]
+      auto_dir = os.path.join(self.temp_dir, pdf_name, "auto")
+      if os.path.exists(os.path.join(auto_dir, f"{pdf_name}.md")):
+        return  # 任务被重新执行，沿用上次的转换结果
+      cache = mineru_cache if not self.shard else None
+      if cache is not None:
+        cache_key = cache.make_key(self.pdf_hash)
+        if cache.restore(cache_key, auto_dir, pdf_name):
+          return
+      # 优先使用常驻的 MinerU 服务，不可用时退回到启动 magic-pdf 子进程
+      # 任务被取消时终止 magic-pdf 的整个进程组
+      if mineru_service is None or not mineru_service.convert(self.input_pdf_path, self.temp_dir, self.cancelled):
+        run_cancellable([
+          MINERU_PATH,
+          "-p", self.input_pdf_path,
+          "-o", self.temp_dir
+        ], self.cancelled)
+      if cache is not None:
+        cache.store(cache_key, auto_dir, pdf_name)
+    except TaskCancelled:
+      raise
     except Exception as e:
       raise Exception("MinerU 转换 PDF 失败") from e
 
@@ -142,23 +378,25 @@ class Executor:
       self.pdf_name = os.path.splitext(os.path.basename(self.input_pdf_path))[0]
       self.md_path = os.path.join(self.temp_dir, self.pdf_name, "auto", f"{self.pdf_name}.md")
       self.images_dir = os.path.join(self.temp_dir, self.pdf_name, "auto", "images")
+      # 需要翻译时转换阶段只产出中间结果，由翻译阶段生成最终结果
+      self.result_name = self.converted_name if self.target_lang else f"{self.pdf_name}.zip"
+      self.result_ttl = STORAGE_INTERMEDIATE_TTL if self.target_lang or self.shard else STORAGE_RESULT_TTL
       assert os.path.exists(self.md_path), "PDF 生成的 Markdown 文件不存在"
     except Exception as e:
       raise Exception("PDF 转换失败")
 
   def step5(self):
-    """创建用于打包的输出目录"""
+    """收集需要打包的文件，直接引用 magic-pdf 的输出，不再复制到单独的输出目录"""
     try:
-      # 创建 output 目录
-      self.output_dir = os.path.join(self.temp_dir, "output")
-      os.makedirs(self.output_dir, exist_ok=True)
-      # 复制原文 markdown
-      shutil.copy2(self.md_path, os.path.join(self.output_dir, f"{self.pdf_name}_original.md"))
-      # 复制图片
+      self.entries = [(f"{self.title}_original.md", self.md_path)]
       if os.path.exists(self.images_dir):
-        shutil.copytree(self.images_dir, os.path.join(self.output_dir, "images"))
+        for root, _, files in os.walk(self.images_dir):
+          for name in sorted(files):
+            path = os.path.join(root, name)
+            arcname = os.path.relpath(path, self.images_dir).replace(os.sep, '/')
+            self.entries.append((f"images/{arcname}", path))
     except Exception as e:
-      raise Exception("创建 output 目录失败") from e
+      raise Exception("收集打包文件失败") from e
 
   def step6(self, tracker):
     """翻译 markdown"""
@@ -166,41 +404,157 @@ class Executor:
       # 读取 markdown 内容
       with open(self.md_path, 'r', encoding='utf-8') as f:
         md_content = f.read()
-      # 翻译 markdown 内容
-      translated_content = translate_text(md_content, self.target_lang, tracker)
+      # 翻译 markdown 内容，同一提交者的同名文档沿用上一版本的译文
+      document = SectionStore.document_id(self.title, self.submitter) if self.submitter else None
+      translated_content = translate_text(
+        md_content, self.target_lang, tracker, self.checkpoint, self.metrics, document, self.force,
+        self.cancelled
+      )
       if translated_content is None:
         return
-      # 保存翻译后的 markdown
-      output_md = os.path.join(self.output_dir, f"{self.pdf_name}_translated.md")
-      with open(output_md, 'w', encoding='utf-8') as f:
+      # 保存翻译后的 markdown，同时翻译为多种语言时文件名带上语言
+      suffix = f"_{self.target_lang}" if self.root_id is not None else ""
+      self.translated_md_path = os.path.join(self.temp_dir, f"{self.title}_translated{suffix}.md")
+      with open(self.translated_md_path, 'w', encoding='utf-8') as f:
         f.write(translated_content)
+      self.entries.append((os.path.basename(self.translated_md_path), self.translated_md_path))
     except Exception as e:
       raise Exception("翻译失败") from e
 
   def step7(self):
-    """打包 zip"""
+    """打包 zip，边打包边分块写入 Redis，不在本地生成 zip 文件"""
     try:
-      self.zip_path = os.path.join(self.temp_dir, f"{self.pdf_name}.zip")
-      shutil.make_archive(
-        os.path.join(self.temp_dir, self.pdf_name),
-        'zip',
-        self.output_dir
-      )
+      with blob_store.open_writer(self.result_name, self.result_ttl) as writer:
+        counting = CountingWriter(writer)
+        write_zip(counting, self.entries)
+      self.metrics.transfer('upload', counting.bytes)
+    except Exception as e:
+      raise Exception("打包上传 zip 文件失败") from e
+
+  def step9(self):
+    """翻译阶段: 下载转换阶段产出的 zip，其中的文件打包时直接从该 zip 中复制"""
+    try:
+      self.pdf_name = os.path.splitext(self.filename)[0]
+      self.result_name = f"{self.pdf_name}.zip"
+      self.result_ttl = STORAGE_RESULT_TTL
+      converted_zip = os.path.join(self.temp_dir, self.converted_name)
+      blob_store.get_file(self.converted_name, converted_zip)
+      self.metrics.transfer('download', os.path.getsize(converted_zip))
+      self.converted_zip = zipfile.ZipFile(converted_zip)
+      # 转换阶段以上传时的文件名命名 markdown，翻译阶段沿用同样的命名
+      original = next(name for name in self.converted_zip.namelist() if name.endswith("_original.md") and '/' not in name)
+      self.title = original[:-len("_original.md")]
+      # 只解压需要翻译的 markdown
+      self.md_path = self.converted_zip.extract(original, self.temp_dir)
+      self.entries = [
+        (info.filename, (self.converted_zip, info))
+        for info in self.converted_zip.infolist() if not info.is_dir()
+      ]
+    except Exception as e:
+      raise Exception("获取 PDF 转换结果失败") from e
+
+  def step10(self):
+    """按页把大 PDF 拆分为多个分片并上传，拆分出的分片文件名保存在 self.shard_names 中，不拆分时为空"""
+    try:
+      self.shard_names = []
+      self.pdf_name = os.path.splitext(self.filename)[0]
+      if not SHARDING_ENABLED:
+        return
+      # 已有转换结果 (断点或缓存) 时不需要拆分
+      if os.path.exists(os.path.join(self.temp_dir, self.pdf_name, "auto", f"{self.pdf_name}.md")):
+        return
+      if mineru_cache is not None and mineru_cache.contains(mineru_cache.make_key(self.pdf_hash)):
+        return
+      with fitz.open(self.input_pdf_path) as doc:
+        if doc.page_count <= SHARD_MIN_PAGES:
+          return
+        for i, start in enumerate(range(0, doc.page_count, SHARD_PAGES)):
+          shard_name = f"{self.pdf_name}.shard{i}.pdf"
+          shard_path = os.path.join(self.temp_dir, shard_name)
+          with fitz.open() as shard:
+            shard.insert_pdf(doc, from_page=start, to_page=min(start + SHARD_PAGES, doc.page_count) - 1)
+            shard.save(shard_path)
+          blob_store.put_file(shard_name, shard_path, STORAGE_INTERMEDIATE_TTL)
+          self.metrics.transfer('upload', os.path.getsize(shard_path))
+          self.shard_names.append(shard_name)
+    except Exception as e:
+      raise Exception("拆分 PDF 失败") from e
+
+  def step11(self):
+    """下载各分片的转换结果，合并为 magic-pdf 的输出目录结构，图片加上分片前缀避免重名"""
+    try:
+      self.input_pdf_path = os.path.join(self.temp_dir, self.filename)
+      pdf_name = os.path.splitext(self.filename)[0]
+      auto_dir = os.path.join(self.temp_dir, pdf_name, "auto")
+      images_dir = os.path.join(auto_dir, "images")
+      os.makedirs(images_dir, exist_ok=True)
+      parts = []
+      for i, shard_result in enumerate(self.shard_names):
+        zip_path = os.path.join(self.temp_dir, shard_result)
+        blob_store.get_file(shard_result, zip_path)
+        self.metrics.transfer('download', os.path.getsize(zip_path))
+        images = set()
+        with zipfile.ZipFile(zip_path) as zf:
+          md = zf.read(f"{os.path.splitext(shard_result)[0]}_original.md").decode('utf-8')
+          for info in zf.infolist():
+            if info.is_dir() or not info.filename.startswith("images/"):
+              continue
+            image = info.filename[len("images/"):]
+            with zf.open(info) as src, open(os.path.join(images_dir, f"s{i}_{image}"), 'wb') as dst:
+              shutil.copyfileobj(src, dst)
+            images.add(image)
+        # 一次替换所有引用，只改写本分片中存在的图片，已改写的路径不会被再次匹配
+        parts.append(IMAGE_LINK_PATTERN.sub(
+          lambda m: f"images/s{i}_{m.group(1)}" if m.group(1) in images else m.group(0), md
+        ))
+        os.remove(zip_path)
+        blob_store.delete(shard_result)
+      with open(os.path.join(auto_dir, f"{pdf_name}.md"), 'w', encoding='utf-8') as f:
+        f.write('\n\n'.join(parts))
+      if mineru_cache is not None:
+        mineru_cache.store(mineru_cache.make_key(self.pdf_hash), auto_dir, pdf_name)
+    except Exception as e:
+      raise Exception("合并 PDF 分片失败") from e
+
+  def step12(self):
+    """多语言翻译的子任务: 上传本语言的译文，由打包任务汇总"""
+    try:
+      blob_store.put_file(self.translation_name(self.target_lang), self.translated_md_path, STORAGE_INTERMEDIATE_TTL)
     except Exception as e:
-      raise Exception("打包 zip 失败") from e
+      raise Exception("上传译文失败") from e
 
-  def step8(self):
-    """通过 redis 传输 zip 文件"""
+  def step13(self):
+    """多语言翻译的打包任务: 下载各语言的译文，和转换结果一起打包"""
     try:
-      with open(self.zip_path, "rb") as f:
-        file_data = f.read()
-      r.set(f"file:{self.pdf_name}.zip", file_data)
+      for lang in self.target_lang:
+        path = os.path.join(self.temp_dir, f"{self.title}_translated_{lang}.md")
+        blob_store.get_file(self.translation_name(lang), path)
+        self.metrics.transfer('download', os.path.getsize(path))
+        self.entries.append((os.path.basename(path), path))
     except Exception as e:
-      raise Exception("上传 zip 文件到 Redis 失败") from e
+      raise Exception("获取译文失败") from e
+
+  def translation_name(self, lang: str) -> str:
+    """多语言翻译时各语言译文的中间结果文件名"""
+    return f"{os.path.splitext(self.filename)[0]}.translated_{lang}.md"
 
-  def clean_up(self):
-    """根据配置决定是否清理临时文件"""
-    if CLEAN_UP_TEMP:
+  @property
+  def converted_name(self):
+    """转换阶段交给翻译阶段的中间结果文件名"""
+    return f"{os.path.splitext(self.filename)[0]}.converted.zip"
+
+  def clean_up(self, remove_temp: bool = CLEAN_UP_TEMP):
+    """删除断点信息，并根据配置决定是否清理临时文件
+    Args:
+      remove_temp: 是否删除临时目录，任务被取消时不论配置如何都删除
+    """
+    if getattr(self, 'converted_zip', None) is not None:
+      self.converted_zip.close()
+    try:
+      self.checkpoint.clear()
+    except Exception as e:
+      print(f"清理断点信息失败: {str(e)}")
+    if remove_temp and getattr(self, 'temp_dir', None) is not None:
       try:
         shutil.rmtree(self.temp_dir)
       except Exception as e: